@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+"""Renders a large audits response with and without streaming.
+
+The peak memory doesn't include the response body, because it is
+generated up front (when streaming, only one chunk at a time is needed).
+Run it from the repository root: python3 -m benchmarks.audit_stream [COUNT]"""
+
+from metecli.connection.json_stream import iter_members
+from metecli.connection.models import AuditInfo, AuditStream
+from metecli.table import StreamingTable
+
+from time import perf_counter
+from typing import Any, Iterator
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+COUNT = 500000
+CHUNK_SIZE = 64 * 1024
+
+
+def make_body(count: int) -> str:
+    return json.dumps({
+        "sum": -150 * count,
+        "payments_sum": -150 * count,
+        "deposits_sum": 0,
+        "audits": [
+            {
+                "id": i,
+                "created_at": "2024-01-{:02d}T10:00:00.000Z".format(i % 28 + 1),
+                "difference": -150,
+                "product": i % 10 if i % 7 else None,
+            }
+            for i in range(count)
+        ],
+    })
+
+
+def chunks(body: str) -> Iterator[str]:
+    for i in range(0, len(body), CHUNK_SIZE):
+        yield body[i:i + CHUNK_SIZE]
+
+
+def render(audits: Any) -> None:
+    with open(os.devnull, "wt") as out:
+        StreamingTable(("time", "drink", "difference")).write(
+            (
+                (audit.created_at, audit.drink, audit.difference)
+                for audit in audits.audits
+            ),
+            out,
+        )
+
+
+def buffered(body: str) -> None:
+    render(AuditInfo.from_v2(json.loads("".join(chunks(body)))))
+
+
+def streamed(body: str) -> None:
+    render(AuditStream.from_v2(iter_members(chunks(body), "audits")))
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    body = make_body(count)
+    print("Rendering {} audits ({:.1f} MiB of JSON):".format(
+        count, len(body) / 2 ** 20,
+    ))
+    for name, run in (("buffered", buffered), ("streamed", streamed)):
+        gc.collect()
+        start = perf_counter()
+        run(body)
+        duration = perf_counter() - start
+        # tracing slows everything down, so measure the memory separately
+        gc.collect()
+        tracemalloc.start()
+        run(body)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{:<9} {:>7.2f} s {:>8.1f} MiB peak".format(
+            name, duration, peak / 2 ** 20,
+        ))
+
+
+if __name__ == "__main__":
+    main()
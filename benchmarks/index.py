@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+"""Compares EntityIndex with linear scans over 10k and 100k users.
+
+Run it from the repository root: python3 -m benchmarks.index"""
+
+from metecli.connection.models import User
+from metecli.index import EntityIndex
+
+from timeit import timeit
+import random
+import string
+
+LOOKUPS = 1000
+
+
+def make_users(count: int) -> list:
+    rng = random.Random(count)
+    return [
+        User(
+            id=i, name="".join(rng.choices(string.ascii_letters, k=12)),
+            email=None, balance=0.0, active=True, audit=False, redirect=True,
+        )
+        for i in range(count)
+    ]
+
+
+def linear_find_by_id(users: list, uid: int):
+    for user in users:
+        if user.id == uid:
+            return user
+    return None
+
+
+def linear_search(users: list, search_for: str) -> list:
+    return [
+        user for user in users
+        if search_for.casefold() in user.name.casefold()
+    ]
+
+
+def bench(count: int) -> None:
+    users = make_users(count)
+    rng = random.Random(0)
+    ids = [rng.randrange(count) for _ in range(LOOKUPS)]
+    queries = [rng.choice(users).name[3:8] for _ in range(LOOKUPS)]
+    build = timeit(lambda: EntityIndex(users), number=1)
+    index = EntityIndex(users)
+    rows = [
+        ("find_by_id", lambda: [linear_find_by_id(users, i) for i in ids],
+            lambda: [index.find_by_id(i) for i in ids]),
+        ("search", lambda: [linear_search(users, q) for q in queries],
+            lambda: [index.search(q, k=10) for q in queries]),
+    ]
+    print("{} entities (building the index: {:.3f} s)".format(count, build))
+    for name, linear, indexed in rows:
+        linear_time = timeit(linear, number=1)
+        indexed_time = timeit(indexed, number=1)
+        print("  {:<10} {} lookups: linear {:.3f} s, index {:.4f} s".format(
+            name, LOOKUPS, linear_time, indexed_time,
+        ))
+
+
+if __name__ == "__main__":
+    for count in (10000, 100000):
+        bench(count)
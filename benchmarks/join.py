@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+"""Joins audits with drinks, the way 'audits' used to and with DrinkJoin.
+
+The time per audit should stay the same however many audits there are.
+Run it from the repository root: python3 -m benchmarks.join [DRINKS]"""
+
+from metecli.connection.models import Audit, Drink
+from metecli.join import DrinkJoin
+
+from time import perf_counter
+from typing import Iterator, List, Optional, Tuple
+import sys
+
+COUNTS = (10000, 100000, 1000000)
+DRINKS = 50
+
+
+def find_by_id(things: List[Drink], id: int) -> Optional[Drink]:
+    """How drinks used to be looked up (for every audit)."""
+    return next((thing for thing in things if thing.id == id), None)
+
+
+def old_join(
+    audits: List[Audit], drinks: List[Drink],
+) -> Iterator[Tuple[str, str, float]]:
+    for audit in audits:
+        drink = None
+        if audit.drink:
+            drink = find_by_id(drinks, audit.drink)
+        if not drink:
+            drink = Drink(name="n/a")
+        yield (audit.created_at, drink.name, audit.difference)
+
+
+def new_join(
+    audits: List[Audit], drinks: List[Drink],
+) -> Iterator[Tuple[str, str, float]]:
+    for row in DrinkJoin(drinks).join(audits):
+        yield (row.created_at, row.drink_name, row.difference)
+
+
+def main() -> None:
+    drink_count = int(sys.argv[1]) if len(sys.argv) > 1 else DRINKS
+    drinks = [Drink(id=i, name="drink {}".format(i)) for i in range(drink_count)]
+    print("Joining audits with {} drinks:".format(drink_count))
+    for count in COUNTS:
+        # some audits have no drink and some have one that doesn't exist
+        audits = [
+            Audit(i, "2024-01-13T10:00:00.000Z", -1.5,
+                  i % (drink_count + 5) if i % 7 else None)
+            for i in range(count)
+        ]
+        for name, join in (("old", old_join), ("join", new_join)):
+            start = perf_counter()
+            for _ in join(audits, drinks):
+                pass
+            duration = perf_counter() - start
+            print("{:>8} audits {:<5} {:>7.3f} s {:>7.3f} µs/audit".format(
+                count, name, duration, duration / count * 1e6,
+            ))
+
+
+if __name__ == "__main__":
+    main()
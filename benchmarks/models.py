@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+"""Decodes 1M audits per API dialect and reports time and memory.
+
+The slotted models are compared with the previous dict-based ones
+and with the columnar AuditColumns.
+Run it from the repository root: python3 -m benchmarks.models [COUNT]"""
+
+from metecli.connection.models import Audit, AuditColumns
+
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+import gc
+import sys
+import tracemalloc
+
+COUNT = 1000000
+
+
+class DictAudit:
+    """How Audit used to look like."""
+    def __init__(self, **kwargs):
+        vars(self).update(kwargs)
+    
+    @classmethod
+    def from_v1(cls, data: Dict[str, Any]) -> 'DictAudit':
+        return cls(
+            id=int(data["id"]),
+            created_at=str(data["created_at"]),
+            difference=float(data["difference"]),
+            drink=int(data["drink"]) if data["drink"] is not None else None,
+        )
+    
+    @classmethod
+    def from_v2(cls, data: Dict[str, Any]) -> 'DictAudit':
+        return cls(
+            id=int(data["id"]),
+            created_at=str(data["created_at"]),
+            difference=int(data["difference"]) / 100,
+            drink=int(data["product"]) if data["product"] is not None else None,
+        )
+
+
+def make_audits(count: int, dialect: str) -> List[Dict[str, Any]]:
+    drink_key = "drink" if dialect == "v1" else "product"
+    return [
+        {
+            "id": i,
+            "created_at": "2024-01-{:02d}T10:00:00.000Z".format(i % 28 + 1),
+            "difference": -1.5 if dialect == "v1" else -150,
+            drink_key: i % 10 if i % 7 else None,
+        }
+        for i in range(count)
+    ]
+
+
+def map_list(decode: Callable[[Dict[str, Any]], Any], data: list) -> list:
+    return list(map(decode, data))
+
+
+def measure(decode: Callable[[list], Any], data: list) -> tuple:
+    """Get the time and the memory it takes to decode all audits."""
+    gc.collect()
+    start = perf_counter()
+    decoded = decode(data)
+    duration = perf_counter() - start
+    del decoded
+    # tracing slows everything down, so measure the memory separately
+    gc.collect()
+    tracemalloc.start()
+    decoded = decode(data)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+    return duration, memory
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    print("Decoding {} audits:".format(count))
+    for dialect in ("v1", "v2"):
+        data = make_audits(count, dialect)
+        decoders = [
+            ("dict", partial(map_list, getattr(DictAudit, "from_" + dialect))),
+            ("slots", partial(map_list, getattr(Audit, "from_" + dialect))),
+            ("columns", getattr(AuditColumns, "from_" + dialect)),
+        ]
+        for name, decode in decoders:
+            duration, memory = measure(decode, data)
+            print("{} {:<7} {:>7.2f} s {:>10.0f} audits/s {:>8.1f} MiB".format(
+                dialect, name, duration, count / duration, memory / 2 ** 20,
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+"""Checks that cheap commands start fast and don't load heavy modules.
+
+Run it from the repository root: python3 -m benchmarks.startup
+It exits with 1 if the budget is exceeded, so it can be used in CI."""
+
+from typing import List, Tuple
+
+import os
+import subprocess
+import sys
+import tempfile
+
+# total import time of metecli in microseconds
+BUDGET = 150000
+RUNS = 5
+
+# the commands and the modules they mustn't import (besides FORBIDDEN)
+COMMANDS = [
+    (["version"], ("yaml",)),
+    (["--help"], ("yaml",)),
+    (["config", "get", "version"], ()),
+]
+
+# these must not be imported for any of the commands above
+FORBIDDEN = ("requests", "tabulate", "interrogatio")
+
+
+def import_times(args: List[str], config_path: str) -> List[Tuple[str, int]]:
+    """Run metecli with -X importtime and get the top-level imports.
+
+    Returns (name, cumulative time) for everything imported by metecli."""
+    env = dict(os.environ, METECLI_NO_DAEMON="1")
+    result = subprocess.run(
+        [
+            sys.executable, "-X", "importtime", "-m", "metecli.main",
+            "--config_path", config_path,
+        ] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        env=env, universal_newlines=True, check=True,
+    )
+    times = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            # the header
+            continue
+        times.append((name, int(cumulative)))
+    # skip the interpreter's own startup
+    for i, (name, _) in enumerate(times):
+        if name.strip() == "metecli":
+            times = times[i:]
+            break
+    return times
+
+
+def measure(
+    args: List[str], config_path: str, forbidden: Tuple[str, ...],
+) -> Tuple[int, List[str]]:
+    """Get the best total import time and the forbidden modules loaded."""
+    best = None
+    for _ in range(RUNS):
+        times = import_times(args, config_path)
+        # nested imports are already included in the cumulative times
+        total = sum(
+            cumulative for name, cumulative in times
+            if not name.startswith("  ")
+        )
+        if best is None or total < best:
+            best = total
+    loaded = set(
+        name.strip().split(".")[0] for name, _ in times
+    ).intersection(FORBIDDEN + forbidden)
+    return best, sorted(loaded)
+
+
+def main() -> int:
+    failed = False
+    with tempfile.TemporaryDirectory() as config_path:
+        for args, forbidden in COMMANDS:
+            total, loaded = measure(args, config_path, forbidden)
+            print("{:<20} {:>8.1f} ms (budget: {:.1f} ms){}".format(
+                " ".join(args), total / 1000, BUDGET / 1000,
+                ", loads: {}".format(", ".join(loaded)) if loaded else "",
+            ))
+            if total > BUDGET or loaded:
+                failed = True
+    if failed:
+        print("The startup budget has been exceeded.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,8 @@
 from .config import Config
 from .connection.connection import Connection
 from .connection.models import Drink, User
+from .journal import Journal, QUEUED, SENT, update_ledger
+from .ledger import Ledger, credit_limit, exceeds_credit_limit
 from . import audits
 from .utils import (
     fuzzy_search, true_false_to_yes_no, show_edit, find_by_id, print_table, yn,
@@ -8,7 +10,8 @@ from .utils import (
 )
 
 from datetime import date
-from typing import List, Optional
+from functools import partial
+from typing import Any, Dict, List, Optional
 import argparse
 import logging
 log = logging.getLogger(__name__)
@@ -22,11 +25,11 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser_create = subparsers.add_parser(
         "create", help="creates a new account",
     )
-    parser_create.set_defaults(func=create)
+    parser_create.set_defaults(func=create, interactive=True)
     parser_select = subparsers.add_parser(
         "select", help="select the account to use",
     )
-    parser_select.set_defaults(func=select)
+    parser_select.set_defaults(func=select, interactive=True)
     parser_show = subparsers.add_parser(
         "show", help="display some information",
     )
@@ -38,6 +41,7 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     )
     parser_modify.set_defaults(
         func=lambda args, config: Account(config).modify(args),
+        interactive=True,
     )
     parser_delete = subparsers.add_parser(
         "delete", help="deletes your account",
@@ -47,6 +51,7 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     )
     parser_delete.set_defaults(
         func=lambda args, config: Account(config).delete(args),
+        interactive=True,
     )
     parser_buy = subparsers.add_parser("buy", help="buys a drink")
     parser_buy.add_argument("drink", type=str, help="the drink to buy")
@@ -145,7 +150,7 @@ def create(args: argparse.Namespace, config: Config) -> None:
 
 def get_uid(conn: Connection) -> int:
     log.info("Loading all users...")
-    users = conn.users()
+    users = conn.users_index()
     while True:
         found = False
         given = input(
@@ -153,17 +158,16 @@ def get_uid(conn: Connection) -> int:
         )
         if given.isdecimal():
             uid = int(given)
-            if find_by_id(users, uid):
+            if users.find_by_id(uid):
                 found = True
         else:
-            for user in users:
-                if given.casefold() in user.name.casefold():
-                    if yn("Is '{}' ({}) your account?".format(
-                        user.name, user.email,
-                    )):
-                        uid = user.id
-                        found = True
-                        break
+            for user in users.search(given):
+                if yn("Is '{}' ({}) your account?".format(
+                    user.name, user.email,
+                )):
+                    uid = user.id
+                    found = True
+                    break
         if found:
             return uid
         else:
@@ -185,6 +189,8 @@ class Account():
         if not self._conf["account"]["uid"]:
             raise Exception("User account is not configured yet. Account management isn't possible.")
         self._uid = self._conf["account"]["uid"]
+        self._ledger = Ledger.for_config(config)
+        self._journal = Journal.for_config(config)
         self._check_wrapped()
     
     def _check_wrapped(self) -> None:
@@ -198,6 +204,7 @@ class Account():
             return
         # get the account to check whether audit is enabled
         user = self._conn.get_user(self._uid)
+        self._ledger.confirm(user)
         if not user.audit:
            return 
         # check whether the feature is available
@@ -210,6 +217,7 @@ class Account():
     def show(self, args: argparse.Namespace) -> None:
         """Displays information about this user."""
         data = self._conn.get_user(self._uid)
+        self._ledger.confirm(data)
         self._print_user(data)
     
     def _print_user(self, user: User) -> None:
@@ -230,6 +238,7 @@ class Account():
     def modify(self, args: argparse.Namespace) -> None:
         """Modify settings."""
         data = self._conn.get_user(self._uid)
+        self._ledger.confirm(data)
         log.debug("Editing account. Old data: %s", data)
         edit_user(data)
         log.info("Editing account. New data: %s", data)
@@ -237,53 +246,121 @@ class Account():
     
     def logs(self, args: argparse.Namespace) -> None:
         """The same as `audits --user <this user>`."""
-        audits.show(self._conf, self._conn, user=str(self._uid))
+        audits.show(self._conf, self._conn, user=self._uid)
     
     def buy(self, args: argparse.Namespace) -> None:
-        drink_found = fuzzy_search(self._conn.drinks(), args.drink)
+        drink_found = fuzzy_search(self._conn.drinks_index(), args.drink)
         if drink_found:
             self._buy(drink_found)
     
     def buy_barcode(self, args: argparse.Namespace) -> None:
-        barcodes = self._conn.barcodes()
-        drinks = self._conn.drinks()
-        barcode = find_by_id(barcodes, args.barcode)
-        if not barcode:
+        if not self._conn.supports("barcodes"):
+            print("This server doesn't support barcodes.")
+            return
+        drink_id = self._conn.drink_for_barcode(args.barcode)
+        if drink_id is None:
             print("Couldn't find a drink with this barcode.")
             return
-        drink = find_by_id(drinks, barcode.drink)
+        drink = find_by_id(self._conn.drinks_index(), drink_id)
         if not drink:
             print("Couldn't find a drink with this barcode.")
             return
         self._buy(drink)
     
+    def _within_credit_limit(self, drink: Drink) -> bool:
+        """Check whether buying this would exceed the credit limit."""
+        limit = credit_limit(self._conn)
+        if limit is None:
+            return True
+        balance = self._ledger.balance(self._uid)
+        if balance is None or balance - drink.price < -limit:
+            # check the actual balance before rejecting it
+            self._ledger.reconcile(self._conn, self._uid)
+            balance = self._ledger.balance(self._uid)
+        if balance is not None:
+            # (purchases that couldn't be sent yet count, too)
+            balance += self._journal.queued_change(self._uid)
+        if exceeds_credit_limit(balance, drink.price, limit):
+            print(
+                "Buying {} ({:.2f}) would exceed the credit limit of {:.2f} "
+                "(your balance is {:.2f}).".format(
+                    drink.name, drink.price, limit, balance,
+                )
+            )
+            return False
+        return True
+    
+    def _submit(
+        self, op: str, changes: Dict[int, float], **args: Any,
+    ) -> bool:
+        """Send a write (or queue it if the server can't be reached).
+        
+        Returns whether it has been sent."""
+        result = self._journal.submit(
+            self._conn, op, args, changes,
+            on_sent=partial(update_ledger, self._ledger),
+        )
+        if result == SENT:
+            return True
+        if result == QUEUED:
+            print(
+                "The server can't be reached. This has been queued, "
+                "run 'metecli flush' to send it later."
+            )
+        else:
+            print(
+                "It's not clear whether this worked. Please check your "
+                "balance and see 'metecli flush --list'."
+            )
+        return False
+    
     def _buy(self, drink: Drink) -> None:
+        if not self._within_credit_limit(drink):
+            return
         log.info("Buying %s...", drink.name)
-        self._conn.buy(self._uid, drink.id)
-        data = self._conn.get_user(self._uid)
+        if not self._submit(
+            "buy", {self._uid: -drink.price}, uid=self._uid, did=drink.id,
+        ):
+            return
+        balance = self._ledger.balance(self._uid)
+        if balance is None:
+            # nothing was known about this account yet
+            self._ledger.reconcile(self._conn, self._uid)
+            balance = self._ledger.balance(self._uid)
+        else:
+            # (the user doesn't have to wait for this)
+            self._ledger.reconcile(self._conn, self._uid, background=True)
         log.info("Success! You bought {} and your new balance is {}.".format(
-            drink.name, data.balance
+            drink.name, balance
         ))
-        if data.balance < 0:
+        if balance is not None and balance < 0:
             log.warn("Your balance is below zero. Remember to compensate as soon as possible.")
-        if data.audit:
+        if self._ledger.audit(self._uid):
             log.info("This transaction has been logged, because you set up your account that way.")
     
     def pay(self, args: argparse.Namespace) -> None:
         log.info("Paying %f...", args.amount)
-        self._conn.pay(self._uid, args.amount)
+        self._submit(
+            "pay", {self._uid: -args.amount}, uid=self._uid, amount=args.amount,
+        )
     
     def deposit(self, args: argparse.Namespace) -> None:
         log.info("Depositing %f...", args.amount)
-        self._conn.deposit(self._uid, args.amount)
+        self._submit(
+            "deposit", {self._uid: args.amount},
+            uid=self._uid, amount=args.amount,
+        )
     
     def transfer(self, args: argparse.Namespace) -> None:
-        receiver_found = fuzzy_search(self._conn.users(), args.receiver)
+        receiver_found = fuzzy_search(self._conn.users_index(), args.receiver)
         if not receiver_found:
             print("Couldn't find a receiver with this name.")
             return
         log.info("Transferring %f to %s...", args.amount, receiver_found.name)
-        self._conn.transfer(self._uid, receiver_found.id, args.amount)
+        self._submit(
+            "transfer", {self._uid: -args.amount, receiver_found.id: args.amount},
+            sender=self._uid, receiver=receiver_found.id, amount=args.amount,
+        )
     
     def delete(self, args: argparse.Namespace) -> None:
         user = self._conn.get_user(self._uid)
@@ -1,15 +1,37 @@
-from .utils import fuzzy_search, find_by_id, print_table, connect
+from .utils import fuzzy_search, print_table, connect
 from .config import Config
-from .connection.models import AuditInfo, Drink
-from .connection.connection import Connection
+from .connection.models import (
+    AuditColumns, AuditInfo, AuditStream, Drink, User,
+)
+from . import export
+from .connection.models.audit_columns import NO_DRINK
+from .connection.connection import Connection, DEFAULT_PARALLEL, SHARDS
+from .connection.async_connection import AsyncConnection
+from .index import EntityIndex
+from .follow import AuditFollower
+from .join import DrinkJoin, JoinedAudit, NA_DRINK
+from .table import StreamingTable
+from .mirror import AuditMirror
 
-from datetime import date, datetime
-from typing import Any, List, Tuple, Dict, Iterator, Optional
+from array import array
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import (
+    Any, List, NamedTuple, Tuple, Dict, Iterable, Iterator, Optional,
+    Sequence, Union,
+)
 import argparse
+import asyncio
 
 import logging
 log = logging.getLogger(__name__)
 
+# what 'audits stats' can summarize by
+GROUP_BY = ("drink", "user", "day", "week", "month", "hour")
+EPOCH_DATE = date(1970, 1, 1)
+TABLE_HEADERS = ("time", "drink", "difference")
+USER_TABLE_HEADERS = ("user",) + TABLE_HEADERS
+
 
 def valid_date(value: str) -> date: # taken from https://stackoverflow.com/a/25470943/2192464
     try:
@@ -24,6 +46,10 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser.add_argument(
         "--user", type=str, help="show only audits for the user USER",
     )
+    parser.add_argument(
+        "--all_users", "--all-users", action="store_true",
+        help="show the audits of every user (tagged with the user)",
+    )
     parser.add_argument(
         "--from_date", type=valid_date,
         help="show only audits that were created after this date",
@@ -32,53 +58,459 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
         "--to_date", type=valid_date,
         help="show only audits that were created before this date",
     )
+    parser.add_argument(
+        "--shard", choices=SHARDS,
+        help="fetch the range in parts of this size (needs --from_date)",
+    )
+    parser.add_argument(
+        "--parallel", type=int, default=DEFAULT_PARALLEL,
+        help="how many parts to fetch at the same time (default: {})".format(
+            DEFAULT_PARALLEL,
+        ),
+    )
+    parser.add_argument(
+        "--follow", action="store_true",
+        help="keep showing new audits as they appear",
+    )
+    export.add_arguments(parser)
     parser.set_defaults(func=do)
+    subparsers = parser.add_subparsers(help="action")
+    parser_stats = subparsers.add_parser(
+        "stats", help="summarize the audits",
+    )
+    parser_stats.add_argument(
+        "--group_by", "--group-by", choices=GROUP_BY, default="drink",
+        help="what to summarize by (default: drink)",
+    )
+    # These may be given before or after 'stats'.
+    # (SUPPRESS keeps the values given before.)
+    parser_stats.add_argument(
+        "--user", type=str, default=argparse.SUPPRESS,
+        help="show only audits for the user USER",
+    )
+    parser_stats.add_argument(
+        "--all_users", "--all-users", action="store_true",
+        default=argparse.SUPPRESS,
+        help="summarize the audits of every user",
+    )
+    parser_stats.add_argument(
+        "--from_date", type=valid_date, default=argparse.SUPPRESS,
+        help="show only audits that were created after this date",
+    )
+    parser_stats.add_argument(
+        "--to_date", type=valid_date, default=argparse.SUPPRESS,
+        help="show only audits that were created before this date",
+    )
+    parser_stats.add_argument(
+        "--shard", choices=SHARDS, default=argparse.SUPPRESS,
+        help="fetch the range in parts of this size (needs --from_date)",
+    )
+    parser_stats.add_argument(
+        "--parallel", type=int, default=argparse.SUPPRESS,
+        help="how many parts to fetch at the same time",
+    )
+    parser_stats.set_defaults(func=do_stats)
 
 
 def do(args: argparse.Namespace, config: Config) -> None:
+    if args.user and args.all_users:
+        print("Please pass either --user or --all_users.")
+        return
     conn = connect(config)
+    if args.follow:
+        if args.all_users or args.shard or args.to_date:
+            print(
+                "--follow can't be combined with --all_users, --shard "
+                "or --to_date."
+            )
+            return
+        try:
+            follow(
+                config, conn, user=args.user, from_date=args.from_date,
+                format=args.format, output=args.output,
+            )
+        except KeyboardInterrupt:
+            pass
+        return
     show(
         config, conn, user=args.user, from_date=args.from_date,
-        to_date=args.to_date,
+        to_date=args.to_date, format=args.format, output=args.output,
+        shard=args.shard, parallel=args.parallel, all_users=args.all_users,
     )
 
 
 def _create_table(
-    audits: AuditInfo, drinks: List[Drink]
+    rows: Iterable[JoinedAudit],
 ) -> Iterator[Tuple[str, str, float]]:
-    for audit in audits.audits:
-        drink = None
-        if audit.drink:
-            drink = find_by_id(drinks, audit.drink)
-        if not drink:
-            drink = Drink(name= "n/a")
-        yield (audit.created_at, drink.name, audit.difference)
+    for row in rows:
+        yield (row.created_at, row.drink_name, row.difference)
 
 
-def show(
-    config: Config, conn: Connection, user: Optional[str] = None,
-    from_date: Optional[date] = None, to_date: Optional[date] = None,
-) -> None:
+class UserAudit(NamedTuple):
+    """An audit tagged with the user it belongs to (for exporting)."""
+    user: int
+    id: int
+    created_at: str
+    difference: float
+    drink: Optional[int]
+    drink_name: str
+
+
+def _create_user_table(
+    rows: Iterable[UserAudit], names: Dict[int, str],
+) -> Iterator[Tuple[str, str, str, float]]:
+    for row in rows:
+        yield (names[row.user], row.created_at, row.drink_name, row.difference)
+
+
+def _user_audits(
+    results: List[Tuple[User, AuditInfo]], join: DrinkJoin,
+) -> Iterator[UserAudit]:
+    for user, audits in results:
+        for row in join.join(audits.audits):
+            yield UserAudit(user.id, *row)
+
+
+async def _fetch_user_audits(
+    conn: AsyncConnection, params: Dict[str, Any],
+    mirror: Optional[AuditMirror] = None, stream: bool = False,
+) -> Union[AuditInfo, AuditStream]:
+    """Fetch the audits (of params["user"], if it's set).
+    
+    If the user has been synced into the mirror, only the new audits
+    are fetched and the rest comes from the mirror."""
+    uid = params.get("user")
+    if mirror and uid is not None and mirror.synced_at(uid) is not None:
+        if not mirror.covers(uid, params.get("to_date")):
+            await mirror.sync_async(conn, uid)
+        return mirror.audits(
+            uid, params.get("from_date"), params.get("to_date"),
+        )
+    return await conn.audits(stream=stream, **params)
+
+
+async def _fetch(
+    conn: AsyncConnection, user: Optional[Union[str, int]],
+    params: Dict[str, Any], mirror: Optional[AuditMirror] = None,
+    stream: bool = False,
+) -> Tuple[Optional[Union[AuditInfo, AuditStream]], List[Drink]]:
+    """Fetch the audits (and the user they belong to) and the drinks concurrently."""
+    async def fetch_audits() -> Optional[Union[AuditInfo, AuditStream]]:
+        if isinstance(user, int):
+            # this already is an uid
+            params["user"] = user
+        elif user:
+            user_found = fuzzy_search(EntityIndex(await conn.users()), user)
+            if user_found:
+                params["user"] = user_found.id
+            else:
+                return None
+        return await _fetch_user_audits(conn, params, mirror, stream)
+    
+    audits, drinks = await asyncio.gather(fetch_audits(), conn.drinks())
+    return audits, drinks
+
+
+async def _fetch_all_users(
+    conn: AsyncConnection, params: Dict[str, Any],
+    mirror: Optional[AuditMirror] = None, parallel: int = DEFAULT_PARALLEL,
+) -> Tuple[List[Tuple[User, AuditInfo]], List[Drink]]:
+    """Fetch the users and the drinks and then the audits of every user
+    (at most parallel at a time)."""
+    limit = asyncio.Semaphore(max(parallel, 1))
+    
+    async def fetch_user(user: User) -> AuditInfo:
+        async with limit:
+            return await _fetch_user_audits(
+                conn, dict(params, user=user.id), mirror,
+            )
+    
+    users, drinks = await asyncio.gather(conn.users(), conn.drinks())
+    audits = await asyncio.gather(*(fetch_user(user) for user in users))
+    return list(zip(users, audits)), drinks
+
+
+def _params(
+    from_date: Optional[date], to_date: Optional[date],
+    shard: Optional[str], parallel: int,
+) -> Dict[str, Any]:
     params: Dict[str, Any] = dict()
-    if user:
-        user_found = fuzzy_search(conn.users(), user)
-        if user_found:
-            params["user"] = user_found.id
-        else:
-            return
+    if shard:
+        params["shard"] = shard
+        params["parallel"] = parallel
     if from_date:
         params["from_date"] = from_date
     if to_date:
         params["to_date"] = to_date
     if (from_date or to_date) and not (from_date and to_date):
         log.warn("Either from_date or to_date was given but not the other one. This might fail.")
-    audits = conn.audits(**params)
-    drinks = conn.drinks()
+    return params
+
+
+def fetch(
+    conn: Connection, user: Optional[Union[str, int]] = None,
+    from_date: Optional[date] = None, to_date: Optional[date] = None,
+    mirror: Optional[AuditMirror] = None, stream: bool = False,
+    shard: Optional[str] = None, parallel: int = DEFAULT_PARALLEL,
+) -> Tuple[Optional[Union[AuditInfo, AuditStream]], List[Drink]]:
+    """Get the audits (or None if the user couldn't be found) and the drinks.
+    
+    If stream is set, the audits might be decoded while they're being
+    read; they can only be iterated over once then. If shard is set,
+    the range is fetched in parts."""
+    params = _params(from_date, to_date, shard, parallel)
+    return asyncio.run(_fetch(
+        AsyncConnection.wrap(conn), user, params, mirror, stream,
+    ))
+
+
+def fetch_all_users(
+    conn: Connection, from_date: Optional[date] = None,
+    to_date: Optional[date] = None, mirror: Optional[AuditMirror] = None,
+    shard: Optional[str] = None, parallel: int = DEFAULT_PARALLEL,
+) -> Tuple[List[Tuple[User, AuditInfo]], List[Drink]]:
+    """Get the audits of every user (and the drinks).
+    
+    The users are only fetched once. Their audits are fetched
+    concurrently (at most parallel at a time), so this takes about as long
+    as the slowest user does."""
+    params = _params(from_date, to_date, shard, parallel)
+    return asyncio.run(_fetch_all_users(
+        AsyncConnection.wrap(conn), params, mirror, parallel,
+    ))
+
+
+@contextmanager
+def open_mirror(config: Config) -> Iterator[Optional[AuditMirror]]:
+    """Open the local mirror (if there is one and caching isn't disabled).
+    
+    It's closed again afterwards (the audits it returns don't need it)."""
+    mirror = AuditMirror.open(config) if config.use_cache else None
+    if not mirror:
+        yield None
+        return
+    with mirror:
+        yield mirror
+
+
+def show(
+    config: Config, conn: Connection, user: Optional[Union[str, int]] = None,
+    from_date: Optional[date] = None, to_date: Optional[date] = None,
+    format: str = "table", output: Optional[str] = None,
+    shard: Optional[str] = None, parallel: int = DEFAULT_PARALLEL,
+    all_users: bool = False,
+) -> None:
+    if all_users:
+        with open_mirror(config) as mirror:
+            results, drinks = fetch_all_users(
+                conn, from_date, to_date, mirror=mirror,
+                shard=shard, parallel=parallel,
+            )
+        join = DrinkJoin(drinks)
+        things: Iterator[Any] = _user_audits(results, join)
+        fields: Sequence[str] = UserAudit._fields
+        table: Iterator[Tuple] = _create_user_table(
+            _user_audits(results, join),
+            {user.id: user.name for user, _ in results},
+        )
+        headers: Sequence[str] = USER_TABLE_HEADERS
+    else:
+        with open_mirror(config) as mirror:
+            audits, drinks = fetch(
+                conn, user, from_date, to_date, mirror=mirror,
+                stream=True, shard=shard, parallel=parallel,
+            )
+        if not audits:
+            return
+        # (only one of these is going to be used)
+        things = DrinkJoin(drinks).join(audits.audits)
+        fields = JoinedAudit._fields
+        table = _create_table(things)
+        headers = TABLE_HEADERS
+    if format != "table" or output:
+        export.export(config, format, output, things, fields, table, headers)
+        return
     print("Audits", end="")
-    if user:
+    if all_users:
+        print(" for all users", end="")
+    elif user:
         print(" for user {}".format(user), end="")
     print(":")
+    print_table(config, table, headers=headers)
+
+
+def follow(
+    config: Config, conn: Connection, user: Optional[str] = None,
+    from_date: Optional[date] = None, format: str = "table",
+    output: Optional[str] = None,
+) -> None:
+    """Show the audits since from_date (or today) and then new ones as they
+    appear, oldest first (until this gets interrupted)."""
+    uid = None
+    if user:
+        user_found = fuzzy_search(conn.users_index(), user)
+        if not user_found:
+            return
+        uid = user_found.id
+    drinks = conn.drinks()
+    follower = AuditFollower(conn, uid, since=from_date)
+    with export.open_output(output) as out:
+        rows = DrinkJoin(drinks).join(follower.follow(out.flush))
+        if format != "table":
+            export.write(format, rows, JoinedAudit._fields, out)
+            return
+        # The rows can't be sampled (they arrive slowly), so guess the widths.
+        widths = [
+            max(len(header) + 2, length) for header, length in zip(
+                TABLE_HEADERS,
+                (
+                    len("2024-01-13T10:00:00.000Z"),
+                    max([len(drink.name) for drink in drinks] + [0]),
+                    len("-100.00"),
+                ),
+            )
+        ]
+        StreamingTable(
+            TABLE_HEADERS, config["display"]["table_format"], sample_rows=0,
+            widths=widths, numeric=(False, False, True),
+        ).write(_create_table(rows), out)
+
+
+class Stats(NamedTuple):
+    group: Any
+    count: int
+    # all of these are in cents
+    spent: int
+    deposited: int
+    # in mg (or None if unknown)
+    caffeine: Optional[float]
+
+
+def _bucket(group_by: str, key: int) -> Any:
+    """Turn a day (since the epoch) or hour into what should be displayed."""
+    if group_by == "hour":
+        return "{:02d}:00".format(key)
+    day = EPOCH_DATE + timedelta(days=key)
+    if group_by == "day":
+        return day.isoformat()
+    elif group_by == "week":
+        year, week, _ = day.isocalendar()
+        return "{}-W{:02d}".format(year, week)
+    elif group_by == "month":
+        return "{}-{:02d}".format(day.year, day.month)
+    raise NotImplementedError(group_by)
+
+
+def calculate_stats(
+    columns: AuditColumns, drinks: List[Drink], group_by: str,
+    user_ids: Optional[Sequence[int]] = None, users: Sequence[User] = (),
+) -> List[Stats]:
+    """Summarize the audits.
+    
+    The audits are aggregated in one pass per (day, hour or user, drink);
+    grouping these into weeks or months and adding the caffeine is cheap.
+    Grouping by user needs the user of every audit (user_ids)."""
+    if group_by == "drink":
+        keys = [columns.drinks]
+    elif group_by == "user":
+        if user_ids is None:
+            raise ValueError("Grouping by user needs the user of every audit.")
+        keys = [user_ids, columns.drinks]
+    elif group_by == "hour":
+        keys = [columns.hours_of_day(), columns.drinks]
+    else:
+        keys = [columns.days(), columns.drinks]
+    join = DrinkJoin(drinks)
+    users_index = EntityIndex(users)
+    # mg per bottle (caffeine is in mg per 100 ml, bottle_size in l)
+    caffeine: Dict[int, Optional[float]] = dict()
+    for drink in drinks:
+        if drink.caffeine is not None and drink.bottle_size is not None:
+            caffeine[drink.id] = drink.caffeine * drink.bottle_size * 10
+    groups: Dict[Any, List[Any]] = dict()
+    for key, (count, payments, deposits) in columns.aggregate(*keys).items():
+        drink_id = key[-1]
+        if group_by == "drink":
+            drink = join.find(drink_id)
+            if drink:
+                group = drink.name
+            elif drink_id == NO_DRINK:
+                group = NA_DRINK.name
+            else:
+                group = "unknown drink {}".format(drink_id)
+        elif group_by == "user":
+            user = users_index.find_by_id(key[0])
+            group = user.name if user else "unknown user {}".format(key[0])
+        else:
+            group = _bucket(group_by, key[0])
+        stats = groups.get(group)
+        if stats is None:
+            stats = groups[group] = [group, 0, 0, 0, None]
+        stats[1] += count
+        stats[2] -= payments
+        stats[3] += deposits
+        if drink_id in caffeine:
+            stats[4] = (stats[4] or 0) + count * caffeine[drink_id]
+    result = [Stats(*stats) for stats in groups.values()]
+    if group_by in ("drink", "user"):
+        result.sort(key=lambda stats: (-stats.spent, stats.group))
+    else:
+        result.sort(key=lambda stats: stats.group)
+    return result
+
+
+def do_stats(args: argparse.Namespace, config: Config) -> None:
+    if args.user and args.all_users:
+        print("Please pass either --user or --all_users.")
+        return
+    if args.group_by == "user" and not args.all_users:
+        print("Grouping by user needs --all_users.")
+        return
+    conn = connect(config)
+    if args.all_users:
+        with open_mirror(config) as mirror:
+            results, drinks = fetch_all_users(
+                conn, args.from_date, args.to_date, mirror=mirror,
+                shard=args.shard, parallel=args.parallel,
+            )
+        # put all audits together (and remember whose they are)
+        columns = AuditColumns()
+        user_ids = array("q")
+        for user, audits in results:
+            columns.extend(audits.columns)
+            user_ids.extend(array("q", [user.id]) * len(audits.columns))
+        stats = calculate_stats(
+            columns, drinks, args.group_by, user_ids,
+            [user for user, _ in results],
+        )
+    else:
+        with open_mirror(config) as mirror:
+            audits, drinks = fetch(
+                conn, args.user, args.from_date, args.to_date,
+                mirror=mirror, shard=args.shard, parallel=args.parallel,
+            )
+        if not audits:
+            return
+        stats = calculate_stats(audits.columns, drinks, args.group_by)
+    print("Statistics", end="")
+    if args.all_users:
+        print(" for all users", end="")
+    elif args.user:
+        print(" for user {}".format(args.user), end="")
+    print(" by {}:".format(args.group_by))
+    rows = [
+        (
+            s.group, s.count, s.spent / 100, s.deposited / 100,
+            round(s.caffeine) if s.caffeine is not None else None,
+        )
+        for s in stats
+    ]
+    rows.append((
+        "total", sum(s.count for s in stats), sum(s.spent for s in stats) / 100,
+        sum(s.deposited for s in stats) / 100,
+        round(sum(s.caffeine or 0 for s in stats)),
+    ))
     print_table(
-        config, _create_table(audits, drinks),
-        headers=("time", "drink", "difference"),
+        config, rows,
+        headers=(args.group_by, "count", "spent", "deposited", "caffeine (mg)"),
     )
@@ -0,0 +1,101 @@
+# This is imported before anything else, so keep the imports light.
+from hashlib import sha1
+from typing import List, Optional
+
+import json
+import os
+import socket
+import stat
+import sys
+
+# how long to wait for the daemon to answer
+TIMEOUT = 60
+
+
+def socket_directory() -> str:
+    """Get the directory of the daemons' sockets (the daemon creates it,
+    so that only this user can access it)."""
+    base_path = os.environ.get("XDG_RUNTIME_DIR")
+    if not base_path:
+        import tempfile
+        base_path = tempfile.gettempdir()
+    return os.path.join(base_path, "metecli-{}".format(
+        os.getuid() if hasattr(os, "getuid") else "",
+    ))
+
+
+def socket_path(config_path: Optional[str], config_name: Optional[str]) -> str:
+    """Get the path of the daemon's socket for this config."""
+    config_id = sha1("{}\0{}".format(
+        os.path.abspath(config_path) if config_path else "",
+        config_name or "config",
+    ).encode()).hexdigest()[:12]
+    return os.path.join(socket_directory(), "{}.sock".format(config_id))
+
+
+def check_private(path: str, file_type: int) -> None:
+    """Make sure that this is a file of this type that only belongs to this
+    user and that nobody else can access. (Raises PermissionError.)"""
+    info = os.lstat(path)
+    if stat.S_IFMT(info.st_mode) != file_type:
+        raise PermissionError("{} has an unexpected type".format(path))
+    if info.st_uid != os.getuid():
+        raise PermissionError("{} belongs to another user".format(path))
+    if info.st_mode & 0o077:
+        raise PermissionError("{} can be accessed by others".format(path))
+
+
+def _option(argv: List[str], name: str) -> Optional[str]:
+    """Get the value of a global option without parsing the arguments."""
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith(name + "="):
+            return arg[len(name) + 1:]
+    return None
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """Let a running daemon execute this command.
+
+    Returns the exit code or None if the command has to be run in-process."""
+    if os.environ.get("METECLI_NO_DAEMON") or not hasattr(socket, "AF_UNIX"):
+        return None
+    path = socket_path(
+        _option(argv, "--config_path"), _option(argv, "--config_name"),
+    )
+    if not os.path.exists(path):
+        return None
+    try:
+        check_private(os.path.dirname(path), stat.S_IFDIR)
+        check_private(path, stat.S_IFSOCK)
+    except OSError as exc:
+        print("Not using the daemon: {}".format(exc), file=sys.stderr)
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except OSError:
+            # there's no daemon listening (anymore)
+            return None
+        # From here on, the command might have been executed,
+        # so it must not be run again in-process.
+        sock.settimeout(TIMEOUT)
+        sock.sendall(json.dumps({"argv": argv}).encode() + b"\n")
+        try:
+            line = sock.makefile("rb").readline()
+        except socket.timeout:
+            print("The daemon didn't answer in time.", file=sys.stderr)
+            return 1
+    finally:
+        sock.close()
+    if not line:
+        print("The daemon closed the connection.", file=sys.stderr)
+        return 1
+    response = json.loads(line.decode())
+    if response.get("fallback"):
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["exit"]
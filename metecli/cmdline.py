@@ -1,7 +1,6 @@
-from . import setup, account, audits, drinks, config, show_version
-from .utils import test_terminal_utf8
-
+from typing import Iterable, List, Optional
 import argparse
+import importlib
 
 import logging
 log = logging.getLogger(__name__)
@@ -12,19 +11,33 @@ def setup_logging(log_level: str) -> None:
     if not numeric_log_level:
         raise Exception("Invalid log level: {}".format(log_level))
     logging.basicConfig(level=numeric_log_level)
+    # basicConfig does nothing if logging has already been set up
+    logging.getLogger().setLevel(numeric_log_level)
 
 
-def do() -> None:
-    parser = argparse.ArgumentParser(
-        description="A command line interface to mete."
-    )
-    subparsers = parser.add_subparsers(help="commands")
-    setup.setup_cmdline(subparsers)
-    account.setup_cmdline(subparsers)
-    audits.setup_cmdline(subparsers)
-    drinks.setup_cmdline(subparsers)
-    config.setup_cmdline(subparsers)
-    show_version.setup_cmdline(subparsers)
+# the available commands: name -> (module, help)
+# The module is only imported if the command is going to be run.
+COMMANDS = {
+    "setup": ("setup", "setup the connection and select an account"),
+    "account": ("account", "show or modify an account"),
+    "audits": ("audits", "show audits"),
+    "drinks": ("drinks", "show or modify drinks"),
+    "users": ("users", "show all users"),
+    "config": ("config", "modify the configuration"),
+    "version": ("show_version", "display the version of metecli"),
+    "daemon": (
+        "daemon", "keep the connection open and answer commands faster",
+    ),
+    "shell": ("shell", "run several commands without reconnecting"),
+    "kiosk": ("kiosk", "buy drinks by scanning barcodes continuously"),
+    "sync": ("mirror", "keep a local copy of the audits"),
+    "flush": (
+        "journal", "send transactions that have been queued while offline",
+    ),
+}
+
+
+def _add_global_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "--log_level", type=str, help="{debug, info, warning, error, critical}"
     )
@@ -35,8 +48,55 @@ def do() -> None:
     parser.add_argument(
         "--config_name", type=str, help="the name of the config to use",
     )
+    parser.add_argument(
+        "--no_cache", "--no-cache", action="store_true",
+        help="don't use cached responses from the server",
+    )
+
+
+def find_command(argv: List[str]) -> Optional[str]:
+    """Find out which command is going to be run (without loading it)."""
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    _add_global_arguments(pre_parser)
+    _, remaining = pre_parser.parse_known_args(argv)
+    for arg in remaining:
+        if arg in COMMANDS:
+            return arg
+        if not arg.startswith("-"):
+            return None
+    return None
+
 
-    args = parser.parse_args()
+def build_parser(
+    commands: Optional[Iterable[str]] = None,
+) -> argparse.ArgumentParser:
+    """Build the parser.
+    
+    Only the given commands (or all, if None) are set up completely,
+    the others just get a placeholder, so that they appear in the help."""
+    parser = argparse.ArgumentParser(
+        description="A command line interface to mete."
+    )
+    subparsers = parser.add_subparsers(help="commands")
+    for name, (module_name, help) in COMMANDS.items():
+        if commands is None or name in commands:
+            module = importlib.import_module("." + module_name, __package__)
+            module.setup_cmdline(subparsers)
+        else:
+            subparsers.add_parser(name, help=help)
+    _add_global_arguments(parser)
+    return parser
+
+
+def do() -> None:
+    import sys
+    command = find_command(sys.argv[1:])
+    args = build_parser([command] if command else []).parse_args()
+    run(args)
+
+
+def run(args: argparse.Namespace, conf: Optional['Config'] = None) -> None:
+    """Run a parsed command (with an already loaded config, if given)."""
     if args.log_level:
         setup_logging(args.log_level)
     
@@ -45,10 +105,16 @@ def do() -> None:
         print("You must provide a topic. Please see --help.")
         return
     
-    conf = config.Config(path=args.config_path, name=args.config_name)
-    
-    if not args.log_level:
-        setup_logging(conf["display"]["log_level"])
+    if not conf and getattr(args, "needs_config", True):
+        from .config import Config
+        conf = Config(path=args.config_path, name=args.config_name)
+    if conf:
+        conf.use_cache = not args.no_cache
+        if not args.log_level:
+            setup_logging(conf["display"]["log_level"])
+        # (not for commands without a config: importing utils loads it)
+        from .utils import test_terminal_utf8
+        test_terminal_utf8()
     
-    test_terminal_utf8()
     args.func(args, conf)
+
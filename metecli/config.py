@@ -4,15 +4,23 @@ from .connection.config import DEFAULT_SETTINGS as DEFAULT_CONNECTION_SETTINGS
 import yaml
 import os
 import sys
-from contextlib import suppress
-from typing import Callable, Optional
+import tempfile
+from contextlib import contextmanager, suppress
+from copy import deepcopy
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
 
 import argparse
 import logging
 log = logging.getLogger(__name__)
 
 DEFAULT_SETTINGS = {
-    "version": 5,
+    "version": 9,
     "connection": DEFAULT_CONNECTION_SETTINGS,
     "account": {
         "uid": None,
@@ -20,9 +28,67 @@ DEFAULT_SETTINGS = {
     "display": {
         "table_format": "grid",
         "log_level": "warning",
-    }
+        # stream tables instead of measuring all rows first:
+        # "auto" (for long tables), "always" or "never"
+        "stream_tables": "auto",
+        # how many rows to look at to determine the column widths
+        "sample_rows": 100,
+        # pipe streamed tables into a pager (True, False or a command)
+        "pager": True,
+    },
+    "cache": {
+        "enabled": True,
+        "max_age": 60,
+    },
 }
 
+# the C implementation is much faster, but it's not always available
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# parsed config files: path -> (stat key, settings)
+# (Configs are loaded more than once in a long-running process.)
+_parsed: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = dict()
+
+
+def _stat_key(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _load(path: str) -> Tuple[Tuple[int, int], Dict[str, Any]]:
+    """Parse a config file (or get it from the cache if it's unchanged)."""
+    stat_key = _stat_key(path)
+    if path in _parsed and _parsed[path][0] == stat_key:
+        log.debug("Config file hasn't changed. Using the parsed version.")
+    else:
+        with open(path, "rt") as config_file:
+            settings = yaml.load(config_file, Loader=_Loader) or dict()
+        _parsed[path] = (stat_key, settings)
+    return stat_key, deepcopy(_parsed[path][1])
+
+
+def _merge(ours: Dict[str, Any], base: Dict[str, Any], theirs: Dict[str, Any]) -> None:
+    """Apply the changes someone else made (base -> theirs) to ours.
+    
+    Our own changes (base -> ours) win."""
+    for key, value in theirs.items():
+        if key not in ours:
+            if key not in base:
+                ours[key] = value
+            # else: we've deleted it
+        elif (
+            isinstance(ours[key], dict) and isinstance(value, dict)
+            and isinstance(base.get(key), dict)
+        ):
+            _merge(ours[key], base[key], value)
+        elif key in base and ours[key] == base[key]:
+            ours[key] = value
+    for key in list(ours.keys()):
+        if key not in theirs and key in base and ours[key] == base[key]:
+            # they've deleted it
+            del ours[key]
+
 
 def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser = global_subparsers.add_parser(
@@ -88,9 +154,14 @@ class Config():
     def __init__(
         self, path: Optional[str] = None, name: Optional[str] = None,
     ) -> None:
+        self.use_cache = True
         self._search_config_file_path(path, name)
         self._open_or_create()
+        version = self["version"] if "version" in self._settings else 0
         self._migrate()
+        if self["version"] != version:
+            # write all migrations at once
+            self.save()
         self._warn_on_downgrade()
     
     def __getitem__(self, key: str):
@@ -160,29 +231,31 @@ class Config():
         config_file_path = os.path.join(config_path, "{}.yaml".format(name))
         log.debug("Using config file at: %s", config_file_path)
         self.config_file_path = config_file_path
+        self._config_path = config_path
+        self._name = name
     
     def _open_or_create(self) -> None:
         if(os.path.exists(self.config_file_path)):
             log.debug("Config file does already exist. Opening.")
-            with open(self.config_file_path, "rt") as config_file:
-                self._settings = yaml.safe_load(config_file)
+            self._stat_key, self._settings = _load(self.config_file_path)
+            # what the file contained, to find out what has been changed
+            self._base = deepcopy(self._settings)
         else:
             log.debug("Config file doesn't exist yet. Creating.")
-            with open(self.config_file_path, "wt") as config_file:
-                pass
-            self._settings = dict(DEFAULT_SETTINGS)
+            self._stat_key = None
+            self._settings = deepcopy(DEFAULT_SETTINGS)
+            self._base = dict()
             self.save()
     
     def _migrate(self) -> None:
+        """Upgrade the settings to the current version (in memory)."""
         if "version" not in self._settings:  # v0 -> v1
             log.info("Configuration doesn't have a version. Asssuming v1.")
             self["version"] = 1
-            self.save()
         if self["version"] == 1:  # v1 -> v2
             log.info("Migrating to v2: Adding display.log_level.")
             self["display"]["log_level"] = "warning"
             self["version"] = 2
-            self.save()
         if self["version"] == 2:  # v2 -> v3
             log.info("Migrating to v3: Adding 'uid' and 'base_url' to connection if they don't exist.")
             if "base_url" not in self["connection"]:
@@ -190,7 +263,6 @@ class Config():
             if "uid" not in self["connection"]:
                 self["connection"]["uid"] = None
             self["version"] = 3
-            self.save()
         if self["version"] == 3:  # v3 -> v4
             log.info("Migrating to v4: Adding connection.api_version.")
             if self["connection"]["base_url"]:
@@ -200,7 +272,6 @@ class Config():
             else:
                 self["connection"]["api_version"] = None
             self["version"] = 4
-            self.save()
         if self["version"] == 4:  # v4 -> v5
             log.info("Migrationg to v5: Splitting account section and connection section.")
             if "account" not in self._settings:
@@ -211,7 +282,26 @@ class Config():
             if "uid" in self["connection"]:
                 del self["connection"]["uid"]
             self["version"] = 5
-            self.save()
+        if self["version"] == 5:  # v5 -> v6
+            log.info("Migrating to v6: Adding cache settings.")
+            self["cache"] = dict(DEFAULT_SETTINGS["cache"])
+            self["version"] = 6
+        if self["version"] == 6:  # v6 -> v7
+            log.info("Migrating to v7: Adding connection.upgrade_probe.")
+            self["connection"]["upgrade_probe"] = dict(
+                DEFAULT_CONNECTION_SETTINGS["upgrade_probe"]
+            )
+            self["version"] = 7
+        if self["version"] == 7:  # v7 -> v8
+            log.info("Migrating to v8: Adding connection.capabilities.")
+            self["connection"]["capabilities"] = None
+            self["version"] = 8
+        if self["version"] == 8:  # v8 -> v9
+            log.info("Migrating to v9: Adding settings for streaming tables.")
+            self["display"]["stream_tables"] = DEFAULT_SETTINGS["display"]["stream_tables"]
+            self["display"]["sample_rows"] = DEFAULT_SETTINGS["display"]["sample_rows"]
+            self["display"]["pager"] = DEFAULT_SETTINGS["display"]["pager"]
+            self["version"] = 9
     
     def _warn_on_downgrade(self):
         if self["version"] > DEFAULT_SETTINGS["version"]:
@@ -221,9 +311,57 @@ class Config():
                 self["version"], DEFAULT_SETTINGS["version"])
             log.warn("Downgrading isn't recommended. The program might crash at any moment!")
     
+    def cache_path(self) -> str:
+        """Get the directory where cached responses are stored."""
+        return os.path.join(self._config_path, "cache", self._name)
+    
+    def state_path(self) -> str:
+        """Get the directory for data that mustn't get lost (unlike the cache,
+        this is used even if caching is disabled)."""
+        return os.path.join(self._config_path, "state", self._name)
+    
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Hold an exclusive lock on the config file (if supported)."""
+        if not fcntl:
+            yield
+            return
+        with open(self.config_file_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
     def save(self) -> None:
         log.debug("Saving config....")
-        with open(self.config_file_path, "wt") as config_file:
-            yaml.safe_dump(
-                self._settings, stream=config_file, default_flow_style=False,
+        with self._lock():
+            with suppress(FileNotFoundError):
+                stat_key = _stat_key(self.config_file_path)
+                if stat_key != self._stat_key:
+                    log.info("The config file has been changed by someone else. Merging.")
+                    _, theirs = _load(self.config_file_path)
+                    _merge(self._settings, self._base, theirs)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self._config_path, prefix=self._name, suffix=".tmp",
             )
+            try:
+                with os.fdopen(fd, "wt") as config_file:
+                    yaml.dump(
+                        self._settings, stream=config_file,
+                        default_flow_style=False, Dumper=_Dumper,
+                    )
+                    config_file.flush()
+                    os.fsync(config_file.fileno())
+                with suppress(FileNotFoundError):
+                    os.chmod(
+                        tmp_path, os.stat(self.config_file_path).st_mode,
+                    )
+                os.replace(tmp_path, self.config_file_path)
+            except:
+                with suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                raise
+            self._stat_key = _stat_key(self.config_file_path)
+            self._base = deepcopy(self._settings)
+            _parsed[self.config_file_path] = (self._stat_key, self._base)
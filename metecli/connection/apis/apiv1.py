@@ -1,27 +1,33 @@
+from ..cache import ResponseCache
 from ..config import Config
 from ..connection import Connection
-from ..models import ApiVersion, AuditInfo, Barcode, Drink, ServerInfo, User
+from ..json_stream import iter_members
+from ..models import ApiVersion, AuditInfo, AuditStream, Barcode, Drink, ServerInfo, User
+from ...index import EntityIndex
 
 from requests import Session
 from urllib.parse import urljoin
 from datetime import date
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple, Union
 
 import logging
 log = logging.getLogger(__name__)
 
 
 class ApiV1(Connection):
+    _unsupported = ("server_info",)
+    
     def __init__(
         self, sess: Session, conf: Optional['Config'],
         base_url: str, api_version: ApiVersion,
+        cache: Optional[ResponseCache] = None,
     ) -> None:
-        self._sess = sess
-        self._conf = conf
-        self._base_url = base_url
+        super().__init__(sess, conf, base_url, cache)
         assert api_version in ("legacy", "v1")
         self._api_version = api_version
-        self.try_upgrade()
+        if conf:
+            # without a config, Connection.probe has already tried all versions
+            self.try_upgrade()
     
     def server_info(self) -> ServerInfo:
         """Get information about the server."""
@@ -29,15 +35,22 @@ class ApiV1(Connection):
     
     def users(self) -> List[User]:
         """Lists all users."""
-        r = self._sess.get(urljoin(self._base_url, "users.json"))
-        r.raise_for_status()
-        return [User.from_v1(u) for u in r.json()]
+        return [
+            User.from_v1(u)
+            for u in self._get_cached(urljoin(self._base_url, "users.json"))
+        ]
+    
+    def users_index(self) -> EntityIndex[User]:
+        """Get the lookup tables for all users."""
+        return self._get_index(
+            urljoin(self._base_url, "users.json"), User.from_v1,
+        )
     
-    def audits(
+    def _audits(
         self, user: Optional[int] = None, from_date: Optional[date] = None,
-        to_date: Optional[date] = None,
-    ) -> AuditInfo:
-        """Get audits."""
+        to_date: Optional[date] = None, stream: bool = False,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits with one request."""
         params = dict()
         if user:
             assert isinstance(user, int)
@@ -50,19 +63,18 @@ class ApiV1(Connection):
             params["end_date[year]"] = to_date.year
             params["end_date[month]"] = to_date.month
             params["end_date[day]"] = to_date.day
-        r = self._sess.get(
-            urljoin(self._base_url, "audits.json"), params=params,
-        )
-        r.raise_for_status()
-        return AuditInfo.from_v1(r.json())
+        url = urljoin(self._base_url, "audits.json")
+        if stream:
+            return AuditStream.from_v1(
+                iter_members(self._get_stream(url, params=params), "audits")
+            )
+        return AuditInfo.from_v1(self._get_json(url, params=params))
     
     def get_user(self, uid: int) -> User:
         """Get information about a user."""
-        r = self._sess.get(
+        return User.from_v1(self._get_json(
             urljoin(self._base_url, "users/{}.json".format(uid)),
-        )
-        r.raise_for_status()
-        return User.from_v1(r.json())
+        ))
     
     def modify_user(self, user: User) -> None:
         """Modifys an existing user."""
@@ -71,18 +83,20 @@ class ApiV1(Connection):
             json=user.to_v1(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users.json"))
     
     def delete_user(self, uid: int) -> None:
         r = self._sess.delete(
             urljoin(self._base_url, "users/{}.json".format(uid)),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users.json"))
     
     def get_user_defaults(self) -> User:
         """Gets the default settings for creating a new user."""
-        r = self._sess.get(urljoin(self._base_url, "users/new.json"))
-        r.raise_for_status()
-        return User.from_v1(r.json())
+        return User.from_v1(self._get_json(
+            urljoin(self._base_url, "users/new.json"),
+        ))
     
     def add_user(self, user: User) -> User:
         """Creates a new user."""
@@ -90,6 +104,7 @@ class ApiV1(Connection):
             urljoin(self._base_url, "users.json"), json=user.to_v1(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users.json"))
         return User.from_v1(r.json())
     
     def buy(self, uid: int, did: int) -> None:
@@ -98,6 +113,10 @@ class ApiV1(Connection):
             self._base_url, "users/{}/buy.json?drink={}".format(uid, did),
         ))
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users.json"),
+            urljoin(self._base_url, "audits.json"),
+        )
     
     def pay(self, uid: int, amount: float) -> None:
         """Pay an amount."""
@@ -106,6 +125,10 @@ class ApiV1(Connection):
             "users/{}/payment.json?amount={}".format(uid, amount),
         ))
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users.json"),
+            urljoin(self._base_url, "audits.json"),
+        )
     
     def deposit(self, uid: int, amount: float) -> None:
         """Deposit money."""
@@ -114,6 +137,10 @@ class ApiV1(Connection):
             "users/{}/deposit.json?amount={}".format(uid, amount),
         ))
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users.json"),
+            urljoin(self._base_url, "audits.json"),
+        )
     
     def transfer(self, sender: int, receiver: int, amount: float) -> None:
         """Transfer money."""
@@ -121,11 +148,30 @@ class ApiV1(Connection):
         self.pay(sender, amount)
         self.deposit(receiver, amount)
     
-    def drinks(self) -> List[Drink]:
+    def transfer_steps(
+        self, sender: int, receiver: int, amount: float,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """The requests a transfer consists of (the names of the methods that
+        make them and their arguments)."""
+        return [
+            ("pay", dict(uid=sender, amount=amount)),
+            ("deposit", dict(uid=receiver, amount=amount)),
+        ]
+    
+    def drinks(self, refresh: bool = False) -> List[Drink]:
         """Lists all drinks."""
-        r = self._sess.get(urljoin(self._base_url, "drinks.json"))
-        r.raise_for_status()
-        return [Drink.from_v1(d) for d in r.json()]
+        return [
+            Drink.from_v1(d)
+            for d in self._get_cached(
+                urljoin(self._base_url, "drinks.json"), refresh=refresh,
+            )
+        ]
+    
+    def drinks_index(self, refresh: bool = False) -> EntityIndex[Drink]:
+        """Get the lookup tables for all drinks."""
+        return self._get_index(
+            urljoin(self._base_url, "drinks.json"), Drink.from_v1, refresh,
+        )
     
     def modify_drink(self, drink: Drink) -> None:
         """Modifys an existing drink."""
@@ -134,12 +180,13 @@ class ApiV1(Connection):
             json=drink.to_v1(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "drinks.json"))
     
     def get_drink_defaults(self) -> Drink:
         """Gets the default settings for creating a new drink."""
-        r = self._sess.get(urljoin(self._base_url, "drinks/new.json"))
-        r.raise_for_status()
-        return Drink.from_v1(r.json())
+        return Drink.from_v1(self._get_json(
+            urljoin(self._base_url, "drinks/new.json"),
+        ))
     
     def create_drink(self, drink: Drink) -> Drink:
         """Creates a new drink."""
@@ -148,6 +195,7 @@ class ApiV1(Connection):
             json=drink.to_v1()
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "drinks.json"))
         return Drink.from_v1(r.json())
     
     def delete_drink(self, drink_id: int) -> None:
@@ -156,17 +204,26 @@ class ApiV1(Connection):
             urljoin(self._base_url, "drinks/{}.json").format(drink_id)
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "drinks.json"),
+            urljoin(self._base_url, "barcodes.json"),
+        )
+        self._barcode_index.remove_drink(drink_id)
     
-    def barcodes(self) -> List[Barcode]:
+    def barcodes(self, refresh: bool = False) -> List[Barcode]:
         """Lists all barcodes."""
-        r = self._sess.get(urljoin(self._base_url, "barcodes.json"))
-        return [Barcode.from_v1(b) for b in r.json()]
+        return [
+            Barcode.from_v1(b)
+            for b in self._get_cached(
+                urljoin(self._base_url, "barcodes.json"), refresh=refresh,
+            )
+        ]
     
     def get_barcode_defaults(self) -> Barcode:
         """Get the defaults for creating new barcodes."""
-        r = self._sess.get(urljoin(self._base_url, "barcodes/new.json"))
-        r.raise_for_status()
-        return Barcode.from_v1(r.json())
+        return Barcode.from_v1(self._get_json(
+            urljoin(self._base_url, "barcodes/new.json"),
+        ))
     
     def create_barcode(self, barcode: Barcode) -> Barcode:
         """Creates a new barcode."""
@@ -175,7 +232,10 @@ class ApiV1(Connection):
             json=barcode.to_v1(),
         )
         r.raise_for_status()
-        return Barcode.from_v1(r.json())
+        self._invalidate(urljoin(self._base_url, "barcodes.json"))
+        barcode = Barcode.from_v1(r.json())
+        self._barcode_index.add(barcode)
+        return barcode
     
     def delete_barcode(self, barcode_id: int) -> None:
         """Delete a barcode."""
@@ -183,20 +243,29 @@ class ApiV1(Connection):
             urljoin(self._base_url, "barcodes/{}.json").format(barcode_id)
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "barcodes.json"))
+        self._barcode_index.remove(barcode_id)
     
-    def try_connect(self) -> bool:
+    def try_connect(self, quiet: bool = False) -> bool:
         """Tries to connect to the server."""
         try:
             self.users()
             return True
         except Exception as exc:
-            log.error("%s: %s", type(exc).__name__, exc)
+            if quiet:
+                log.debug("%s: %s", type(exc).__name__, exc)
+            else:
+                log.error("%s: %s", type(exc).__name__, exc)
             return False
     
     def api_version(self) -> ApiVersion:
         """Get the API version."""
         return self._api_version
     
+    def _can_upgrade(self) -> bool:
+        """Whether there is a newer API version worth probing for."""
+        return self._api_version == "legacy"
+    
     def _try_upgrade(self) -> Tuple[bool, 'Connection']:
         """Tries to upgrade the API version.
         
@@ -207,6 +276,7 @@ class ApiV1(Connection):
             )
             # save the old values
             old_base_url = self._base_url
+            changed = False
             self._api_version = "v1"
             try:
                 self._base_url = urljoin(self._base_url, "api/v1/")
@@ -1,41 +1,52 @@
+from ..cache import ResponseCache
 from ..config import Config
 from ..connection import Connection
-from ..models import ApiVersion, AuditInfo, Barcode, Drink, ServerInfo, User
+from ..json_stream import iter_members
+from ..models import ApiVersion, AuditInfo, AuditStream, Barcode, Drink, ServerInfo, User
+from ...index import EntityIndex
 
 from requests import Session
 from urllib.parse import urljoin
 from datetime import date
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple, Union
 
 import logging
 log = logging.getLogger(__name__)
 
 
 class ApiV2(Connection):
+    _unsupported = ("barcodes",)
+    
     def __init__(
         self, sess: Session, conf: Optional['Config'], base_url: str,
+        cache: Optional[ResponseCache] = None,
     ) -> None:
-        self._sess = sess
-        self._conf = conf
-        self._base_url = base_url
+        super().__init__(sess, conf, base_url, cache)
     
     def server_info(self) -> ServerInfo:
         """Get information about the server."""
-        r = self._sess.get(urljoin(self._base_url, "info.json"))
-        r.raise_for_status()
-        return ServerInfo.from_v2(r.json())
+        return ServerInfo.from_v2(self._get_cached(
+            urljoin(self._base_url, "info.json"),
+        ))
     
     def users(self) -> List[User]:
         """Lists all users."""
-        r = self._sess.get(urljoin(self._base_url, "users.json"))
-        r.raise_for_status()
-        return [User.from_v2(u) for u in r.json()]
+        return [
+            User.from_v2(u)
+            for u in self._get_cached(urljoin(self._base_url, "users.json"))
+        ]
+    
+    def users_index(self) -> EntityIndex[User]:
+        """Get the lookup tables for all users."""
+        return self._get_index(
+            urljoin(self._base_url, "users.json"), User.from_v2,
+        )
     
-    def audits(
+    def _audits(
         self, user: Optional[int] = None, from_date: Optional[date] = None,
-        to_date: Optional[date] = None,
-    ) -> AuditInfo:
-        """Get audits."""
+        to_date: Optional[date] = None, stream: bool = False,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits with one request."""
         params = dict()
         if user:
             assert isinstance(user, int)
@@ -48,19 +59,18 @@ class ApiV2(Connection):
             params["end_date[year]"] = to_date.year
             params["end_date[month]"] = to_date.month
             params["end_date[day]"] = to_date.day
-        r = self._sess.get(
-            urljoin(self._base_url, "audits.json"), params=params,
-        )
-        r.raise_for_status()
-        return AuditInfo.from_v2(r.json())
+        url = urljoin(self._base_url, "audits.json")
+        if stream:
+            return AuditStream.from_v2(
+                iter_members(self._get_stream(url, params=params), "audits")
+            )
+        return AuditInfo.from_v2(self._get_json(url, params=params))
     
     def get_user(self, uid: int) -> User:
         """Get information about a user."""
-        r = self._sess.get(
+        return User.from_v2(self._get_json(
             urljoin(self._base_url, "users/{}.json".format(uid)),
-        )
-        r.raise_for_status()
-        return User.from_v2(r.json())
+        ))
     
     def modify_user(self, user: User) -> None:
         """Modifys an existing user."""
@@ -69,12 +79,14 @@ class ApiV2(Connection):
             json=user.to_v2(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users.json"))
     
     def delete_user(self, uid: int) -> None:
         r = self._sess.delete(
             urljoin(self._base_url, "users/{}.json".format(uid)),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users.json"))
     
     def get_user_defaults(self) -> User:
         """Gets the default settings for creating a new user."""
@@ -90,6 +102,7 @@ class ApiV2(Connection):
             urljoin(self._base_url, "users.json"), json=user.to_v2(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users.json"))
         return User.from_v2(r.json())
     
     def buy(self, uid: int, did: int) -> None:
@@ -99,6 +112,10 @@ class ApiV2(Connection):
             json={"product": did},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users.json"),
+            urljoin(self._base_url, "audits.json"),
+        )
     
     def pay(self, uid: int, amount: float) -> None:
         """Pay an amount."""
@@ -107,6 +124,10 @@ class ApiV2(Connection):
             json={"amount": int(amount * 100)},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users.json"),
+            urljoin(self._base_url, "audits.json"),
+        )
     
     def deposit(self, uid: int, amount: float) -> None:
         """Deposit money."""
@@ -115,6 +136,10 @@ class ApiV2(Connection):
             json={"amount": int(amount * 100)},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users.json"),
+            urljoin(self._base_url, "audits.json"),
+        )
     
     def transfer(self, sender: int, receiver: int, amount: float) -> None:
         """Transfer money."""
@@ -122,11 +147,30 @@ class ApiV2(Connection):
         self.pay(sender, amount)
         self.deposit(receiver, amount)
     
-    def drinks(self) -> List[Drink]:
+    def transfer_steps(
+        self, sender: int, receiver: int, amount: float,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """The requests a transfer consists of (the names of the methods that
+        make them and their arguments)."""
+        return [
+            ("pay", dict(uid=sender, amount=amount)),
+            ("deposit", dict(uid=receiver, amount=amount)),
+        ]
+    
+    def drinks(self, refresh: bool = False) -> List[Drink]:
         """Lists all drinks."""
-        r = self._sess.get(urljoin(self._base_url, "products.json"))
-        r.raise_for_status()
-        return [Drink.from_v2(d) for d in r.json()]
+        return [
+            Drink.from_v2(d)
+            for d in self._get_cached(
+                urljoin(self._base_url, "products.json"), refresh=refresh,
+            )
+        ]
+    
+    def drinks_index(self, refresh: bool = False) -> EntityIndex[Drink]:
+        """Get the lookup tables for all drinks."""
+        return self._get_index(
+            urljoin(self._base_url, "products.json"), Drink.from_v2, refresh,
+        )
     
     def modify_drink(self, drink: Drink) -> None:
         """Modifys an existing drink."""
@@ -135,6 +179,7 @@ class ApiV2(Connection):
             json=drink.to_v2(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "products.json"))
     
     def get_drink_defaults(self) -> Drink:
         """Gets the default settings for creating a new drink."""
@@ -151,6 +196,7 @@ class ApiV2(Connection):
             json=drink.to_v2()
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "products.json"))
         return Drink.from_v2(r.json())
     
     def delete_drink(self, drink_id: int) -> None:
@@ -159,8 +205,9 @@ class ApiV2(Connection):
             urljoin(self._base_url, "products/{}.json").format(drink_id)
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "products.json"))
     
-    def barcodes(self) -> List[Barcode]:
+    def barcodes(self, refresh: bool = False) -> List[Barcode]:
         """Lists all barcodes."""
         raise NotImplementedError
     
@@ -176,13 +223,16 @@ class ApiV2(Connection):
         """Delete a barcode."""
         raise NotImplementedError
     
-    def try_connect(self) -> bool:
+    def try_connect(self, quiet: bool = False) -> bool:
         """Tries to connect to the server."""
         try:
             self.server_info()
             return True
         except Exception as exc:
-            log.error("%s: %s", type(exc).__name__, exc)
+            if quiet:
+                log.debug("%s: %s", type(exc).__name__, exc)
+            else:
+                log.error("%s: %s", type(exc).__name__, exc)
             return False
     
     def api_version(self) -> ApiVersion:
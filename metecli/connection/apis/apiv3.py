@@ -1,35 +1,52 @@
+from ..cache import ResponseCache
 from ..config import Config
 from ..connection import Connection
-from ..models import ApiVersion, AuditInfo, Barcode, Drink, User
+from ..json_stream import iter_members
+from ..models import ApiVersion, AuditInfo, AuditStream, Barcode, Drink, ServerInfo, User
+from ...index import EntityIndex
 
 from requests import Session
 from urllib.parse import urljoin
 from datetime import date
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Union
 
 import logging
 log = logging.getLogger(__name__)
 
 
 class ApiV3(Connection):
+    _unsupported = ("barcodes",)
+    
     def __init__(
         self, sess: Session, conf: Optional['Config'], base_url: str,
+        cache: Optional[ResponseCache] = None,
     ) -> None:
-        self._sess = sess
-        self._conf = conf
-        self._base_url = base_url
+        super().__init__(sess, conf, base_url, cache)
+    
+    def server_info(self) -> ServerInfo:
+        """Get information about the server."""
+        return ServerInfo.from_v3(self._get_cached(
+            urljoin(self._base_url, "info"),
+        ))
     
     def users(self) -> List[User]:
         """Lists all users."""
-        r = self._sess.get(urljoin(self._base_url, "users"))
-        r.raise_for_status()
-        return [User.from_v3(u) for u in r.json()]
+        return [
+            User.from_v3(u)
+            for u in self._get_cached(urljoin(self._base_url, "users"))
+        ]
+    
+    def users_index(self) -> EntityIndex[User]:
+        """Get the lookup tables for all users."""
+        return self._get_index(
+            urljoin(self._base_url, "users"), User.from_v3,
+        )
     
-    def audits(
+    def _audits(
         self, user: Optional[int] = None, from_date: Optional[date] = None,
-        to_date: Optional[date] = None,
-    ) -> AuditInfo:
-        """Get audits."""
+        to_date: Optional[date] = None, stream: bool = False,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits with one request."""
         params = dict()
         if user:
             assert isinstance(user, int)
@@ -38,17 +55,18 @@ class ApiV3(Connection):
             params["start"] = str(from_date)
         if to_date:
             params["end"] = str(to_date)
-        r = self._sess.get(
-            urljoin(self._base_url, "audits"), params=params,
-        )
-        r.raise_for_status()
-        return AuditInfo.from_v3(r.json())
+        url = urljoin(self._base_url, "audits")
+        if stream:
+            return AuditStream.from_v3(
+                iter_members(self._get_stream(url, params=params), "audits")
+            )
+        return AuditInfo.from_v3(self._get_json(url, params=params))
     
     def get_user(self, uid: int) -> User:
         """Get information about a user."""
-        r = self._sess.get(urljoin(self._base_url, "users/{}".format(uid)))
-        r.raise_for_status()
-        return User.from_v3(r.json())
+        return User.from_v3(self._get_json(
+            urljoin(self._base_url, "users/{}".format(uid)),
+        ))
     
     def modify_user(self, user: User) -> None:
         """Modifys an existing user."""
@@ -57,10 +75,12 @@ class ApiV3(Connection):
             json=user.to_v3(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users"))
     
     def delete_user(self, uid: int) -> None:
         r = self._sess.delete(urljoin(self._base_url, "users/{}".format(uid)))
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users"))
     
     def get_user_defaults(self) -> User:
         """Gets the default settings for creating a new user."""
@@ -76,6 +96,7 @@ class ApiV3(Connection):
             urljoin(self._base_url, "users"), json=user.to_v3(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "users"))
         return User.from_v3(r.json())
     
     def buy(self, uid: int, did: int) -> None:
@@ -85,6 +106,10 @@ class ApiV3(Connection):
             json={"product": did},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users"),
+            urljoin(self._base_url, "audits"),
+        )
     
     def pay(self, uid: int, amount: float) -> None:
         """Pay an amount."""
@@ -93,6 +118,10 @@ class ApiV3(Connection):
             json={"amount": int(amount * 100)},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users"),
+            urljoin(self._base_url, "audits"),
+        )
     
     def deposit(self, uid: int, amount: float) -> None:
         """Deposit money."""
@@ -101,6 +130,10 @@ class ApiV3(Connection):
             json={"amount": int(amount * 100)},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users"),
+            urljoin(self._base_url, "audits"),
+        )
     
     def transfer(self, sender: int, receiver: int, amount: float) -> None:
         """Transfer money."""
@@ -111,12 +144,25 @@ class ApiV3(Connection):
             }},
         )
         r.raise_for_status()
+        self._invalidate(
+            urljoin(self._base_url, "users"),
+            urljoin(self._base_url, "audits"),
+        )
     
-    def drinks(self) -> List[Drink]:
+    def drinks(self, refresh: bool = False) -> List[Drink]:
         """Lists all drinks."""
-        r = self._sess.get(urljoin(self._base_url, "products"))
-        r.raise_for_status()
-        return [Drink.from_v3(d) for d in r.json()]
+        return [
+            Drink.from_v3(d)
+            for d in self._get_cached(
+                urljoin(self._base_url, "products"), refresh=refresh,
+            )
+        ]
+    
+    def drinks_index(self, refresh: bool = False) -> EntityIndex[Drink]:
+        """Get the lookup tables for all drinks."""
+        return self._get_index(
+            urljoin(self._base_url, "products"), Drink.from_v3, refresh,
+        )
     
     def modify_drink(self, drink: Drink) -> None:
         """Modifys an existing drink."""
@@ -125,9 +171,16 @@ class ApiV3(Connection):
             json=drink.to_v3(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "products"))
     
     def get_drink_defaults(self) -> Drink:
         """Gets the default settings for creating a new drink."""
+        if not self.supports("server_info"):
+            log.warn("This server does not let us know of its defaults for creating new drinks. Using our own.")
+            return Drink(
+                id=None, name="", bottle_size=None, caffeine=None,
+                price=1.5, active=True,
+            )
         defaults = self.server_info().defaults
         return Drink(
             id=None, name="",
@@ -142,6 +195,7 @@ class ApiV3(Connection):
             urljoin(self._base_url, "products"), json=drink.to_v3(),
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "products"))
         return Drink.from_v3(r.json())
     
     def delete_drink(self, drink_id: int) -> None:
@@ -150,8 +204,9 @@ class ApiV3(Connection):
             urljoin(self._base_url, "products/{}").format(drink_id)
         )
         r.raise_for_status()
+        self._invalidate(urljoin(self._base_url, "products"))
     
-    def barcodes(self) -> List[Barcode]:
+    def barcodes(self, refresh: bool = False) -> List[Barcode]:
         """Lists all barcodes."""
         raise NotImplementedError
     
@@ -167,13 +222,16 @@ class ApiV3(Connection):
         """Delete a barcode."""
         raise NotImplementedError
     
-    def try_connect(self) -> bool:
+    def try_connect(self, quiet: bool = False) -> bool:
         """Tries to connect to the server."""
         try:
             self.server_info()
             return True
         except Exception as exc:
-            log.error("%s: %s", type(exc).__name__, exc)
+            if quiet:
+                log.debug("%s: %s", type(exc).__name__, exc)
+            else:
+                log.error("%s: %s", type(exc).__name__, exc)
             return False
     
     def api_version(self) -> ApiVersion:
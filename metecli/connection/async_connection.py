@@ -0,0 +1,289 @@
+from .cache import ResponseCache
+from .config import Config
+from .connection import Connection, DEFAULT_PARALLEL
+from .models import ApiVersion, AuditInfo, AuditStream, Barcode, Drink, ServerInfo, User
+
+from abc import ABCMeta, abstractmethod
+from datetime import date
+from functools import partial
+from typing import Any, Callable, List, Optional, Union
+
+import asyncio
+import logging
+log = logging.getLogger(__name__)
+
+
+class AsyncConnection(metaclass=ABCMeta):
+    """The asynchronous counterpart of `Connection`.
+
+    Independent requests can be awaited together with `asyncio.gather`."""
+    @classmethod
+    def new(
+        cls, config: Optional['Config'], base_url: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+    ) -> 'AsyncConnection':
+        return cls.wrap(Connection.new(config, base_url, cache))
+    
+    @classmethod
+    def wrap(cls, conn: Connection) -> 'AsyncConnection':
+        """Get an asynchronous handle for an existing connection."""
+        return ThreadedConnection(conn)
+    
+    @abstractmethod
+    def base_url(self) -> str:
+        """Get the base URL."""
+        pass
+    
+    @abstractmethod
+    async def server_info(self) -> ServerInfo:
+        """Get information about the server."""
+        pass
+    
+    @abstractmethod
+    async def users(self) -> List[User]:
+        """Lists all users."""
+        pass
+    
+    @abstractmethod
+    async def audits(
+        self, user: Optional[int] = None, from_date: Optional[date] = None,
+        to_date: Optional[date] = None, stream: bool = False,
+        shard: Optional[str] = None, parallel: int = DEFAULT_PARALLEL,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits.
+        
+        If stream is set, they are decoded while they're being read.
+        If shard ("month" or "week") is set, the range is split up and the
+        parts are fetched concurrently (at most parallel at a time)."""
+        pass
+    
+    @abstractmethod
+    async def get_user(self, uid: int) -> User:
+        """Get information about a user."""
+        pass
+    
+    @abstractmethod
+    async def modify_user(self, user: User) -> None:
+        """Modifys an existing user."""
+        pass
+    
+    @abstractmethod
+    async def delete_user(self, uid: int) -> None:
+        pass
+    
+    @abstractmethod
+    async def get_user_defaults(self) -> User:
+        """Gets the default settings for creating a new user."""
+        pass
+    
+    @abstractmethod
+    async def add_user(self, user: User) -> User:
+        """Creates a new user."""
+        pass
+    
+    @abstractmethod
+    async def buy(self, uid: int, did: int) -> None:
+        """Buy a drink."""
+        pass
+    
+    @abstractmethod
+    async def pay(self, uid: int, amount: float) -> None:
+        """Pay an amount."""
+        pass
+    
+    @abstractmethod
+    async def deposit(self, uid: int, amount: float) -> None:
+        """Deposit money."""
+        pass
+    
+    @abstractmethod
+    async def transfer(self, sender: int, receiver: int, amount: float) -> None:
+        """Transfer money."""
+        pass
+    
+    @abstractmethod
+    async def check_wrapped(self, uid: int, year: int) -> Optional[str]:
+        """Check if wrapped is supported on this instance, return the URL if it is."""
+        pass
+    
+    @abstractmethod
+    async def drinks(self) -> List[Drink]:
+        """Lists all drinks."""
+        pass
+    
+    @abstractmethod
+    async def modify_drink(self, drink: Drink) -> None:
+        """Modifys an existing drink."""
+        pass
+    
+    @abstractmethod
+    async def get_drink_defaults(self) -> Drink:
+        """Gets the default settings for creating a new drink."""
+        pass
+    
+    @abstractmethod
+    async def create_drink(self, drink: Drink) -> Drink:
+        """Creates a new drink."""
+        pass
+    
+    @abstractmethod
+    async def delete_drink(self, drink_id: int) -> None:
+        """Deletes an existing drink."""
+        pass
+    
+    @abstractmethod
+    async def barcodes(self) -> List[Barcode]:
+        """Lists all barcodes."""
+        pass
+    
+    @abstractmethod
+    async def get_barcode_defaults(self) -> Barcode:
+        """Get the defaults for creating new barcodes."""
+        pass
+    
+    @abstractmethod
+    async def create_barcode(self, barcode: Barcode) -> Barcode:
+        """Creates a new barcode."""
+        pass
+    
+    @abstractmethod
+    async def delete_barcode(self, barcode_id: int) -> None:
+        """Delete a barcode."""
+        pass
+    
+    @abstractmethod
+    async def try_connect(self, quiet: bool = False) -> bool:
+        """Tries to connect to the server."""
+        pass
+    
+    @abstractmethod
+    def api_version(self) -> ApiVersion:
+        """Get the API version."""
+        pass
+
+
+class ThreadedConnection(AsyncConnection):
+    """Runs the calls of a (blocking) `Connection` in the event loop's executor.
+
+    This works the same for all API versions, because the actual requests
+    are still made by ApiV1, ApiV2 or ApiV3 and they share one session."""
+    def __init__(self, conn: Connection) -> None:
+        self._conn = conn
+    
+    def sync(self) -> Connection:
+        """Get the underlying blocking connection."""
+        return self._conn
+    
+    async def _run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+    
+    def base_url(self) -> str:
+        """Get the base URL."""
+        return self._conn.base_url()
+    
+    async def server_info(self) -> ServerInfo:
+        """Get information about the server."""
+        return await self._run(self._conn.server_info)
+    
+    async def users(self) -> List[User]:
+        """Lists all users."""
+        return await self._run(self._conn.users)
+    
+    async def audits(
+        self, user: Optional[int] = None, from_date: Optional[date] = None,
+        to_date: Optional[date] = None, stream: bool = False,
+        shard: Optional[str] = None, parallel: int = DEFAULT_PARALLEL,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits.
+        
+        If stream is set, they are decoded while they're being read
+        (which blocks). If shard is set, the range is split up and the parts
+        are fetched concurrently (at most parallel at a time)."""
+        return await self._run(
+            self._conn.audits, user=user, from_date=from_date, to_date=to_date,
+            stream=stream, shard=shard, parallel=parallel,
+        )
+    
+    async def get_user(self, uid: int) -> User:
+        """Get information about a user."""
+        return await self._run(self._conn.get_user, uid)
+    
+    async def modify_user(self, user: User) -> None:
+        """Modifys an existing user."""
+        await self._run(self._conn.modify_user, user)
+    
+    async def delete_user(self, uid: int) -> None:
+        await self._run(self._conn.delete_user, uid)
+    
+    async def get_user_defaults(self) -> User:
+        """Gets the default settings for creating a new user."""
+        return await self._run(self._conn.get_user_defaults)
+    
+    async def add_user(self, user: User) -> User:
+        """Creates a new user."""
+        return await self._run(self._conn.add_user, user)
+    
+    async def buy(self, uid: int, did: int) -> None:
+        """Buy a drink."""
+        await self._run(self._conn.buy, uid, did)
+    
+    async def pay(self, uid: int, amount: float) -> None:
+        """Pay an amount."""
+        await self._run(self._conn.pay, uid, amount)
+    
+    async def deposit(self, uid: int, amount: float) -> None:
+        """Deposit money."""
+        await self._run(self._conn.deposit, uid, amount)
+    
+    async def transfer(self, sender: int, receiver: int, amount: float) -> None:
+        """Transfer money."""
+        await self._run(self._conn.transfer, sender, receiver, amount)
+    
+    async def check_wrapped(self, uid: int, year: int) -> Optional[str]:
+        """Check if wrapped is supported on this instance, return the URL if it is."""
+        return await self._run(self._conn.check_wrapped, uid, year)
+    
+    async def drinks(self) -> List[Drink]:
+        """Lists all drinks."""
+        return await self._run(self._conn.drinks)
+    
+    async def modify_drink(self, drink: Drink) -> None:
+        """Modifys an existing drink."""
+        await self._run(self._conn.modify_drink, drink)
+    
+    async def get_drink_defaults(self) -> Drink:
+        """Gets the default settings for creating a new drink."""
+        return await self._run(self._conn.get_drink_defaults)
+    
+    async def create_drink(self, drink: Drink) -> Drink:
+        """Creates a new drink."""
+        return await self._run(self._conn.create_drink, drink)
+    
+    async def delete_drink(self, drink_id: int) -> None:
+        """Deletes an existing drink."""
+        await self._run(self._conn.delete_drink, drink_id)
+    
+    async def barcodes(self) -> List[Barcode]:
+        """Lists all barcodes."""
+        return await self._run(self._conn.barcodes)
+    
+    async def get_barcode_defaults(self) -> Barcode:
+        """Get the defaults for creating new barcodes."""
+        return await self._run(self._conn.get_barcode_defaults)
+    
+    async def create_barcode(self, barcode: Barcode) -> Barcode:
+        """Creates a new barcode."""
+        return await self._run(self._conn.create_barcode, barcode)
+    
+    async def delete_barcode(self, barcode_id: int) -> None:
+        """Delete a barcode."""
+        await self._run(self._conn.delete_barcode, barcode_id)
+    
+    async def try_connect(self, quiet: bool = False) -> bool:
+        """Tries to connect to the server."""
+        return await self._run(self._conn.try_connect, quiet=quiet)
+    
+    def api_version(self) -> ApiVersion:
+        """Get the API version."""
+        return self._conn.api_version()
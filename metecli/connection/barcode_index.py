@@ -0,0 +1,114 @@
+from .models import Barcode
+
+from contextlib import suppress
+from time import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import json
+import os
+import tempfile
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class BarcodeIndex:
+    """Maps barcodes to drinks (and drinks to their barcodes).
+
+    If a path is given, the index is persisted there between runs."""
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path
+        self._drinks: Dict[str, Optional[int]] = dict()
+        self._barcodes: Dict[Optional[int], Set[str]] = dict()
+        self.updated_at: Optional[float] = None
+        self._load()
+
+    def _load(self) -> None:
+        if not self._path:
+            return
+        try:
+            with open(self._path, "rt") as index_file:
+                data = json.load(index_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            log.warn("Ignoring broken barcode index: %s", exc)
+            return
+        for barcode, drink in data["barcodes"].items():
+            self._set(barcode, drink)
+        self.updated_at = data["updated_at"]
+
+    def save(self) -> None:
+        if not self._path:
+            return
+        data = {"updated_at": self.updated_at, "barcodes": self._drinks}
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self._path), suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "wt") as tmp_file:
+                json.dump(data, tmp_file)
+            os.replace(tmp_path, self._path)
+        except:
+            with suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+    def _set(self, barcode: str, drink: Optional[int]) -> None:
+        self._unset(barcode)
+        self._drinks[barcode] = drink
+        self._barcodes.setdefault(drink, set()).add(barcode)
+
+    def _unset(self, barcode: str) -> None:
+        if barcode in self._drinks:
+            drink = self._drinks.pop(barcode)
+            self._barcodes[drink].discard(barcode)
+            if not self._barcodes[drink]:
+                del self._barcodes[drink]
+
+    def is_stale(self, max_age: float) -> bool:
+        """Whether the index should be compared with the server again."""
+        return self.updated_at is None or time() - self.updated_at >= max_age
+
+    def lookup(self, barcode: str) -> Optional[int]:
+        """Get the id of the drink with this barcode."""
+        return self._drinks.get(barcode)
+
+    def barcodes_for(self, drink: int) -> List[str]:
+        """Get all barcodes of this drink."""
+        return sorted(self._barcodes.get(drink, ()))
+
+    def update(self, barcodes: Iterable[Barcode]) -> None:
+        """Apply the differences to a full list of barcodes."""
+        current = {barcode.id: barcode.drink for barcode in barcodes}
+        removed = [b for b in self._drinks if b not in current]
+        changed = [
+            b for b, drink in current.items()
+            if b not in self._drinks or self._drinks[b] != drink
+        ]
+        for barcode in removed:
+            self._unset(barcode)
+        for barcode in changed:
+            self._set(barcode, current[barcode])
+        log.debug(
+            "Updated barcode index: %d changed, %d removed.",
+            len(changed), len(removed),
+        )
+        self.updated_at = time()
+        self.save()
+
+    def add(self, barcode: Barcode) -> None:
+        """Record a new barcode."""
+        self._set(barcode.id, barcode.drink)
+        self.save()
+
+    def remove(self, barcode: str) -> None:
+        """Forget a barcode."""
+        self._unset(barcode)
+        self.save()
+
+    def remove_drink(self, drink: int) -> None:
+        """Forget all barcodes of a drink."""
+        for barcode in self.barcodes_for(drink):
+            self._unset(barcode)
+        self.save()
@@ -0,0 +1,106 @@
+from hashlib import sha1
+from time import time
+from typing import Any, Dict, NamedTuple, Optional
+from contextlib import suppress
+
+import json
+import os
+import tempfile
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    body: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+    
+    def is_fresh(self, max_age: float) -> bool:
+        """Whether this entry may be used without asking the server."""
+        return time() - self.stored_at < max_age
+    
+    def validators(self) -> Dict[str, str]:
+        """Get the headers for revalidating this entry."""
+        headers = dict()
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """A disk-backed cache for responses, keyed by their URL."""
+    def __init__(self, path: str, max_age: float) -> None:
+        self._path = path
+        self.max_age = max_age
+        os.makedirs(path, exist_ok=True)
+    
+    def path_for(self, name: str) -> str:
+        """Get a path for storing other things next to the responses."""
+        return os.path.join(self._path, name)
+    
+    def _file_for(self, url: str) -> str:
+        return os.path.join(
+            self._path, "{}.json".format(sha1(url.encode()).hexdigest()),
+        )
+    
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Get the cached entry for this URL (if there is one)."""
+        try:
+            with open(self._file_for(url), "rt") as cache_file:
+                data = json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            log.warn("Ignoring broken cache entry for %s: %s", url, exc)
+            return None
+        if data.get("url") != url:
+            return None
+        return CacheEntry(
+            body=data["body"], etag=data["etag"],
+            last_modified=data["last_modified"], stored_at=data["stored_at"],
+        )
+    
+    def put(
+        self, url: str, body: Any, etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Store a response."""
+        data = {
+            "url": url,
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": time(),
+        }
+        # write to a temporary file first, so that concurrent readers
+        # never see half-written entries
+        fd, tmp_path = tempfile.mkstemp(dir=self._path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wt") as tmp_file:
+                json.dump(data, tmp_file)
+            os.replace(tmp_path, self._file_for(url))
+        except:
+            with suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+    
+    def refresh(self, url: str, entry: CacheEntry) -> None:
+        """Mark an entry as fresh again, after it has been revalidated."""
+        self.put(url, entry.body, entry.etag, entry.last_modified)
+    
+    def invalidate(self, url: str) -> None:
+        """Drop the entry for this URL."""
+        log.debug("Invalidating cache entry for %s.", url)
+        with suppress(FileNotFoundError):
+            os.remove(self._file_for(url))
+    
+    def clear(self) -> None:
+        """Drop all entries."""
+        for name in os.listdir(self._path):
+            if name.endswith(".json"):
+                with suppress(FileNotFoundError):
+                    os.remove(os.path.join(self._path, name))
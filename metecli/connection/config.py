@@ -3,6 +3,12 @@ from typing import Any, Dict, Callable
 DEFAULT_SETTINGS = {
     "base_url": None,
     "api_version": None,
+    "upgrade_probe": {
+        "last_probed": None,
+        "succeeded": None,
+        "interval": 7 * 24 * 60 * 60,
+    },
+    "capabilities": None,
 }
 
 
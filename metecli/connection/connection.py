@@ -1,21 +1,122 @@
+from .barcode_index import BarcodeIndex
+from .cache import ResponseCache
 from .config import Config
-from .models import ApiVersion, AuditInfo, Barcode, Drink, ServerInfo, User
+from ..index import Entity, EntityIndex
+from .models import (
+    ApiVersion, AuditColumns, AuditInfo, AuditStream, Barcode, Drink,
+    ServerInfo, User,
+)
 
 from abc import ABCMeta, abstractmethod
-from requests import Session
-from datetime import date
-from typing import Optional, List, Dict, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from threading import Lock
+from typing import (
+    Any, Callable, Iterator, Optional, List, Dict, Set, Tuple, Union,
+)
 from urllib.parse import urljoin
+from time import time
+from weakref import WeakSet
 
+import atexit
+import codecs
 import logging
 log = logging.getLogger(__name__)
 
+# how much of a streamed response is read at once (in bytes)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# how many shards of audits are fetched at the same time
+DEFAULT_PARALLEL = 4
+
+# things that might not be supported by a server
+# (mapped to the method that is used for probing)
+CAPABILITIES = {
+    "server_info": "server_info",
+    "barcodes": "barcodes",
+}
+
+# how many connections per host are kept open
+# (this should be enough for all requests that are made concurrently)
+POOL_SIZE = 32
+
+# how a range of audits can be split up
+SHARDS = ("month", "week")
+
+
+def split_range(
+    from_date: date, to_date: date, shard: str,
+) -> List[Tuple[date, date]]:
+    """Split a range of days (both inclusive) into months or weeks.
+    
+    The newest part comes first (like the audits do)."""
+    ranges = list()
+    start = from_date
+    while start <= to_date:
+        if shard == "month":
+            next_start = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        elif shard == "week":
+            next_start = start + timedelta(days=7 - start.weekday())
+        else:
+            raise NotImplementedError(shard)
+        end = min(next_start - timedelta(days=1), to_date)
+        ranges.append((start, end))
+        start = next_start
+    ranges.reverse()
+    return ranges
+
+
+# all connections, so that they can report how many requests were saved
+_connections: 'WeakSet[Connection]' = WeakSet()
+
+
+@atexit.register
+def _log_requests_saved() -> None:
+    for conn in list(_connections):
+        conn._log_requests_saved()
+
+
+def new_session() -> 'Session':
+    """Create a session that can make lots of requests concurrently."""
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    sess = Session()
+    adapter = HTTPAdapter(pool_maxsize=POOL_SIZE)
+    sess.mount("http://", adapter)
+    sess.mount("https://", adapter)
+    return sess
+
 class Connection(metaclass=ABCMeta):
+    # capabilities this API version doesn't have at all
+    _unsupported: Tuple[str, ...] = tuple()
+    
+    def __init__(
+        self, sess: 'Session', conf: Optional['Config'], base_url: str,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        self._sess = sess
+        self._conf = conf
+        self._base_url = base_url
+        self._cache = cache
+        self._barcode_index = BarcodeIndex(
+            cache.path_for("barcodes.index") if cache else None
+        )
+        # responses of this run, so that identical GETs are only sent once
+        self._memo: Dict[Tuple[str, Tuple], Future] = dict()
+        self._memo_lock = Lock()
+        self._requests_saved = 0
+        # the collections fetched so far (they can be refreshed)
+        self._collections: Set[str] = set()
+        # incremented on every write, so that refreshes don't overwrite it
+        self._generation = 0
+        _connections.add(self)
+    
     @classmethod
     def new(
-        cls, config: Optional['Config'], base_url: Optional[str] = None
-    ) -> None:
-        sess = Session()
+        cls, config: Optional['Config'], base_url: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+    ) -> 'Connection':
+        sess = new_session()
         if config and not base_url:
             if not config["base_url"]:
                 raise Exception("The connection is not configured yet.")
@@ -27,15 +128,22 @@ class Connection(metaclass=ABCMeta):
             api_version = cls.determine_api_version(base_url)
         else:
             raise Exception("Either config *or* base_url must be provided.")
+        return cls._create(sess, config, base_url, api_version, cache)
+    
+    @classmethod
+    def _create(
+        cls, sess: 'Session', config: Optional['Config'], base_url: str,
+        api_version: ApiVersion, cache: Optional[ResponseCache] = None,
+    ) -> 'Connection':
         if api_version in ("legacy", "v1"):
             from .apis import ApiV1
-            return ApiV1(sess, config, base_url, api_version)
+            return ApiV1(sess, config, base_url, api_version, cache)
         elif api_version == "v2":
             from .apis import ApiV2
-            return ApiV2(sess, config, base_url)
+            return ApiV2(sess, config, base_url, cache)
         elif api_version == "v3":
             from .apis import ApiV3
-            return ApiV3(sess, config, base_url)
+            return ApiV3(sess, config, base_url, cache)
         else:
             raise NotImplementedError("This API version is not supported (yet).")
     
@@ -43,6 +151,184 @@ class Connection(metaclass=ABCMeta):
         """Get the base URL."""
         return self._base_url
     
+    def _memoized(self, key: Tuple[str, Tuple], fetch: Callable[[], Any]) -> Any:
+        """Run fetch only once per key, even if it's requested concurrently."""
+        with self._memo_lock:
+            future = self._memo.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._memo[key] = future
+            else:
+                self._requests_saved += 1
+        if is_owner:
+            try:
+                future.set_result(fetch())
+            except BaseException as exc:
+                # don't remember failures
+                with self._memo_lock:
+                    if self._memo.get(key) is future:
+                        del self._memo[key]
+                future.set_exception(exc)
+        else:
+            log.debug("Reusing the response for %s.", key[0])
+        return future.result()
+    
+    def _get_json(
+        self, url: str, params: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """GET something and return the decoded body.
+        
+        Identical requests are only sent once per run."""
+        def fetch() -> Any:
+            r = self._sess.get(url, params=params)
+            r.raise_for_status()
+            return r.json()
+        key = (url, tuple(sorted(params.items())) if params else tuple())
+        return self._memoized(key, fetch)
+    
+    def _get_stream(
+        self, url: str, params: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """GET something and return the body piece by piece.
+        
+        The request is sent right away, but the body is only downloaded
+        while it's being read. (This isn't memoized.)"""
+        r = self._sess.get(url, params=params, stream=True)
+        r.raise_for_status()
+        decoder = codecs.getincrementaldecoder(r.encoding or "utf-8")()
+        
+        def read() -> Iterator[str]:
+            with r:
+                for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                    yield decoder.decode(chunk)
+                yield decoder.decode(b"", final=True)
+        
+        return read()
+    
+    def _get_cached(self, url: str, refresh: bool = False) -> Any:
+        """GET a rarely changing collection and return the decoded body.
+        
+        If there is a cache, fresh entries are used without asking the server
+        and stale ones are revalidated. If refresh is set, the response of
+        this run is dropped and even a fresh entry is revalidated."""
+        self._collections.add(url)
+        key = (url, tuple())
+        if refresh:
+            with self._memo_lock:
+                self._generation += 1
+                # (this includes the index)
+                self._forget_collection(url)
+        return self._memoized(
+            key, lambda: self._fetch_cached(url, revalidate=refresh),
+        )
+    
+    def _get_index(
+        self, url: str, parse: Callable[[Any], Entity], refresh: bool = False,
+    ) -> EntityIndex[Entity]:
+        """Get the lookup tables for a collection (see _get_cached).
+        
+        They're only built once per response and forgotten with it."""
+        if refresh:
+            self._get_cached(url, refresh=True)
+        return self._memoized((url, ("index",)), lambda: EntityIndex(
+            parse(thing) for thing in self._get_cached(url)
+        ))
+    
+    def _forget_collection(self, url: str) -> None:
+        # (the lock has to be held)
+        for key in list(self._memo):
+            if key[0] == url:
+                del self._memo[key]
+    
+    def _fetch_cached(self, url: str, revalidate: bool = False) -> Any:
+        if not self._cache:
+            r = self._sess.get(url)
+            r.raise_for_status()
+            return r.json()
+        entry = self._cache.get(url)
+        if (
+            not revalidate and entry and entry.is_fresh(self._cache.max_age)
+        ):
+            log.debug("Using cached response for %s.", url)
+            return entry.body
+        from requests.exceptions import ConnectionError, Timeout
+        try:
+            r = self._sess.get(
+                url, headers=entry.validators() if entry else dict(),
+            )
+        except (ConnectionError, Timeout) as exc:
+            if not entry:
+                raise
+            # better outdated than nothing (e.g. for buying while offline)
+            log.warn(
+                "Couldn't reach the server, using the cached %s: %s", url, exc,
+            )
+            return entry.body
+        if r.status_code == 304 and entry:
+            log.debug("Cached response for %s is still valid.", url)
+            self._cache.refresh(url, entry)
+            return entry.body
+        r.raise_for_status()
+        body = r.json()
+        self._cache.put(
+            url, body, r.headers.get("ETag"), r.headers.get("Last-Modified"),
+        )
+        return body
+    
+    def _invalidate(self, *urls: str) -> None:
+        """Drop cached responses that are affected by a write.
+        
+        This also forgets all responses of this run for these resources,
+        e.g. 'users.json' covers 'users/1.json'."""
+        for url in urls:
+            if self._cache:
+                self._cache.invalidate(url)
+            resource = url[:-len(".json")] if url.endswith(".json") else url
+            with self._memo_lock:
+                self._generation += 1
+                for key in list(self._memo):
+                    if key[0].startswith(resource):
+                        del self._memo[key]
+    
+    def forget(self, keep_collections: bool = False) -> None:
+        """Forget all responses of this run.
+        
+        If keep_collections is set, users, drinks, etc. are kept."""
+        self._log_requests_saved()
+        with self._memo_lock:
+            for key in list(self._memo):
+                if not keep_collections or key[0] not in self._collections:
+                    del self._memo[key]
+            self._requests_saved = 0
+    
+    def refresh(self) -> None:
+        """Fetch all collections used so far again in the background.
+        
+        Until the new responses have arrived, the old ones are used."""
+        for url in list(self._collections):
+            with self._memo_lock:
+                generation = self._generation
+            try:
+                body = self._fetch_cached(url)
+            except Exception as exc:
+                log.debug("Couldn't refresh %s: %s", url, exc)
+                continue
+            future: Future = Future()
+            future.set_result(body)
+            with self._memo_lock:
+                if self._generation != generation:
+                    # there was a write in between, this might be outdated
+                    continue
+                self._forget_collection(url)
+                self._memo[(url, tuple())] = future
+    
+    def _log_requests_saved(self) -> None:
+        if self._requests_saved:
+            log.debug(
+                "Saved %d requests by reusing responses.", self._requests_saved,
+            )
+    
     @abstractmethod
     def server_info(self) -> ServerInfo:
         """Get information about the server."""
@@ -54,11 +340,56 @@ class Connection(metaclass=ABCMeta):
         pass
     
     @abstractmethod
+    def users_index(self) -> EntityIndex[User]:
+        """Get the lookup tables for all users."""
+        pass
+    
     def audits(
         self, user: Optional[int] = None, from_date: Optional[date] = None,
-        to_date: Optional[date] = None,
+        to_date: Optional[date] = None, stream: bool = False,
+        shard: Optional[str] = None, parallel: int = DEFAULT_PARALLEL,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits.
+        
+        If stream is set, they are decoded while they're being read.
+        If shard ("month" or "week") is set, the range is split up and the
+        parts are fetched concurrently (at most parallel at a time);
+        the result is never streamed then."""
+        if shard and not from_date:
+            log.warn("Audits can only be sharded if from_date is given.")
+        elif shard:
+            return self._audits_sharded(
+                user, from_date, to_date or date.today(), shard, parallel,
+            )
+        return self._audits(user, from_date, to_date, stream)
+    
+    def _audits_sharded(
+        self, user: Optional[int], from_date: date, to_date: date,
+        shard: str, parallel: int,
     ) -> AuditInfo:
-        """Get audits."""
+        ranges = split_range(from_date, to_date, shard)
+        log.debug(
+            "Fetching audits in %d shards (%d at a time).",
+            len(ranges), parallel,
+        )
+        
+        def fetch(dates: Tuple[date, date]) -> AuditColumns:
+            return self._audits(user, dates[0], dates[1]).columns
+        
+        with ThreadPoolExecutor(max_workers=max(parallel, 1)) as executor:
+            parts = list(executor.map(fetch, ranges))
+        columns = AuditColumns.merge(parts)
+        return AuditInfo(
+            columns.total() / 100, columns.payments_total() / 100,
+            columns.deposits_total() / 100, columns=columns,
+        )
+    
+    @abstractmethod
+    def _audits(
+        self, user: Optional[int] = None, from_date: Optional[date] = None,
+        to_date: Optional[date] = None, stream: bool = False,
+    ) -> Union[AuditInfo, AuditStream]:
+        """Get audits with one request."""
         pass
     
     @abstractmethod
@@ -105,6 +436,15 @@ class Connection(metaclass=ABCMeta):
         """Transfer money."""
         pass
     
+    def transfer_steps(
+        self, sender: int, receiver: int, amount: float,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """The requests a transfer consists of (the names of the methods that
+        make them and their arguments)."""
+        return [
+            ("transfer", dict(sender=sender, receiver=receiver, amount=amount)),
+        ]
+    
     def check_wrapped(self, uid: int, year: int) -> Optional[str]:
         """Check if wrapped is supported on this instance, return the URL if it is."""
         url = urljoin(
@@ -117,10 +457,17 @@ class Connection(metaclass=ABCMeta):
             return url
         else:
             return None
-
+    
     @abstractmethod
-    def drinks(self) -> List[Drink]:
-        """Lists all drinks."""
+    def drinks(self, refresh: bool = False) -> List[Drink]:
+        """Lists all drinks.
+        
+        If refresh is set, the server is asked again."""
+        pass
+    
+    @abstractmethod
+    def drinks_index(self, refresh: bool = False) -> EntityIndex[Drink]:
+        """Get the lookup tables for all drinks."""
         pass
     
     @abstractmethod
@@ -144,10 +491,48 @@ class Connection(metaclass=ABCMeta):
         pass
     
     @abstractmethod
-    def barcodes(self) -> List[Barcode]:
-        """Lists all barcodes."""
+    def barcodes(self, refresh: bool = False) -> List[Barcode]:
+        """Lists all barcodes.
+        
+        If refresh is set, the server is asked again."""
         pass
     
+    def drink_for_barcode(self, barcode: str) -> Optional[int]:
+        """Get the id of the drink with this barcode.
+        
+        The server is only asked if the barcode isn't in the index yet,
+        if the index is outdated or if the drink doesn't exist anymore."""
+        self.update_barcode_index()
+        drink = self._barcode_index.lookup(barcode)
+        if drink is not None and self._has_drink(drink):
+            return drink
+        log.debug("Barcode %s is unknown or outdated, refreshing.", barcode)
+        self.update_barcode_index(force=True)
+        drink = self._barcode_index.lookup(barcode)
+        if drink is not None and self._has_drink(drink, refresh=True):
+            return drink
+        return None
+    
+    def _has_drink(self, drink_id: int, refresh: bool = False) -> bool:
+        return self.drinks_index(refresh).find_by_id(drink_id) is not None
+    
+    def update_barcode_index(self, force: bool = False) -> None:
+        """Compare the barcode index with the server (if it's outdated)."""
+        if self._cache:
+            stale = self._barcode_index.is_stale(self._cache.max_age)
+        else:
+            # there's nothing to compare with but the responses of this run
+            stale = self._barcode_index.updated_at is None
+        if force or stale:
+            self._barcode_index.update(
+                self.barcodes(refresh=force or bool(self._cache))
+            )
+    
+    def barcodes_for_drink(self, drink_id: int) -> List[str]:
+        """Get all barcodes of a drink."""
+        self.update_barcode_index()
+        return self._barcode_index.barcodes_for(drink_id)
+    
     @abstractmethod
     def get_barcode_defaults(self) -> Barcode:
         """Get the defaults for creating new barcodes."""
@@ -164,10 +549,75 @@ class Connection(metaclass=ABCMeta):
         pass
     
     @abstractmethod
-    def try_connect(self) -> bool:
+    def try_connect(self, quiet: bool = False) -> bool:
         """Tries to connect to the server."""
         pass
     
+    @classmethod
+    def probe(cls, base_url: str) -> Optional['Connection']:
+        """Tries all API versions at once and returns the newest one that works."""
+        root_url = cls.root_url(base_url)
+        candidates: List[Tuple[ApiVersion, str]] = [
+            (api_version, urljoin(root_url, "api/{}/".format(api_version)))
+            for api_version in ("v3", "v2", "v1")
+        ]
+        candidates.append(("legacy", root_url))
+        sess = new_session()
+        
+        def try_candidate(candidate: Tuple[ApiVersion, str]) -> Optional['Connection']:
+            api_version, url = candidate
+            conn = cls._create(sess, None, url, api_version)
+            if conn.try_connect(quiet=True):
+                return conn
+            log.debug("API version %s is not available at %s.", api_version, url)
+            return None
+        
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            results = list(executor.map(try_candidate, candidates))
+        for conn in results:
+            if conn:
+                log.info(
+                    "Found API version %s at %s.",
+                    conn.api_version(), conn.base_url(),
+                )
+                return conn
+        return None
+    
+    def probe_capabilities(self) -> Dict[str, bool]:
+        """Finds out which of the optional endpoints the server supports."""
+        def try_capability(capability: str) -> bool:
+            if capability in self._unsupported:
+                return False
+            try:
+                getattr(self, CAPABILITIES[capability])()
+                return True
+            except Exception as exc:
+                log.debug("%s is not supported: %s", capability, exc)
+                return False
+        
+        with ThreadPoolExecutor(max_workers=len(CAPABILITIES)) as executor:
+            results = list(executor.map(try_capability, CAPABILITIES))
+        capabilities = dict(zip(CAPABILITIES, results))
+        log.debug("Capabilities: %s", capabilities)
+        return capabilities
+    
+    def supports(self, capability: str) -> bool:
+        """Check whether the server supports something (without asking it)."""
+        if capability in self._unsupported:
+            return False
+        if self._conf and self._conf["capabilities"] is not None:
+            return self._conf["capabilities"].get(capability, True)
+        return True
+    
+    @classmethod
+    def root_url(cls, base_url: str) -> str:
+        """Strips the API version from an URL."""
+        for api_version in ("v1", "v2", "v3"):
+            marker = "api/{}".format(api_version)
+            if marker in base_url:
+                return base_url[:base_url.index(marker)]
+        return base_url
+    
     @classmethod
     def determine_api_version(cls, base_url: str) -> ApiVersion:
         """Tries to determine the API version."""
@@ -185,16 +635,36 @@ class Connection(metaclass=ABCMeta):
         """Get the API version."""
         pass
     
-    def try_upgrade(self) -> 'Connection':
-        """Tries to upgrade the API version."""
+    def try_upgrade(self, force: bool = False) -> 'Connection':
+        """Tries to upgrade the API version.
+        
+        The result is stored in the config, so that the server is only probed
+        again after the configured interval (or if force is set)."""
+        if not self._can_upgrade():
+            return self
+        if self._conf and not force:
+            probe = self._conf["upgrade_probe"]
+            if probe["last_probed"] and time() - probe["last_probed"] < probe["interval"]:
+                log.debug(
+                    "The last upgrade probe was at %s, not trying again yet.",
+                    probe["last_probed"],
+                )
+                return self
         changed, new_conn = self._try_upgrade()
-        if changed and self._conf:
-            # save the new values
-            self._conf["api_version"] = self.api_version()
-            self._conf["base_url"] = self._base_url
+        if self._conf:
+            if changed:
+                # save the new values
+                self._conf["api_version"] = self.api_version()
+                self._conf["base_url"] = self._base_url
+            self._conf["upgrade_probe"]["last_probed"] = time()
+            self._conf["upgrade_probe"]["succeeded"] = changed
             self._conf.save()
         return new_conn
     
+    def _can_upgrade(self) -> bool:
+        """Whether there is a newer API version worth probing for."""
+        return False
+    
     @abstractmethod
     def _try_upgrade(self) -> Tuple[bool, 'Connection']:
         """Try to upgrade the API version.
@@ -0,0 +1,94 @@
+from typing import Any, Iterable, Iterator, Tuple
+
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# what might still belong to a number that has been decoded
+NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+
+class _Reader():
+    """Decodes JSON values from text that arrives piece by piece."""
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = ""
+        self._pos = 0
+        self._decode = json.JSONDecoder().raw_decode
+    
+    def _more(self) -> bool:
+        """Read the next chunk (and drop what has already been decoded)."""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+    
+    def peek(self) -> str:
+        """Skip whitespace and get the next character."""
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._more():
+                raise ValueError("The JSON document ended unexpectedly.")
+    
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(
+                "Expected '{}' but got '{}' in the JSON document.".format(
+                    char, found,
+                )
+            )
+        self._pos += 1
+    
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # the value might not be complete yet
+                if not self._more():
+                    raise
+                continue
+            # a number at the end of the buffer might go on in the next chunk
+            if (
+                isinstance(value, (int, float))
+                and NUMBER_TAIL.match(self._buffer, end).end() == len(self._buffer)
+                and self._more()
+            ):
+                continue
+            self._pos = end
+            return value
+
+
+def iter_members(chunks: Iterable[str], array: str) -> Iterator[Tuple[str, Any]]:
+    """Decode a JSON object incrementally.
+
+    This yields (key, value) for every member of the object; the elements
+    of the array with the key `array` are yielded one by one instead."""
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == array and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() != "]":
+                while True:
+                    yield key, reader.value()
+                    if reader.peek() != ",":
+                        break
+                    reader.expect(",")
+            reader.expect("]")
+        else:
+            yield key, reader.value()
+        if reader.peek() != ",":
+            break
+        reader.expect(",")
+    reader.expect("}")
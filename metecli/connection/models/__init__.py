@@ -1,6 +1,7 @@
 from typing import Literal
 
-from .audit import Audit, AuditInfo
+from .audit import Audit, AuditInfo, AuditStream
+from .audit_columns import AuditColumns
 from .barcode import Barcode
 from .drink import Drink
 from .server_info import ServerInfo
@@ -1,29 +1,41 @@
-from typing import Dict, Any
+# from .audit_columns import AuditColumns (moved to bottom)
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 # dataclasses are only supported on Python >= 3.7
 
 
 class Audit:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    # no __dict__, there might be lots of them
+    __slots__ = ("id", "created_at", "difference", "drink")
+    
+    def __init__(
+        self, id: Optional[int] = None, created_at: Optional[str] = None,
+        difference: Optional[float] = None, drink: Optional[int] = None,
+    ) -> None:
+        self.id = id
+        self.created_at = created_at
+        self.difference = difference
+        self.drink = drink
     
     @classmethod
     def from_v1(cls, data: Dict[str, Any]) -> 'Audit':
+        drink = data["drink"]
         return cls(
-            id=int(data["id"]),
+            int(data["id"]),
             # TODO: turn this into datetime?
-            created_at=str(data["created_at"]),
-            difference=float(data["difference"]),
-            drink=int(data["drink"]) if data["drink"] is not None else None,
+            str(data["created_at"]),
+            float(data["difference"]),
+            int(drink) if drink is not None else None,
         )
     
     @classmethod
     def from_v2(cls, data: Dict[str, Any]) -> 'Audit':
+        drink = data["product"]
         return cls(
-            id=int(data["id"]),
+            int(data["id"]),
             # TODO: turn this into datetime?
-            created_at=str(data["created_at"]),
-            difference=int(data["difference"]) / 100,
-            drink=int(data["product"]) if data["product"] is not None else None,
+            str(data["created_at"]),
+            int(data["difference"]) / 100,
+            int(drink) if drink is not None else None,
         )
     
     @classmethod
@@ -31,31 +43,50 @@ class Audit:
         return cls.from_v2(data)
     
     def __repr__(self) -> str:
-        return "Audit({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
-        )
+        return "Audit({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
 
 
 class AuditInfo:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    __slots__ = ("sum", "payments_sum", "deposits_sum", "columns")
+    
+    def __init__(
+        self, sum: Optional[float] = None,
+        payments_sum: Optional[float] = None,
+        deposits_sum: Optional[float] = None,
+        audits: Optional[Iterable[Audit]] = None,
+        columns: Optional['AuditColumns'] = None,
+    ) -> None:
+        self.sum = sum
+        self.payments_sum = payments_sum
+        self.deposits_sum = deposits_sum
+        if columns is None:
+            columns = AuditColumns.from_audits(audits or ())
+        self.columns = columns
+    
+    @property
+    def audits(self) -> 'AuditColumns':
+        """The audits (they're created when they're accessed)."""
+        return self.columns
     
     @classmethod
     def from_v1(cls, data: Dict[str, Any]) -> 'AuditInfo':
         return cls(
-            sum=float(data["sum"]),
-            payments_sum=float(data["payments_sum"]),
-            deposits_sum=float(data["deposits_sum"]),
-            audits=[Audit.from_v1(a) for a in data["audits"]],
+            float(data["sum"]),
+            float(data["payments_sum"]),
+            float(data["deposits_sum"]),
+            columns=AuditColumns.from_v1(data["audits"]),
         )
     
     @classmethod
     def from_v2(cls, data: Dict[str, Any]) -> 'AuditInfo':
         return cls(
-            sum=int(data["sum"]) / 100,
-            payments_sum=int(data["payments_sum"]) / 100,
-            deposits_sum=int(data["deposits_sum"]) / 100,
-            audits=[Audit.from_v2(a) for a in data["audits"]],
+            int(data["sum"]) / 100,
+            int(data["payments_sum"]) / 100,
+            int(data["deposits_sum"]) / 100,
+            columns=AuditColumns.from_v2(data["audits"]),
         )
     
     @classmethod
@@ -63,6 +94,68 @@ class AuditInfo:
         return cls.from_v2(data)
     
     def __repr__(self) -> str:
-        return "AuditInfo({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
+        return "AuditInfo({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
+
+
+class AuditStream:
+    """Audits that are decoded while they are being downloaded.
+    
+    They can only be iterated over once. The sums are set as soon as they
+    have been read; the server might send them after the audits."""
+    __slots__ = (
+        "sum", "payments_sum", "deposits_sum", "_members", "_decode",
+        "_decode_sum",
+    )
+    
+    def __init__(
+        self, members: Iterable[Tuple[str, Any]],
+        decode: Callable[[Dict[str, Any]], Audit],
+        decode_sum: Callable[[Any], float],
+    ) -> None:
+        self.sum: Optional[float] = None
+        self.payments_sum: Optional[float] = None
+        self.deposits_sum: Optional[float] = None
+        self._members = iter(members)
+        self._decode = decode
+        self._decode_sum = decode_sum
+    
+    @property
+    def audits(self) -> 'AuditStream':
+        """The audits (like AuditInfo.audits)."""
+        return self
+    
+    @classmethod
+    def from_v1(cls, members: Iterable[Tuple[str, Any]]) -> 'AuditStream':
+        return cls(members, Audit.from_v1, float)
+    
+    @classmethod
+    def from_v2(cls, members: Iterable[Tuple[str, Any]]) -> 'AuditStream':
+        return cls(members, Audit.from_v2, lambda value: int(value) / 100)
+    
+    @classmethod
+    def from_v3(cls, members: Iterable[Tuple[str, Any]]) -> 'AuditStream':
+        return cls.from_v2(members)
+    
+    def __iter__(self) -> Iterator[Audit]:
+        decode = self._decode
+        for key, value in self._members:
+            if key == "audits":
+                yield decode(value)
+            elif key in ("sum", "payments_sum", "deposits_sum"):
+                setattr(self, key, self._decode_sum(value))
+    
+    def finish(self) -> 'AuditStream':
+        """Read the rest of the response (e.g. to get the sums)."""
+        for _ in self:
+            pass
+        return self
+    
+    def __repr__(self) -> str:
+        return "AuditStream(sum={},payments_sum={},deposits_sum={})".format(
+            self.sum, self.payments_sum, self.deposits_sum,
         )
+
+from .audit_columns import AuditColumns
@@ -0,0 +1,368 @@
+from .audit import Audit
+
+from array import array
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# drink ids are stored as int32, this means "no drink"
+NO_DRINK = -1
+
+# UTC offsets are stored in minutes (as int16), this means "Z"
+ZULU = -32768
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+HOUR = 3600000
+DAY = 24 * HOUR
+
+# days since the epoch for dates seen so far ("2024-01-13" -> 19735)
+_days: Dict[str, int] = dict()
+
+# NumPy is optional (and slow to import), so it's only loaded when needed.
+_np: Any = None
+
+
+def _numpy() -> Any:
+    """Get NumPy, if it's installed."""
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+
+def parse_timestamp(value: str) -> int:
+    """Convert an ISO 8601 timestamp into milliseconds since the epoch.
+
+    Timestamps without a timezone are assumed to be in UTC."""
+    # fast path for what the servers send: 2024-01-13T10:00:00.000Z
+    if len(value) == 24 and value[10] == "T" and value[23] == "Z":
+        day = value[:10]
+        days = _days.get(day)
+        if days is None:
+            days = (date.fromisoformat(day) - EPOCH.date()).days
+            _days[day] = days
+        return (
+            days * 86400 + int(value[11:13]) * 3600 + int(value[14:16]) * 60
+            + int(value[17:19])
+        ) * 1000 + int(value[20:23])
+    if value.endswith("Z"):
+        # fromisoformat only supports this since Python 3.11
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - EPOCH) // MILLISECOND
+
+
+def parse_offset(value: str) -> int:
+    """Get the UTC offset of an ISO 8601 timestamp in minutes.
+
+    This is ZULU for "Z" and for timestamps without a timezone."""
+    if value.endswith("Z"):
+        return ZULU
+    # fast path for what the servers send: 2024-01-13T11:00:00.000+01:00
+    if value[-6:-5] in ("+", "-") and value[-3] == ":":
+        minutes = int(value[-5:-3]) * 60 + int(value[-2:])
+        return -minutes if value[-6] == "-" else minutes
+    offset = datetime.fromisoformat(value).utcoffset()
+    return offset // timedelta(minutes=1) if offset is not None else ZULU
+
+
+def format_timestamp(value: int, offset: int = ZULU) -> str:
+    """Convert milliseconds since the epoch into an ISO 8601 timestamp
+    (with this UTC offset in minutes)."""
+    if offset == ZULU:
+        parsed = EPOCH + value * MILLISECOND
+        suffix = "Z"
+    else:
+        parsed = EPOCH + (value + offset * 60000) * MILLISECOND
+        suffix = "{}{:02d}:{:02d}".format(
+            "-" if offset < 0 else "+", abs(offset) // 60, abs(offset) % 60,
+        )
+    return "{}.{:03d}{}".format(
+        parsed.strftime("%Y-%m-%dT%H:%M:%S"), parsed.microsecond // 1000,
+        suffix,
+    )
+
+
+class AuditColumns(Sequence):
+    """Audits stored column by column.
+
+    Timestamps are milliseconds since the epoch (UTC) and the offset they
+    were sent with, differences are in cents. Indexing or iterating creates
+    Audit objects on the fly."""
+    __slots__ = ("ids", "created_at", "offsets", "differences", "drinks")
+    
+    def __init__(self) -> None:
+        self.ids = array("q")
+        self.created_at = array("q")
+        self.offsets = array("h")
+        self.differences = array("q")
+        self.drinks = array("i")
+    
+    @classmethod
+    def from_v1(cls, data: Iterable[Dict[str, Any]]) -> 'AuditColumns':
+        columns = cls()
+        ids = columns.ids.append
+        created_at = columns.created_at.append
+        offsets = columns.offsets.append
+        differences = columns.differences.append
+        drinks = columns.drinks.append
+        for audit in data:
+            drink = audit["drink"]
+            timestamp = str(audit["created_at"])
+            ids(int(audit["id"]))
+            created_at(parse_timestamp(timestamp))
+            offsets(parse_offset(timestamp))
+            differences(round(float(audit["difference"]) * 100))
+            drinks(int(drink) if drink is not None else NO_DRINK)
+        return columns
+    
+    @classmethod
+    def from_v2(cls, data: Iterable[Dict[str, Any]]) -> 'AuditColumns':
+        columns = cls()
+        ids = columns.ids.append
+        created_at = columns.created_at.append
+        offsets = columns.offsets.append
+        differences = columns.differences.append
+        drinks = columns.drinks.append
+        for audit in data:
+            drink = audit["product"]
+            timestamp = str(audit["created_at"])
+            ids(int(audit["id"]))
+            created_at(parse_timestamp(timestamp))
+            offsets(parse_offset(timestamp))
+            differences(int(audit["difference"]))
+            drinks(int(drink) if drink is not None else NO_DRINK)
+        return columns
+    
+    @classmethod
+    def from_v3(cls, data: Iterable[Dict[str, Any]]) -> 'AuditColumns':
+        return cls.from_v2(data)
+    
+    @classmethod
+    def from_audits(cls, audits: Iterable[Audit]) -> 'AuditColumns':
+        columns = cls()
+        for audit in audits:
+            columns.append(audit)
+        return columns
+    
+    @classmethod
+    def merge(cls, parts: List['AuditColumns']) -> 'AuditColumns':
+        """Combine several parts into one, without duplicates (by id).
+        
+        The result is sorted like the server does it (newest first)."""
+        columns = cls()
+        np = _numpy()
+        if np and parts:
+            ids = np.concatenate([
+                np.frombuffer(part.ids, dtype=np.int64) for part in parts
+            ])
+            created_at = np.concatenate([
+                np.frombuffer(part.created_at, dtype=np.int64)
+                for part in parts
+            ])
+            offsets = np.concatenate([
+                np.frombuffer(part.offsets, dtype=np.int16) for part in parts
+            ])
+            differences = np.concatenate([
+                np.frombuffer(part.differences, dtype=np.int64)
+                for part in parts
+            ])
+            drinks = np.concatenate([
+                np.frombuffer(part.drinks, dtype=np.int32) for part in parts
+            ])
+            _, unique = np.unique(ids, return_index=True)
+            # sorted by created_at and then by id, newest first
+            order = unique[
+                np.lexsort((ids[unique], created_at[unique]))[::-1]
+            ]
+            columns.ids.frombytes(ids[order].tobytes())
+            columns.created_at.frombytes(created_at[order].tobytes())
+            columns.offsets.frombytes(offsets[order].tobytes())
+            columns.differences.frombytes(differences[order].tobytes())
+            columns.drinks.frombytes(drinks[order].tobytes())
+            return columns
+        rows: Dict[int, Tuple[int, int, int, int, int]] = dict()
+        for part in parts:
+            for row in zip(
+                part.created_at, part.ids, part.offsets, part.differences,
+                part.drinks,
+            ):
+                rows[row[1]] = row
+        # (the offset doesn't matter for sorting, the ids are unique)
+        for created_at, id, offset, difference, drink in sorted(
+            rows.values(), reverse=True,
+        ):
+            columns.ids.append(id)
+            columns.created_at.append(created_at)
+            columns.offsets.append(offset)
+            columns.differences.append(difference)
+            columns.drinks.append(drink)
+        return columns
+    
+    def extend(self, other: 'AuditColumns') -> None:
+        """Append all audits of another AuditColumns."""
+        self.ids.extend(other.ids)
+        self.created_at.extend(other.created_at)
+        self.offsets.extend(other.offsets)
+        self.differences.extend(other.differences)
+        self.drinks.extend(other.drinks)
+    
+    def append(self, audit: Audit) -> None:
+        self.ids.append(audit.id)
+        self.created_at.append(parse_timestamp(audit.created_at))
+        self.offsets.append(parse_offset(audit.created_at))
+        self.differences.append(round(audit.difference * 100))
+        self.drinks.append(
+            audit.drink if audit.drink is not None else NO_DRINK
+        )
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def _row(self, i: int) -> Audit:
+        drink = self.drinks[i]
+        return Audit(
+            self.ids[i],
+            format_timestamp(self.created_at[i], self.offsets[i]),
+            self.differences[i] / 100, drink if drink != NO_DRINK else None,
+        )
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("audit index out of range")
+        return self._row(index)
+    
+    def __iter__(self) -> Iterator[Audit]:
+        for i in range(len(self)):
+            yield self._row(i)
+    
+    def __repr__(self) -> str:
+        return "AuditColumns({} audits)".format(len(self))
+    
+    def total(self) -> int:
+        """The sum of all differences (in cents)."""
+        np = _numpy()
+        if np:
+            return int(np.frombuffer(self.differences, dtype=np.int64).sum())
+        return sum(self.differences)
+    
+    def payments_total(self) -> int:
+        """The sum of all negative differences (in cents)."""
+        np = _numpy()
+        if np:
+            differences = np.frombuffer(self.differences, dtype=np.int64)
+            return int(differences[differences < 0].sum())
+        return sum(d for d in self.differences if d < 0)
+    
+    def deposits_total(self) -> int:
+        """The sum of all positive differences (in cents)."""
+        np = _numpy()
+        if np:
+            differences = np.frombuffer(self.differences, dtype=np.int64)
+            return int(differences[differences > 0].sum())
+        return sum(d for d in self.differences if d > 0)
+    
+    def local_time(self) -> Sequence:
+        """The timestamps shifted into the local timezone (still in ms).
+        
+        The offset is determined for every hour, so DST is respected."""
+        offsets: Dict[int, int] = dict()
+        
+        def offset(hour: int) -> int:
+            found = offsets.get(hour)
+            if found is None:
+                moment = EPOCH + hour * HOUR * MILLISECOND
+                found = moment.astimezone().utcoffset() // MILLISECOND
+                offsets[hour] = found
+            return found
+        
+        np = _numpy()
+        if np:
+            created_at = np.frombuffer(self.created_at, dtype=np.int64)
+            hours, inverse = np.unique(created_at // HOUR, return_inverse=True)
+            shift = np.array([offset(int(h)) for h in hours], dtype=np.int64)
+            return created_at + shift[inverse]
+        return [
+            created_at + offset(created_at // HOUR)
+            for created_at in self.created_at
+        ]
+    
+    def days(self) -> Sequence:
+        """The local day of each audit (days since the epoch)."""
+        local_time = self.local_time()
+        if _numpy():
+            return local_time // DAY
+        return [t // DAY for t in local_time]
+    
+    def hours_of_day(self) -> Sequence:
+        """The local hour of the day of each audit."""
+        local_time = self.local_time()
+        if _numpy():
+            return local_time // HOUR % 24
+        return [t // HOUR % 24 for t in local_time]
+    
+    def aggregate(self, *keys: Sequence) -> Dict[Tuple, Tuple[int, int, int]]:
+        """Count, sum up payments and deposits (in cents) per combined key.
+        
+        This is a single pass over the audits; each key has one value per
+        audit (e.g. the drinks or something computed from the timestamps)."""
+        np = _numpy()
+        if np and len(self):
+            differences = np.frombuffer(self.differences, dtype=np.int64)
+            # combine the keys into one code (that's much faster than
+            # finding unique rows)
+            values = list()
+            code = np.zeros(len(self), dtype=np.int64)
+            for key in keys:
+                key_values, key_inverse = np.unique(
+                    np.asarray(key), return_inverse=True,
+                )
+                values.append(key_values)
+                code = code * len(key_values) + key_inverse.reshape(-1)
+            codes, inverse = np.unique(code, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            length = len(codes)
+            # decode the combined codes into the original keys again
+            unique = list()
+            for key_values in reversed(values):
+                unique.insert(0, key_values[codes % len(key_values)])
+                codes = codes // len(key_values)
+            unique = np.stack(unique)
+            counts = np.bincount(inverse, minlength=length)
+            payments = np.bincount(
+                inverse, minlength=length,
+                weights=np.minimum(differences, 0),
+            )
+            deposits = np.bincount(
+                inverse, minlength=length,
+                weights=np.maximum(differences, 0),
+            )
+            return {
+                tuple(int(k) for k in unique[:, i]): (
+                    int(counts[i]), int(round(payments[i])),
+                    int(round(deposits[i])),
+                )
+                for i in range(length)
+            }
+        groups: Dict[Tuple, List[int]] = dict()
+        for key, difference in zip(zip(*keys), self.differences):
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, 0, 0]
+            group[0] += 1
+            if difference < 0:
+                group[1] += difference
+            else:
+                group[2] += difference
+        return {key: tuple(group) for key, group in groups.items()}
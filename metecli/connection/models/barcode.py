@@ -1,16 +1,22 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 # dataclasses are only supported on Python >= 3.7
 
 
 class Barcode:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    __slots__ = ("id", "drink")
+    
+    def __init__(
+        self, id: Optional[str] = None, drink: Optional[int] = None,
+    ) -> None:
+        self.id = id
+        self.drink = drink
     
     @classmethod
     def from_v1(cls, data: Dict[str, Any]) -> 'Barcode':
+        drink = data["drink"]
         return cls(
-            id=str(data["id"]),
-            drink=int(data["drink"]) if data["drink"] is not None else None,
+            str(data["id"]),
+            int(drink) if drink is not None else None,
         )
     
     def to_v1(self) -> Dict[str, Any]:
@@ -23,8 +29,8 @@ class Barcode:
     def from_v3(cls, data: Dict[str, Any]) -> 'Barcode':
         assert data["type"] == "product"  # TODO
         return cls(
-            id=str(data["barcode"]),
-            drink=int(data["linked"]),
+            str(data["barcode"]),
+            int(data["linked"]),
         )
     
     def to_v3(self) -> Dict[str, Any]:
@@ -35,6 +41,7 @@ class Barcode:
         }
     
     def __repr__(self) -> str:
-        return "Barcode({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
-        )
+        return "Barcode({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
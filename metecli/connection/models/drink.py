@@ -1,22 +1,37 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
 log = logging.getLogger(__name__)
 # dataclasses are only supported on Python >= 3.7
 
 
 class Drink:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    __slots__ = (
+        "id", "name", "bottle_size", "caffeine", "price", "active",
+    )
+    
+    def __init__(
+        self, id: Optional[int] = None, name: Optional[str] = None,
+        bottle_size: Optional[float] = None, caffeine: Optional[int] = None,
+        price: Optional[float] = None, active: Optional[bool] = None,
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.bottle_size = bottle_size
+        self.caffeine = caffeine
+        self.price = price
+        self.active = active
     
     @classmethod
     def from_v1(cls, data: Dict[str, Any]) -> 'Drink':
+        id = data["id"]
+        caffeine = data["caffeine"]
         return cls(
-            id=int(data["id"]) if data["id"] is not None else None,
-            name=str(data["name"]),
-            bottle_size=float(data["bottle_size"]),
-            caffeine=int(data["caffeine"]) if data["caffeine"] is not None else None,
-            price=float(data["price"]),
-            active=bool(data["active"]),
+            int(id) if id is not None else None,
+            str(data["name"]),
+            float(data["bottle_size"]),
+            int(caffeine) if caffeine is not None else None,
+            float(data["price"]),
+            bool(data["active"]),
         )
     
     def to_v1(self) -> Dict[str, Any]:
@@ -31,13 +46,14 @@ class Drink:
     
     @classmethod
     def from_v2(cls, data: Dict[str, Any]) -> 'Drink':
+        caffeine = data["caffeine"]
         return cls(
-            id=int(data["id"]),
-            name=str(data["name"]),
-            bottle_size=None,
-            caffeine=int(data["caffeine"]) if data["caffeine"] is not None else None,
-            price=int(data["price"]) / 100,
-            active=bool(data["active"]),
+            int(data["id"]),
+            str(data["name"]),
+            None,
+            int(caffeine) if caffeine is not None else None,
+            int(data["price"]) / 100,
+            bool(data["active"]),
         )
     
     def to_v2(self) -> Dict[str, Any]:
@@ -61,6 +77,7 @@ class Drink:
         return self.to_v2()
     
     def __repr__(self) -> str:
-        return "Drink({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
-        )
+        return "Drink({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
@@ -1,10 +1,30 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import logging
+log = logging.getLogger(__name__)
 # dataclasses are only supported on Python >= 3.7
 
 
 class ServerInfo:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    __slots__ = (
+        "version", "global_credit_limit", "currency", "currency_before",
+        "decimal_seperator", "energy", "defaults",
+    )
+    
+    def __init__(
+        self, version: Optional[str] = None,
+        global_credit_limit: Optional[int] = None,
+        currency: Optional[str] = None,
+        currency_before: Optional[bool] = None,
+        decimal_seperator: Optional[str] = None,
+        energy: Optional[str] = None, defaults: Optional['Defaults'] = None,
+    ) -> None:
+        self.version = version
+        self.global_credit_limit = global_credit_limit
+        self.currency = currency
+        self.currency_before = currency_before
+        self.decimal_seperator = decimal_seperator
+        self.energy = energy
+        self.defaults = defaults
     
     # from_v1: not supported
     
@@ -14,7 +34,7 @@ class ServerInfo:
         return cls(
             version=None, global_credit_limit=None,
             currency="€", currency_before=False, decimal_seperator=",",
-            energy="kcal", defaults=Default.from_v2(),
+            energy="kcal", defaults=Defaults.from_v2(data),
         )
     
     @classmethod
@@ -30,14 +50,24 @@ class ServerInfo:
         )
     
     def __repr__(self) -> str:
-        return "ServerInfo({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
-        )
+        return "ServerInfo({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
 
 
 class Defaults:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    __slots__ = ("price", "package_size", "caffeine", "active")
+    
+    def __init__(
+        self, price: Optional[float] = None,
+        package_size: Optional[str] = None, caffeine: Optional[int] = None,
+        active: Optional[bool] = None,
+    ) -> None:
+        self.price = price
+        self.package_size = package_size
+        self.caffeine = caffeine
+        self.active = active
     
     # from_v1: not supported
     
@@ -56,7 +86,8 @@ class Defaults:
         )
     
     def __repr__(self) -> str:
-        return "Defaults({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
-        )
+        return "Defaults({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
 
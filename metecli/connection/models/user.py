@@ -1,21 +1,38 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 # dataclasses are only supported on Python >= 3.7
 
 
 class User:
-    def __init__(self, **kwargs):
-        vars(self).update(kwargs)
+    __slots__ = (
+        "id", "name", "email", "balance", "active", "audit", "redirect",
+    )
+    
+    def __init__(
+        self, id: Optional[int] = None, name: Optional[str] = None,
+        email: Optional[str] = None, balance: Optional[float] = None,
+        active: Optional[bool] = None, audit: Optional[bool] = None,
+        redirect: Optional[bool] = None,
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.email = email
+        self.balance = balance
+        self.active = active
+        self.audit = audit
+        self.redirect = redirect
     
     @classmethod
     def from_v1(cls, data: Dict[str, Any]) -> 'User':
+        id = data["id"]
+        email = data["email"]
         return cls(
-            id=int(data["id"]) if data["id"] is not None else None,
-            name=str(data["name"]),
-            email=str(data["email"]) if data["email"] is not None else None,
-            balance=float(data["balance"]),
-            active=bool(data["active"]),
-            audit=bool(data["audit"]),
-            redirect=bool(data["redirect"]),
+            int(id) if id is not None else None,
+            str(data["name"]),
+            str(email) if email is not None else None,
+            float(data["balance"]),
+            bool(data["active"]),
+            bool(data["audit"]),
+            bool(data["redirect"]),
         )
     
     def to_v1(self) -> Dict[str, Any]:
@@ -31,14 +48,15 @@ class User:
     
     @classmethod
     def from_v2(cls, data: Dict[str, Any]) -> 'User':
+        email = data["email"]
         return cls(
-            id=int(data["id"]),
-            name=str(data["name"]),
-            email=str(data["email"]) if data["email"] is not None else None,
-            balance=int(data["balance"]) / 100,
-            active=bool(data["active"]),
-            audit=bool(data["audit"]),
-            redirect=bool(data["redirect"]),
+            int(data["id"]),
+            str(data["name"]),
+            str(email) if email is not None else None,
+            int(data["balance"]) / 100,
+            bool(data["active"]),
+            bool(data["audit"]),
+            bool(data["redirect"]),
         )
     
     def to_v2(self) -> Dict[str, Any]:
@@ -62,6 +80,7 @@ class User:
         return self.to_v2()
     
     def __repr__(self) -> str:
-        return "User({})".format(
-            ",".join(["{}={}".format(*item) for item in vars(self).items()])
-        )
+        return "User({})".format(",".join([
+            "{}={}".format(name, getattr(self, name))
+            for name in self.__slots__
+        ]))
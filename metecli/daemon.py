@@ -0,0 +1,157 @@
+from .client import check_private, socket_path
+from .config import Config
+from . import utils
+
+from contextlib import redirect_stderr, redirect_stdout, suppress
+from typing import Any, Dict, List
+
+import argparse
+import io
+import json
+import os
+import socket
+import stat
+import sys
+import traceback
+
+import logging
+log = logging.getLogger(__name__)
+
+# options that make a command run until it's stopped
+# (these are run by the client itself, so that their output shows up as it's
+# written and the daemon stays free for other commands)
+LONG_RUNNING = ("follow", "wait")
+
+
+def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
+    parser = global_subparsers.add_parser(
+        "daemon", help="keep the connection open and answer commands faster",
+    )
+    # the daemon itself can't be run by a daemon
+    parser.set_defaults(func=do, interactive=True)
+
+
+def do(args: argparse.Namespace, config: Config) -> None:
+    Daemon(args, config).serve()
+
+
+class Daemon():
+    def __init__(self, args: argparse.Namespace, config: Config) -> None:
+        self._args = args
+        self._conf = config
+        self._config_mtime = os.path.getmtime(config.config_file_path)
+        self._path = socket_path(args.config_path, args.config_name)
+        from .cmdline import build_parser
+        self._parser = build_parser()
+    
+    def serve(self) -> None:
+        directory = os.path.dirname(self._path)
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # (it might have been created by someone else)
+            check_private(directory, stat.S_IFDIR)
+        except OSError as exc:
+            print("Can't create the socket: {}".format(exc))
+            return
+        # remove a stale socket
+        with suppress(FileNotFoundError):
+            os.remove(self._path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(self._path)
+        finally:
+            os.umask(old_umask)
+        check_private(self._path, stat.S_IFSOCK)
+        server.listen()
+        log.warn("Listening on %s. Press Ctrl+C to stop.", self._path)
+        # send transactions that have been queued while offline
+        from .journal import start_flusher
+        flusher = start_flusher(self._conf)
+        try:
+            while True:
+                sock, _ = server.accept()
+                with sock:
+                    self._handle(sock)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            with suppress(FileNotFoundError):
+                os.remove(self._path)
+            if flusher:
+                flusher.stop()
+    
+    def _handle(self, sock: socket.socket) -> None:
+        try:
+            request = json.loads(sock.makefile("rb").readline().decode())
+            response = self._run(request["argv"])
+        except Exception as exc:
+            log.error("Couldn't handle request: %s", exc)
+            return
+        with suppress(OSError):
+            sock.sendall(json.dumps(response).encode() + b"\n")
+    
+    def _reload_config_if_changed(self) -> None:
+        mtime = os.path.getmtime(self._conf.config_file_path)
+        if mtime != self._config_mtime:
+            log.info("The config file has changed, reloading.")
+            self._conf = Config(
+                path=self._args.config_path, name=self._args.config_name,
+            )
+            self._config_mtime = mtime
+    
+    def _run(self, argv: List[str]) -> Dict[str, Any]:
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                args = self._parser.parse_args(argv)
+            except SystemExit as exc:
+                # --help or invalid arguments
+                return {
+                    "stdout": stdout.getvalue(), "stderr": stderr.getvalue(),
+                    "exit": exc.code or 0,
+                }
+        if (
+            getattr(args, "interactive", False)
+            and not getattr(args, "force", False)
+        ) or any(
+            getattr(args, option, False) for option in LONG_RUNNING
+        ) or (
+            args.config_path != self._args.config_path
+            or args.config_name != self._args.config_name
+        ):
+            return {"fallback": True}
+        log.info("Running: %s", argv)
+        self._reload_config_if_changed()
+        root_logger = logging.getLogger()
+        old_handlers = root_logger.handlers
+        old_level = root_logger.level
+        root_logger.handlers = [logging.StreamHandler(stderr)]
+        root_logger.handlers[0].setFormatter(
+            logging.Formatter(logging.BASIC_FORMAT)
+        )
+        exit_code = 0
+        old_stdin = sys.stdin
+        try:
+            # the client's stdin isn't available here
+            sys.stdin = io.StringIO()
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                from .cmdline import run
+                run(args, self._conf)
+        except SystemExit as exc:
+            exit_code = exc.code or 0
+        except Exception:
+            traceback.print_exc(file=stderr)
+            exit_code = 1
+        finally:
+            sys.stdin = old_stdin
+            root_logger.handlers = old_handlers
+            root_logger.setLevel(old_level)
+            # only the HTTP cache should survive between commands
+            utils.forget_responses()
+        return {
+            "stdout": stdout.getvalue(), "stderr": stderr.getvalue(),
+            "exit": exit_code,
+        }
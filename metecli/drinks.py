@@ -5,6 +5,7 @@ from .utils import (
 from .config import Config
 from .connection.connection import Connection
 from .connection.models import Drink
+from . import export
 
 from typing import Callable, Iterator
 import argparse
@@ -18,9 +19,10 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     )
     subparsers = parser.add_subparsers(help="action")
     parser_list = subparsers.add_parser("list", help="lists all drinks")
+    export.add_arguments(parser_list)
     parser_list.set_defaults(func=list_drinks)
     parser_add = subparsers.add_parser("add", help="creates a new drink")
-    parser_add.set_defaults(func=add_drink)
+    parser_add.set_defaults(func=add_drink, interactive=True)
     parser_show = subparsers.add_parser(
         "show", help="display detailed information about a drink",
     )
@@ -28,7 +30,7 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser_show.set_defaults(func=show)
     parser_modify = subparsers.add_parser("modify", help="edits a drink")
     parser_modify.add_argument("drink", help="the drink to modify")
-    parser_modify.set_defaults(func=modify)
+    parser_modify.set_defaults(func=modify, interactive=True)
     parser_barcodes = subparsers.add_parser(
         "barcodes", help="manage barcodes for this drink",
     )
@@ -56,32 +58,37 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser_delete.add_argument(
         "--force", action="store_true", help="don't confirm the deletion",
     )
-    parser_delete.set_defaults(func=delete)
+    parser_delete.set_defaults(func=delete, interactive=True)
     parser.set_defaults(func=list_drinks)
 
 
 def list_drinks(args: argparse.Namespace, config: Config) -> None:
     conn = connect(config)
-    drinks = conn.drinks()
-    print("All drinks:")
-    print_table(config,
-        sorted([(
-            drink.id,
-            drink.name,
-            drink.bottle_size,
-            drink.caffeine,
-            "{:.2f} €".format(drink.price),
-            true_false_to_yes_no(drink.active),
-        ) for drink in drinks], key=lambda entry: entry[0]),
-        headers=(
-            "ID",
-            "name",
-            "bottle size",
-            "caffeine",
-            "price",
-            "active?"
-        ),
+    drinks = sorted(conn.drinks(), key=lambda drink: drink.id)
+    table = [(
+        drink.id,
+        drink.name,
+        drink.bottle_size,
+        drink.caffeine,
+        "{:.2f} €".format(drink.price),
+        true_false_to_yes_no(drink.active),
+    ) for drink in drinks]
+    headers = (
+        "ID",
+        "name",
+        "bottle size",
+        "caffeine",
+        "price",
+        "active?"
     )
+    if export.is_export(args):
+        export.export(
+            config, args.format, args.output, drinks, Drink.__slots__,
+            table, headers,
+        )
+        return
+    print("All drinks:")
+    print_table(config, table, headers=headers)
 
 
 def with_drink(
@@ -89,13 +96,27 @@ def with_drink(
 ) -> Callable[[argparse.Namespace, Config], None]:
     def new_func(args: argparse.Namespace, config: Config) -> None:
         conn = connect(config)
-        drink = fuzzy_search(conn.drinks(), args.drink)
+        drink = fuzzy_search(conn.drinks_index(), args.drink)
         if not drink:
             return
         func(args, config, conn, drink)
     return new_func
 
 
+def needs_barcodes(
+    func: Callable[[argparse.Namespace, Config, Connection, Drink], None]
+) -> Callable[[argparse.Namespace, Config, Connection, Drink], None]:
+    def new_func(
+        args: argparse.Namespace, config: Config, conn: Connection,
+        drink: Drink,
+    ) -> None:
+        if not conn.supports("barcodes"):
+            print("This server doesn't support barcodes.")
+            return
+        func(args, config, conn, drink)
+    return new_func
+
+
 @with_drink
 def show(
     args: argparse.Namespace, config: Config, conn: Connection, drink: Drink
@@ -169,14 +190,13 @@ def modify(
 
 
 def _get_barcodes_for_drink(conn: Connection, drink: Drink) -> Iterator[str]:
-    all_barcodes = conn.barcodes()
-    for barcode in all_barcodes:
-        if barcode.drink == drink.id:
-            log.debug("Found barcode: %s", barcode.id)
-            yield barcode.id
+    for barcode in conn.barcodes_for_drink(drink.id):
+        log.debug("Found barcode: %s", barcode)
+        yield barcode
 
 
 @with_drink
+@needs_barcodes
 def barcodes_list(
     args: argparse.Namespace, config: Config, conn: Connection, drink: Drink
 ) -> None:
@@ -185,6 +205,7 @@ def barcodes_list(
 
 
 @with_drink
+@needs_barcodes
 def barcodes_add(
     args: argparse.Namespace, config: Config, conn: Connection, drink: Drink
 ) -> None:
@@ -201,6 +222,7 @@ def barcodes_add(
 
 
 @with_drink
+@needs_barcodes
 def barcodes_delete(
     args: argparse.Namespace, config: Config, conn: Connection, drink: Drink
 ) -> None:
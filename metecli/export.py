@@ -0,0 +1,115 @@
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, Optional, Sequence, TextIO
+
+import argparse
+import csv
+import io
+import json
+import sys
+
+import logging
+log = logging.getLogger(__name__)
+
+FORMATS = ("table", "jsonl", "csv", "tsv")
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add --format and --output to a command that lists things."""
+    parser.add_argument(
+        "--format", choices=FORMATS, default="table",
+        help="how to print the results (default: table)",
+    )
+    parser.add_argument(
+        "--output", type=str, metavar="FILE",
+        help="write to FILE instead of stdout (compressed if it ends with .gz or .zst)",
+    )
+
+
+def is_export(args: argparse.Namespace) -> bool:
+    """Whether the results should be exported instead of displayed."""
+    return (
+        getattr(args, "format", "table") != "table"
+        or bool(getattr(args, "output", None))
+    )
+
+
+@contextmanager
+def open_output(path: Optional[str]) -> Iterator[TextIO]:
+    """Open a file for writing (or stdout), compressing if necessary."""
+    if not path or path == "-":
+        yield sys.stdout
+        return
+    if path.endswith(".gz"):
+        import gzip
+        out = gzip.open(path, "wt", encoding="utf-8", newline="")
+    elif path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("Please install zstandard to write .zst files.")
+        raw = open(path, "wb")
+        out = io.TextIOWrapper(
+            zstandard.ZstdCompressor().stream_writer(raw),
+            encoding="utf-8", newline="",
+        )
+    else:
+        out = open(path, "wt", encoding="utf-8", newline="")
+    with out:
+        yield out
+
+
+def _value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def write(
+    format: str, things: Iterable[Any], fields: Sequence[str], out: TextIO,
+) -> int:
+    """Serialize model objects one by one; returns how many were written."""
+    count = 0
+    if format == "jsonl":
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        for thing in things:
+            out.write(encode({
+                field: getattr(thing, field) for field in fields
+            }))
+            out.write("\n")
+            count += 1
+    elif format in ("csv", "tsv"):
+        writer = csv.writer(
+            out, delimiter="\t" if format == "tsv" else ",",
+            lineterminator="\n",
+        )
+        writer.writerow(fields)
+        for thing in things:
+            writer.writerow([_value(getattr(thing, field)) for field in fields])
+            count += 1
+    else:
+        raise NotImplementedError(format)
+    return count
+
+
+def export(
+    config: 'Config', format: str, output: Optional[str],
+    things: Iterable[Any], fields: Sequence[str],
+    table: Iterable[Sequence[Any]], headers: Sequence[str],
+) -> None:
+    """Write things in the requested format to the requested output.
+
+    table (and headers) are used if a table is requested; they should
+    be generated lazily."""
+    with open_output(output) as out:
+        if format == "table":
+            from .table import StreamingTable
+            display = config["display"]
+            StreamingTable(
+                headers, display["table_format"], display["sample_rows"],
+            ).write(table, out)
+            return
+        count = write(format, things, fields, out)
+    if output:
+        log.info("Wrote %d entries to %s.", count, output)
@@ -0,0 +1,90 @@
+from .connection.connection import Connection
+from .connection.models import Audit
+from .connection.models.audit_columns import parse_timestamp
+
+from datetime import date, timedelta
+from time import sleep
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+import logging
+log = logging.getLogger(__name__)
+
+# how long to wait between polls (in seconds)
+MIN_INTERVAL = 2.0
+MAX_INTERVAL = 60.0
+
+
+class AuditFollower():
+    """Polls the server for new audits.
+
+    Only the days since the last poll are requested, and reading stops at
+    the first audit that has been seen before (the server sends the newest
+    ones first). The interval grows while nothing happens."""
+    def __init__(
+        self, conn: Connection, user: Optional[int] = None,
+        since: Optional[date] = None, min_interval: float = MIN_INTERVAL,
+        max_interval: float = MAX_INTERVAL,
+    ) -> None:
+        self._conn = conn
+        self._user = user
+        self._since = since or date.today()
+        # the first poll starts exactly at since, later ones a day earlier
+        # (the server might be in a different timezone)
+        self._margin = timedelta(0)
+        # the newest timestamp seen so far and the audits that had it
+        self._last: Optional[int] = None
+        self._last_ids: Set[int] = set()
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self.interval = min_interval
+    
+    def poll(self) -> List[Audit]:
+        """Get the audits that are new since the last poll (oldest first)."""
+        today = date.today()
+        audits = self._conn.audits(
+            user=self._user, from_date=self._since - self._margin,
+            to_date=today + timedelta(days=1), stream=True,
+        )
+        new: List[Tuple[int, Audit]] = list()
+        for audit in audits:
+            created_at = parse_timestamp(audit.created_at)
+            if self._last is not None:
+                if created_at < self._last:
+                    # everything after this has already been seen
+                    break
+                if created_at == self._last and audit.id in self._last_ids:
+                    continue
+            new.append((created_at, audit))
+        self._since = today
+        self._margin = timedelta(days=1)
+        if new:
+            newest = max(created_at for created_at, _ in new)
+            if self._last is None or newest > self._last:
+                self._last = newest
+                self._last_ids = set()
+            self._last_ids.update(
+                audit.id for created_at, audit in new
+                if created_at == self._last
+            )
+        new.sort(key=lambda entry: (entry[0], entry[1].id))
+        return [audit for _, audit in new]
+    
+    def follow(
+        self, before_waiting: Optional[Callable[[], None]] = None,
+    ) -> Iterator[Audit]:
+        """Yield new audits as they appear (this never stops)."""
+        while True:
+            try:
+                new = self.poll()
+            except Exception as exc:
+                log.warn("Couldn't get new audits: %s", exc)
+                new = list()
+            yield from new
+            if new:
+                self.interval = self._min_interval
+            else:
+                self.interval = min(self.interval * 2, self._max_interval)
+            log.debug("Waiting %.1f seconds for new audits.", self.interval)
+            if before_waiting:
+                before_waiting()
+            sleep(self.interval)
@@ -0,0 +1,83 @@
+from typing import (
+    Any, Dict, Generic, Iterable, Iterator, List, Optional, Set, TypeVar, Union,
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+# anything with an id and (perhaps) a name
+Entity = TypeVar("Entity")
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class EntityIndex(Generic[Entity]):
+    """Lookup tables for a collection of entities, built once.
+
+    This contains a map from ids to entities, a map from (casefolded) names to
+    entities and a trigram index for finding names containing a string."""
+    def __init__(self, things: Iterable[Entity]) -> None:
+        self._things = list(things)
+        self._by_id: Dict[Any, Entity] = dict()
+        self._by_name: Dict[str, Entity] = dict()
+        self._folded_names: List[str] = list()
+        self._trigrams: Dict[str, Set[int]] = dict()
+        for position, thing in enumerate(self._things):
+            self._by_id.setdefault(thing.id, thing)
+            name = getattr(thing, "name", None)
+            folded = name.casefold() if name else ""
+            self._folded_names.append(folded)
+            if not name:
+                continue
+            self._by_name.setdefault(folded, thing)
+            for trigram in _trigrams(folded):
+                self._trigrams.setdefault(trigram, set()).add(position)
+    
+    def __len__(self) -> int:
+        return len(self._things)
+    
+    def __iter__(self) -> Iterator[Entity]:
+        return iter(self._things)
+    
+    def find_by_id(self, id: Union[int, str]) -> Optional[Entity]:
+        """Get the entity with this id."""
+        return self._by_id.get(id)
+    
+    def find_by_name(self, name: str) -> Optional[Entity]:
+        """Get the entity with exactly this name (ignoring case)."""
+        return self._by_name.get(name.casefold())
+    
+    def _candidates(self, folded: str) -> Iterable[int]:
+        if len(folded) < 3:
+            # too short for the trigram index
+            return range(len(self._things))
+        trigrams = sorted(
+            _trigrams(folded), key=lambda t: len(self._trigrams.get(t, ())),
+        )
+        candidates = set(self._trigrams.get(trigrams[0], ()))
+        for trigram in trigrams[1:]:
+            if not candidates:
+                break
+            candidates &= self._trigrams.get(trigram, set())
+        return candidates
+    
+    def search(self, search_for: str, k: Optional[int] = None) -> List[Entity]:
+        """Find entities whose name contains this string (ignoring case).
+
+        The results are ranked: exact matches first, then names starting with
+        the string, then names containing it early, shorter names first.
+        Only the best k results are returned, if k is given."""
+        folded = search_for.casefold()
+        ranked = list()
+        for position in self._candidates(folded):
+            name = self._folded_names[position]
+            offset = name.find(folded)
+            if offset < 0:
+                continue
+            ranked.append((name != folded, offset, len(name), position))
+        ranked.sort()
+        if k is not None:
+            ranked = ranked[:k]
+        return [self._things[entry[-1]] for entry in ranked]
@@ -0,0 +1,43 @@
+from .connection.models import Audit, Drink
+
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+# used for all audits without a (known) drink
+NA_DRINK = Drink(name="n/a")
+
+
+class JoinedAudit(NamedTuple):
+    """An audit together with the name of its drink."""
+    id: int
+    created_at: str
+    difference: float
+    drink: Optional[int]
+    drink_name: str
+
+
+class DrinkJoin():
+    """Joins audits with their drinks.
+
+    The lookup table is built once; the joined rows are created while
+    they are being read."""
+    def __init__(self, drinks: Iterable[Drink]) -> None:
+        self._by_id = dict()
+        for drink in drinks:
+            self._by_id.setdefault(drink.id, drink)
+    
+    def find(self, drink_id: Optional[int]) -> Optional[Drink]:
+        """Get the drink with this id (or None if it doesn't exist)."""
+        return self._by_id.get(drink_id)
+    
+    def drink(self, drink_id: Optional[int]) -> Drink:
+        """Get the drink with this id (or NA_DRINK)."""
+        return self._by_id.get(drink_id, NA_DRINK)
+    
+    def join(self, audits: Iterable[Audit]) -> Iterator[JoinedAudit]:
+        get = self._by_id.get
+        for audit in audits:
+            drink = audit.drink
+            yield JoinedAudit(
+                audit.id, audit.created_at, audit.difference, drink,
+                get(drink, NA_DRINK).name,
+            )
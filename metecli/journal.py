@@ -0,0 +1,461 @@
+from .config import Config
+from .connection.connection import Connection
+from .ledger import Ledger
+from .utils import connect, print_table
+
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from threading import Event, Lock, Thread
+from time import sleep, time
+from typing import (
+    Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple,
+)
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+import argparse
+import json
+import os
+import uuid
+
+import logging
+log = logging.getLogger(__name__)
+
+# the states of an operation (the last record for its key wins)
+QUEUED = "queued"
+# it's being sent (or the request might have reached the server)
+SENDING = "sending"
+DONE = "done"
+FAILED = "failed"
+DISCARDED = "discarded"
+
+# what submit() returns
+SENT = "sent"
+UNCERTAIN = "uncertain"
+
+# how long to wait between attempts to send queued operations (in seconds)
+MIN_INTERVAL = 5.0
+MAX_INTERVAL = 300.0
+
+
+def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
+    parser = global_subparsers.add_parser(
+        "flush", help="send transactions that have been queued while offline",
+    )
+    parser.add_argument(
+        "--wait", action="store_true",
+        help="keep trying (less and less often) until everything is sent",
+    )
+    parser.add_argument(
+        "--list", action="store_true",
+        help="only show the queued transactions",
+    )
+    parser.add_argument(
+        "--retry_uncertain", "--retry-uncertain", action="store_true",
+        help="also send transactions that might have reached the server",
+    )
+    parser.add_argument(
+        "--discard", type=str, nargs="+", metavar="KEY",
+        help="don't send these transactions (the start of the key is enough)",
+    )
+    parser.set_defaults(func=do)
+
+
+def do(args: argparse.Namespace, config: Config) -> None:
+    journal = Journal.for_config(config)
+    if args.list:
+        print_table(config, [
+            (
+                entry.key[:8],
+                UNCERTAIN if entry.state == SENDING else entry.state,
+                datetime.fromtimestamp(entry.created_at).isoformat(" ", "seconds"),
+                entry.describe(),
+            )
+            for entry in journal.unresolved()
+        ], ("key", "state", "time", "transaction"))
+        return
+    if args.discard:
+        for key in args.discard:
+            entry = journal.discard(key)
+            if entry:
+                print("Discarded {}.".format(entry.describe()))
+            else:
+                print("There's no unsent transaction with the key {}.".format(key))
+        return
+    conn = connect(config)
+    on_sent = partial(update_ledger, Ledger.for_config(config))
+    sent = 0
+    interval = MIN_INTERVAL
+    while True:
+        sent += journal.flush(
+            conn, retry_uncertain=args.retry_uncertain, on_sent=on_sent,
+        )
+        queued = len(journal.queued())
+        if not queued or not args.wait:
+            break
+        log.info("%i still queued, trying again in %.0f seconds.", queued, interval)
+        sleep(interval)
+        interval = min(interval * 2, MAX_INTERVAL)
+    print("Sent {} transactions, {} still queued.".format(sent, queued))
+    uncertain = len(journal.uncertain())
+    if uncertain:
+        print(
+            "{} might have reached the server already. Check your balance, "
+            "then send them with --retry_uncertain or drop them with "
+            "--discard (see --list).".format(uncertain)
+        )
+
+
+def update_ledger(ledger: Ledger, entry: 'Entry') -> None:
+    """Apply the balance changes of a sent operation to the ledger."""
+    for uid, amount in entry.changes.items():
+        ledger.apply(int(uid), amount)
+
+
+def _not_received(exc: Exception) -> Optional[bool]:
+    """Whether the server didn't get a request that failed with this error.
+
+    This is True if it certainly didn't, False if it might have and None
+    if the error isn't caused by the network or the server being down."""
+    from requests import exceptions
+    from urllib3.exceptions import NewConnectionError
+    if isinstance(exc, exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, exceptions.ConnectionError):
+        # (requests wraps urllib3's MaxRetryError, which has the reason)
+        reason = exc.args[0] if exc.args else None
+        reason = getattr(reason, "reason", reason)
+        # otherwise, the connection broke after the request had been sent
+        return isinstance(reason, NewConnectionError)
+    if isinstance(exc, exceptions.Timeout):
+        return False
+    if isinstance(exc, exceptions.HTTPError) and exc.response is not None:
+        if exc.response.status_code == 503:
+            return True
+        if exc.response.status_code in (502, 504):
+            # a proxy couldn't get an answer, but the server might be working
+            return False
+    return None
+
+
+def _steps(
+    conn: Connection, entry: 'Entry',
+) -> List[Tuple[str, Dict[str, Any], Dict[str, float]]]:
+    """The requests an operation is made of (the names of the methods,
+    their arguments and how they change the balances)."""
+    if entry.op == "transfer":
+        steps = conn.transfer_steps(**entry.args)
+        if len(steps) > 1:
+            # (older servers only know payments and deposits)
+            return [
+                (op, args, {str(args["uid"]): (
+                    -args["amount"] if op == "pay" else args["amount"]
+                )})
+                for op, args in steps
+            ]
+    return [(entry.op, entry.args, entry.changes)]
+
+
+class Entry(NamedTuple):
+    """A write operation in the journal."""
+    key: str
+    # the name of the method of Connection and its arguments
+    op: str
+    args: Dict[str, Any]
+    # how the balances are still going to change (uid -> amount)
+    changes: Dict[str, float]
+    created_at: float
+    state: str
+    # how many of its requests have been sent (see _steps)
+    step: int = 0
+    
+    def describe(self) -> str:
+        return "{} ({})".format(self.op, ", ".join(
+            "{}={}".format(name, value) for name, value in self.args.items()
+        ))
+
+
+class Journal():
+    """Write operations that haven't been confirmed by the server yet.
+
+    Every operation is appended to the file (and synced to the disk) before
+    it's sent; records are never changed, newer ones just replace the state.
+    The server doesn't know the keys, so an operation whose request might
+    have reached it is never sent again automatically."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+    
+    @classmethod
+    def for_config(cls, config: Config) -> 'Journal':
+        """Get the journal for this config."""
+        return cls(os.path.join(config.state_path(), "journal.jsonl"))
+    
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold an exclusive lock on the journal (if supported, also against
+        other processes)."""
+        with self._lock:
+            if not fcntl:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _append(self, *records: Dict[str, Any]) -> None:
+        # (the lock has to be held)
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        created = not os.path.exists(self.path)
+        data = "".join(json.dumps(record) + "\n" for record in records).encode()
+        fd = os.open(
+            self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600,
+        )
+        try:
+            if os.lseek(fd, 0, os.SEEK_END):
+                os.lseek(fd, -1, os.SEEK_END)
+                if os.read(fd, 1) != b"\n":
+                    # the last write was interrupted
+                    data = b"\n" + data
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if created and os.name == "posix":
+            # make sure that the new file doesn't get lost either
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+    
+    def _read(self) -> Dict[str, Entry]:
+        # (oldest first)
+        entries: Dict[str, Entry] = dict()
+        try:
+            with open(self.path, "rt") as journal_file:
+                lines = journal_file.readlines()
+        except FileNotFoundError:
+            return entries
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # an interrupted write (nothing was sent after it)
+                log.debug("Skipping a broken line in the journal: %r", line)
+                continue
+            key = record["key"]
+            if "op" in record:
+                entries[key] = Entry(
+                    key, record["op"], record["args"], record["changes"],
+                    record["at"], record["state"],
+                )
+            elif key in entries:
+                entries[key] = entries[key]._replace(
+                    state=record["state"],
+                    step=record.get("step", entries[key].step),
+                    changes=record.get("changes", entries[key].changes),
+                )
+        return entries
+    
+    def _mark(self, key: str, state: str, **extra: Any) -> None:
+        with self._locked():
+            self._append(dict(key=key, state=state, at=time(), **extra))
+            entries = self._read()
+            if all(
+                entry.state in (DONE, FAILED, DISCARDED)
+                for entry in entries.values()
+            ):
+                # there's nothing left to remember
+                os.remove(self.path)
+    
+    def queued(self) -> List[Entry]:
+        """Operations that haven't been sent yet (oldest first)."""
+        return [entry for entry in self._read().values() if entry.state == QUEUED]
+    
+    def uncertain(self) -> List[Entry]:
+        """Operations that might or might not have reached the server."""
+        return [entry for entry in self._read().values() if entry.state == SENDING]
+    
+    def unresolved(self) -> List[Entry]:
+        return [
+            entry for entry in self._read().values()
+            if entry.state in (QUEUED, SENDING)
+        ]
+    
+    def queued_change(self, uid: int) -> float:
+        """By how much the queued operations will change this balance."""
+        return sum(entry.changes.get(str(uid), 0) for entry in self.queued())
+    
+    def submit(
+        self, conn: Connection, op: str, args: Dict[str, Any],
+        changes: Dict[int, float],
+        on_sent: Optional[Callable[[Entry], None]] = None,
+    ) -> str:
+        """Send an operation or queue it if the server can't be reached.
+
+        This returns SENT, QUEUED or UNCERTAIN (if the request might have
+        reached the server). Other errors are raised. on_sent gets the
+        changes of every request that went through."""
+        entry = Entry(
+            str(uuid.uuid4()), op, args,
+            {str(uid): amount for uid, amount in changes.items()},
+            time(), SENDING,
+        )
+        with self._locked():
+            # (both at once, so that nobody else picks it up)
+            self._append(
+                dict(
+                    key=entry.key, state=QUEUED, op=op, args=args,
+                    changes=entry.changes, at=entry.created_at,
+                ),
+                dict(key=entry.key, state=SENDING, at=entry.created_at),
+            )
+        return self._send(conn, entry, on_sent)
+    
+    def _send(
+        self, conn: Connection, entry: Entry,
+        on_sent: Optional[Callable[[Entry], None]] = None,
+    ) -> str:
+        steps = _steps(conn, entry)
+        for step in range(entry.step, len(steps)):
+            op, args, step_changes = steps[step]
+            try:
+                getattr(conn, op)(**args)
+            except Exception as exc:
+                not_received = _not_received(exc)
+                if not_received is None:
+                    self._mark(entry.key, FAILED, error=str(exc))
+                    raise
+                if not_received:
+                    # (the steps that have been sent are never sent again)
+                    log.debug("Queued %s: %s", entry.describe(), exc)
+                    self._mark(entry.key, QUEUED)
+                    return QUEUED
+                # (it stays in SENDING)
+                log.warn(
+                    "It's not clear whether the server got %s: %s",
+                    entry.describe(), exc,
+                )
+                return UNCERTAIN
+            if step + 1 < len(steps):
+                changes = {
+                    uid: amount - step_changes.get(uid, 0)
+                    for uid, amount in entry.changes.items()
+                }
+                entry = entry._replace(step=step + 1, changes=changes)
+                self._mark(
+                    entry.key, SENDING, step=entry.step, changes=changes,
+                )
+            else:
+                self._mark(entry.key, DONE)
+            if on_sent:
+                on_sent(entry._replace(changes=step_changes))
+        return SENT
+    
+    def flush(
+        self, conn: Connection, retry_uncertain: bool = False,
+        on_sent: Optional[Callable[[Entry], None]] = None,
+    ) -> int:
+        """Send the queued operations (oldest first); returns how many.
+
+        This stops at the first one that can't be sent, so that the order is
+        kept. Operations that fail for other reasons are dropped."""
+        sent = 0
+        while True:
+            with self._locked():
+                entry = next((
+                    entry for entry in self._read().values()
+                    if entry.state == QUEUED
+                    or (retry_uncertain and entry.state == SENDING)
+                ), None)
+                if not entry:
+                    return sent
+                # claim it (another process might be flushing, too)
+                self._append(dict(key=entry.key, state=SENDING, at=time()))
+            try:
+                result = self._send(conn, entry, on_sent)
+            except Exception as exc:
+                log.error("Couldn't send %s: %s", entry.describe(), exc)
+                continue
+            if result != SENT:
+                return sent
+            log.info("Sent %s.", entry.describe())
+            sent += 1
+    
+    def discard(self, key: str) -> Optional[Entry]:
+        """Don't send this operation (the start of the key is enough)."""
+        entry = next((
+            entry for entry in self.unresolved() if entry.key.startswith(key)
+        ), None)
+        if entry:
+            self._mark(entry.key, DISCARDED)
+        return entry
+
+
+class Flusher():
+    """Sends queued operations in the background.
+
+    The journal is checked regularly; while operations can't be sent,
+    the interval grows."""
+    def __init__(
+        self, journal: Journal, conn: Connection,
+        on_sent: Optional[Callable[[Entry], None]] = None,
+        min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+    ) -> None:
+        self._journal = journal
+        self._conn = conn
+        self._on_sent = on_sent
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="flusher", daemon=True)
+    
+    def start(self) -> 'Flusher':
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        """Stop (after the operation that's being sent right now)."""
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self) -> None:
+        interval = self._min_interval
+        while not self._stop.is_set():
+            try:
+                self._journal.flush(self._conn, on_sent=self._on_sent)
+                left = bool(self._journal.queued())
+            except Exception as exc:
+                log.warn("Couldn't send the queued operations: %s", exc)
+                left = True
+            if left:
+                interval = min(interval * 2, self._max_interval)
+                log.debug("Trying again in %.0f seconds.", interval)
+            else:
+                interval = self._min_interval
+            self._stop.wait(interval)
+
+
+def start_flusher(config: Config) -> Optional[Flusher]:
+    """Send this config's queued operations in the background (for as long
+    as the program runs)."""
+    journal = Journal.for_config(config)
+    try:
+        conn = connect(config)
+    except Exception as exc:
+        log.debug("Not sending queued operations: %s", exc)
+        return None
+    return Flusher(
+        journal, conn, on_sent=partial(update_ledger, Ledger.for_config(config)),
+    ).start()
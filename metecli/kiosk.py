@@ -0,0 +1,297 @@
+from .config import Config
+from .connection.connection import Connection
+from .connection.models import Drink
+from .journal import Entry, Flusher, Journal, QUEUED, SENT, update_ledger
+from .ledger import Ledger, credit_limit, exceeds_credit_limit
+from .utils import connect, fuzzy_search
+
+from functools import partial
+from queue import Queue
+from threading import Event, Lock, Thread
+from time import perf_counter
+from typing import IO, List, NamedTuple
+
+import argparse
+import sys
+
+import logging
+log = logging.getLogger(__name__)
+
+# how often drinks and barcodes are compared with the server (in seconds)
+REFRESH_INTERVAL = 60
+
+
+def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
+    parser = global_subparsers.add_parser(
+        "kiosk", help="buy drinks by scanning barcodes continuously",
+    )
+    parser.add_argument(
+        "--user", type=str,
+        help="the account to charge (defaults to the configured one)",
+    )
+    parser.add_argument(
+        "--device", type=str,
+        help="read barcodes from this device instead of stdin",
+    )
+    # it reads from stdin
+    parser.set_defaults(func=do, interactive=True)
+
+
+def do(args: argparse.Namespace, config: Config) -> None:
+    conn = connect(config)
+    if not conn.supports("barcodes"):
+        print("This server doesn't support barcodes.")
+        return
+    if args.user:
+        user = fuzzy_search(conn.users_index(), args.user)
+        if not user:
+            return
+        uid = user.id
+    elif config["account"]["uid"]:
+        uid = config["account"]["uid"]
+    else:
+        print("No account is configured. Please pass --user.")
+        return
+    journal = Journal.for_config(config)
+    ledger = Ledger.for_config(config)
+    if args.device:
+        with open(args.device, "rt") as scanner:
+            Kiosk(conn, uid, journal, ledger).run(scanner)
+    else:
+        Kiosk(conn, uid, journal, ledger).run(sys.stdin)
+
+
+class Scan(NamedTuple):
+    barcode: str
+    # when it was read (perf_counter)
+    scanned_at: float
+
+
+class Purchase(NamedTuple):
+    scan: Scan
+    drink: Drink
+
+
+class Kiosk():
+    """Buys a drink for every scanned barcode.
+
+    Reading, buying and fetching the balance happen in different threads,
+    so that a slow server never blocks the next scan. Purchases that can't
+    be sent are queued in the journal and sent once the server is back.
+    Scans that would exceed the credit limit are rejected right away."""
+    def __init__(
+        self, conn: Connection, uid: int, journal: Journal, ledger: Ledger,
+    ) -> None:
+        self._conn = conn
+        self._uid = uid
+        self._journal = journal
+        self._ledger = ledger
+        # unbounded, so that no scan gets lost during bursts
+        self._scans: Queue = Queue()
+        self._purchases: Queue = Queue()
+        self._print_lock = Lock()
+        self._balance_lock = Lock()
+        self._reconcile = Event()
+        self._done = Event()
+        # purchases that have been resolved but not sent yet
+        self._pending = 0
+        self._latencies: List[float] = list()
+        self._failed = 0
+        self._queued = 0
+        self._uncertain = 0
+        log.info("Loading drinks and barcodes...")
+        conn.drinks_index()
+        conn.update_barcode_index()
+        self._refreshed_at = perf_counter()
+        self._limit = credit_limit(conn)
+        user = conn.get_user(uid)
+        self._ledger.confirm(user)
+        # (purchases that couldn't be sent before count, too)
+        self._balance = user.balance + self._journal.queued_change(uid)
+        self._say("Ready. Charging {} (balance: {:.2f}).".format(
+            user.name, self._balance,
+        ))
+    
+    def _say(self, message: str) -> None:
+        with self._print_lock:
+            print(message, flush=True)
+    
+    def run(self, scanner: IO[str]) -> None:
+        reader = Thread(target=self._read, args=(scanner,), daemon=True)
+        buyer = Thread(target=self._buy)
+        reconciler = Thread(target=self._reconcile_balance)
+        # (this also sends what has been queued before)
+        flusher = Flusher(
+            self._journal, self._conn, on_sent=self._flushed,
+        )
+        reader.start()
+        buyer.start()
+        reconciler.start()
+        flusher.start()
+        try:
+            self._resolve()
+        except KeyboardInterrupt:
+            self._say("Stopping. Waiting for pending purchases...")
+        finally:
+            self._purchases.put(None)
+            buyer.join()
+            flusher.stop()
+            self._done.set()
+            self._reconcile.set()
+            reconciler.join()
+        self._summary()
+    
+    def _read(self, scanner: IO[str]) -> None:
+        for line in scanner:
+            barcode = line.strip()
+            if barcode:
+                self._scans.put(Scan(barcode, perf_counter()))
+        self._scans.put(None)
+    
+    def _resolve(self) -> None:
+        while True:
+            scan = self._scans.get()
+            if scan is None:
+                return
+            drink_id = self._conn.drink_for_barcode(scan.barcode)
+            drink = None
+            if drink_id is not None:
+                drink = self._conn.drinks_index().find_by_id(drink_id)
+            if not drink:
+                self._say("{}: unknown barcode".format(scan.barcode))
+                continue
+            with self._balance_lock:
+                if exceeds_credit_limit(
+                    self._balance, drink.price, self._limit,
+                ):
+                    self._say(
+                        "{}: {} would exceed the credit limit of {:.2f} "
+                        "(balance: {:.2f})".format(
+                            scan.barcode, drink.name, self._limit,
+                            self._balance,
+                        )
+                    )
+                    continue
+                self._pending += 1
+                self._balance -= drink.price
+                balance = self._balance
+            self._say("{}: {} (balance: {:.2f}, {:.1f} ms)".format(
+                scan.barcode, drink.name, balance,
+                (perf_counter() - scan.scanned_at) * 1000,
+            ))
+            self._purchases.put(Purchase(scan, drink))
+    
+    def _buy(self) -> None:
+        while True:
+            purchase = self._purchases.get()
+            if purchase is None:
+                return
+            try:
+                result = self._journal.submit(
+                    self._conn, "buy",
+                    dict(uid=self._uid, did=purchase.drink.id),
+                    {self._uid: -purchase.drink.price},
+                    on_sent=partial(update_ledger, self._ledger),
+                )
+            except Exception as exc:
+                self._failed += 1
+                self._say("{}: buying {} failed: {}".format(
+                    purchase.scan.barcode, purchase.drink.name, exc,
+                ))
+            else:
+                self._report(purchase, result)
+            with self._balance_lock:
+                self._pending -= 1
+            # let the reconciler fetch the real balance
+            self._reconcile.set()
+    
+    def _flushed(self, entry: Entry) -> None:
+        update_ledger(self._ledger, entry)
+        self._reconcile.set()
+    
+    def _report(self, purchase: Purchase, result: str) -> None:
+        if result == SENT:
+            latency = perf_counter() - purchase.scan.scanned_at
+            self._latencies.append(latency)
+            log.info(
+                "Bought %s (%.1f ms after the scan).",
+                purchase.drink.name, latency * 1000,
+            )
+        elif result == QUEUED:
+            self._queued += 1
+            self._say("{}: {} queued, the server can't be reached".format(
+                purchase.scan.barcode, purchase.drink.name,
+            ))
+        else:
+            self._uncertain += 1
+            self._say(
+                "{}: not sure whether {} has been bought, see "
+                "'metecli flush --list'".format(
+                    purchase.scan.barcode, purchase.drink.name,
+                )
+            )
+    
+    def _reconcile_balance(self) -> None:
+        while True:
+            self._reconcile.wait()
+            self._reconcile.clear()
+            done = self._done.is_set()
+            self._update_balance()
+            if done:
+                return
+    
+    def _update_balance(self) -> None:
+        with self._balance_lock:
+            if self._pending:
+                # wait for the others, so that they're reconciled at once
+                return
+        # the last response might be older than the last purchase
+        self._conn.forget(keep_collections=True)
+        if perf_counter() - self._refreshed_at >= REFRESH_INTERVAL:
+            self._refresh_collections()
+        try:
+            balance = self._conn.get_user(self._uid).balance
+        except Exception as exc:
+            log.warn("Couldn't fetch the balance: %s", exc)
+            return
+        # the server doesn't know about the queued purchases yet
+        balance += self._journal.queued_change(self._uid)
+        with self._balance_lock:
+            if self._pending:
+                # this is already outdated
+                return
+            if abs(self._balance - balance) >= 0.005:
+                self._say("Balance corrected: {:.2f}".format(balance))
+            self._balance = balance
+    
+    def _refresh_collections(self) -> None:
+        """Pick up new drinks, prices and barcodes."""
+        self._refreshed_at = perf_counter()
+        try:
+            # (the index is rebuilt if they have changed)
+            self._conn.drinks_index(refresh=True)
+            self._conn.update_barcode_index(force=True)
+        except Exception as exc:
+            log.warn("Couldn't refresh drinks and barcodes: %s", exc)
+    
+    def _summary(self) -> None:
+        queued = len(self._journal.queued())
+        if queued or self._uncertain:
+            self._say(
+                "{} purchases are still queued and {} are uncertain, "
+                "see 'metecli flush'.".format(queued, self._uncertain)
+            )
+        if not self._latencies:
+            self._say("Nothing was bought.")
+            return
+        latencies = sorted(self._latencies)
+        self._say(
+            "Bought {} drinks ({} failed, {} queued), balance: {:.2f}. ".format(
+                len(latencies), self._failed, self._queued, self._balance,
+            )
+            + "Latency: median {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms".format(
+                latencies[len(latencies) // 2] * 1000,
+                latencies[int(len(latencies) * 0.95)] * 1000,
+                latencies[-1] * 1000,
+            )
+        )
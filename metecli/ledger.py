@@ -0,0 +1,184 @@
+from .config import Config
+from .connection.connection import Connection
+from .connection.models import User
+
+from contextlib import contextmanager
+from threading import Lock, Thread
+from time import monotonic, time
+from typing import Any, Dict, Iterator, Optional
+from weakref import WeakSet
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+import atexit
+import json
+import os
+import tempfile
+
+import logging
+log = logging.getLogger(__name__)
+
+# how long to wait for reconciliations in the background when the program
+# is about to exit (in seconds)
+EXIT_TIMEOUT = 2.0
+
+_background: 'WeakSet[Thread]' = WeakSet()
+
+
+@atexit.register
+def _finish_background() -> None:
+    # (they are daemon threads, so they would just be killed)
+    deadline = monotonic() + EXIT_TIMEOUT
+    for thread in list(_background):
+        thread.join(max(0, deadline - monotonic()))
+
+
+def credit_limit(conn: Connection) -> Optional[float]:
+    """How far below zero balances may go (or None if there's no limit)."""
+    if not conn.supports("server_info"):
+        return None
+    try:
+        limit = conn.server_info().global_credit_limit
+    except Exception as exc:
+        log.debug("Couldn't get the credit limit: %s", exc)
+        return None
+    # (like all amounts in the newer APIs, this is in cents)
+    return limit / 100 if limit is not None else None
+
+
+def exceeds_credit_limit(
+    balance: Optional[float], amount: float, limit: Optional[float],
+) -> bool:
+    """Whether spending this would take the balance below the credit limit
+    (if the balance or the limit isn't known, it doesn't)."""
+    if limit is None or balance is None:
+        return False
+    return balance - amount < -limit
+
+
+class Ledger():
+    """The last known balance of each account.
+
+    Changes made from here are applied right away (optimistically). When
+    the balance on the server is read again, it replaces the local one and
+    unexpected differences are reported. The amounts are stored in cents.
+    Other processes might use the ledger at the same time, so the file is
+    read again before every change."""
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._lock = Lock()
+        self._entries: Dict[str, Dict[str, Any]] = dict()
+        self._load()
+    
+    @classmethod
+    def for_config(cls, config: Config) -> 'Ledger':
+        """Get the ledger for this config (it's kept next to the journal)."""
+        return cls(os.path.join(config.state_path(), "ledger.json"))
+    
+    def _load(self) -> None:
+        try:
+            with open(self._path, "rt") as ledger_file:
+                self._entries = json.load(ledger_file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            log.warn("Couldn't read the ledger, starting a new one: %s", exc)
+    
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold an exclusive lock on the ledger (if supported, also against
+        other processes) and read it again."""
+        with self._lock:
+            if not fcntl:
+                self._load()
+                yield
+                return
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            with open(self._path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _save(self) -> None:
+        directory = os.path.dirname(self._path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".ledger-")
+        try:
+            with os.fdopen(fd, "wt") as tmp_file:
+                json.dump(self._entries, tmp_file)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    def balance(self, uid: int) -> Optional[float]:
+        """The expected balance of this user (if it's known)."""
+        self._load()
+        entry = self._entries.get(str(uid))
+        return entry["balance"] / 100 if entry else None
+    
+    def audit(self, uid: int) -> Optional[bool]:
+        """Whether this user's transactions are logged (if it's known)."""
+        self._load()
+        entry = self._entries.get(str(uid))
+        return entry["audit"] if entry else None
+    
+    def apply(self, uid: int, amount: float) -> Optional[float]:
+        """Change the balance of a user; returns the new one (if it's known)."""
+        with self._locked():
+            entry = self._entries.get(str(uid))
+            if not entry:
+                return None
+            entry["balance"] += round(amount * 100)
+            self._save()
+            return entry["balance"] / 100
+    
+    def confirm(self, user: User) -> Optional[float]:
+        """Take the balance from the server.
+
+        This returns by how much it differs from the expected one (if it
+        does). That's the case if the account has been used elsewhere."""
+        key = str(user.id)
+        actual = round(user.balance * 100)
+        with self._locked():
+            entry = self._entries.get(key)
+            drift = None
+            if entry and entry["balance"] != actual:
+                drift = (actual - entry["balance"]) / 100
+            self._entries[key] = {
+                "balance": actual, "audit": user.audit, "confirmed_at": time(),
+            }
+            self._save()
+        if drift:
+            log.warn(
+                "The balance of %s is %.2f on the server, but %.2f was "
+                "expected (%+.2f). It has been changed elsewhere.",
+                user.name, user.balance, user.balance - drift, drift,
+            )
+        return drift
+    
+    def reconcile(
+        self, conn: Connection, uid: int, background: bool = False,
+    ) -> None:
+        """Get the balance from the server and confirm it.
+
+        If background is set, this doesn't wait for the server. When the
+        program exits, it gets a moment (EXIT_TIMEOUT) to finish."""
+        def run() -> None:
+            try:
+                self.confirm(conn.get_user(uid))
+            except Exception as exc:
+                log.debug("Couldn't reconcile the balance of %s: %s", uid, exc)
+        if background:
+            thread = Thread(target=run, name="ledger", daemon=True)
+            _background.add(thread)
+            thread.start()
+        else:
+            run()
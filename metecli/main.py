@@ -10,6 +10,12 @@ def fail_on_python2():
 
 def run():
     fail_on_python2()
+    # let a running daemon handle this, if there is one
+    import sys
+    from . import client
+    exit_code = client.forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
     from . import cmdline
     cmdline.do()
 
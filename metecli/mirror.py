@@ -0,0 +1,261 @@
+from .config import Config
+from .connection.connection import Connection
+from .connection.async_connection import AsyncConnection
+from .connection.models import AuditColumns, AuditInfo
+from .connection.models.audit_columns import (
+    DAY, EPOCH, MILLISECOND, NO_DRINK, ZULU,
+)
+from .utils import connect, fuzzy_search
+
+from datetime import date, datetime, time, timedelta
+from time import time as now
+from typing import Any, Dict, Optional, Tuple
+
+import argparse
+import os
+import sqlite3
+
+import logging
+log = logging.getLogger(__name__)
+
+# Audits are fetched again for this many days before the last sync,
+# so that entries that showed up late are caught.
+OVERLAP = timedelta(days=2)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audits (
+    user INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    difference INTEGER NOT NULL,
+    drink INTEGER,
+    -- in minutes (NULL means "Z")
+    utc_offset INTEGER,
+    PRIMARY KEY (user, id)
+);
+CREATE INDEX IF NOT EXISTS audits_user_created_at ON audits (user, created_at);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user INTEGER PRIMARY KEY,
+    synced_at INTEGER NOT NULL
+);
+"""
+
+
+def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
+    parser = global_subparsers.add_parser(
+        "sync", help="keep a local copy of the audits",
+    )
+    parser.add_argument(
+        "--user", type=str,
+        help="the account to sync (defaults to the configured one)",
+    )
+    parser.add_argument(
+        "--full", action="store_true",
+        help="download all audits again instead of only the new ones",
+    )
+    parser.set_defaults(func=do)
+
+
+def do(args: argparse.Namespace, config: Config) -> None:
+    conn = connect(config)
+    if args.user:
+        user = fuzzy_search(conn.users_index(), args.user)
+        if not user:
+            return
+        uid = user.id
+    elif config["account"]["uid"]:
+        uid = config["account"]["uid"]
+    else:
+        print("No account is configured. Please pass --user.")
+        return
+    mirror = AuditMirror.open(config, create=True)
+    with mirror:
+        new, total = mirror.sync(conn, uid, full=args.full)
+    print("Synced the audits for user {}: {} new, {} in total.".format(
+        args.user or uid, new, total,
+    ))
+
+
+def _midnight(day: date) -> int:
+    """The start of a (local) day in milliseconds since the epoch."""
+    return (datetime.combine(day, time()).astimezone() - EPOCH) // MILLISECOND
+
+
+def _local_date(timestamp: int) -> date:
+    return (EPOCH + timestamp * MILLISECOND).astimezone().date()
+
+
+class AuditMirror():
+    """A local copy of the audits of some users (in SQLite).
+
+    Users only get mirrored once they've been synced; after that, only the
+    audits since the last sync need to be fetched from the server."""
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        columns = [
+            row[1] for row in self._db.execute("PRAGMA table_info(audits)")
+        ]
+        if "utc_offset" not in columns:
+            # an older mirror didn't keep the offsets, so sync everything again
+            with self._db:
+                self._db.execute(
+                    "ALTER TABLE audits ADD COLUMN utc_offset INTEGER"
+                )
+                self._db.execute("DELETE FROM sync_state")
+    
+    @classmethod
+    def path(cls, config: Config) -> str:
+        return os.path.join(config.cache_path(), "audits.sqlite")
+    
+    @classmethod
+    def open(
+        cls, config: Config, create: bool = False,
+    ) -> Optional['AuditMirror']:
+        """Open the mirror for this config.
+
+        If it doesn't exist yet (and create isn't set), None is returned."""
+        path = cls.path(config)
+        if not os.path.exists(path):
+            if not create:
+                return None
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return cls(path)
+    
+    def close(self) -> None:
+        self._db.close()
+    
+    def __enter__(self) -> 'AuditMirror':
+        return self
+    
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+    
+    def synced_at(self, user: int) -> Optional[int]:
+        """When this user was last synced (or None if it never was)."""
+        row = self._db.execute(
+            "SELECT synced_at FROM sync_state WHERE user = ?", (user,),
+        ).fetchone()
+        return row[0] if row else None
+    
+    def missing(self, user: int, full: bool = False) -> Dict[str, date]:
+        """What needs to be fetched to bring the user up to date.
+
+        The result can be passed to Connection.audits (as keyword
+        arguments); it's empty if everything needs to be fetched."""
+        synced_at = None if full else self.synced_at(user)
+        if synced_at is None:
+            return dict()
+        return {
+            "from_date": _local_date(synced_at) - OVERLAP,
+            # the server might be in a different timezone
+            "to_date": date.today() + timedelta(days=1),
+        }
+    
+    def store(
+        self, user: int, audits: AuditInfo, params: Dict[str, date],
+        synced_at: int,
+    ) -> int:
+        """Save what has been fetched (with the params from missing).
+
+        Audits that have been deleted on the server in the meantime are
+        removed. This returns how many audits are new."""
+        columns = audits.columns
+        with self._db:
+            before = self.count(user)
+            if "from_date" in params:
+                # Only delete what the server has definitely sent again.
+                # (Its days might start at another time than ours.)
+                self._db.execute(
+                    "DELETE FROM audits WHERE user = ? AND created_at >= ?",
+                    (user, _midnight(params["from_date"]) + DAY),
+                )
+            else:
+                self._db.execute("DELETE FROM audits WHERE user = ?", (user,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO audits VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (user, id, created_at, difference,
+                        drink if drink != NO_DRINK else None,
+                        offset if offset != ZULU else None)
+                    for id, created_at, offset, difference, drink in zip(
+                        columns.ids, columns.created_at, columns.offsets,
+                        columns.differences, columns.drinks,
+                    )
+                ),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                (user, synced_at),
+            )
+            return max(self.count(user) - before, 0)
+    
+    def sync(
+        self, conn: Connection, user: int, full: bool = False,
+    ) -> Tuple[int, int]:
+        """Fetch the new audits of a user; returns how many are new and
+        how many there are in total."""
+        params = self.missing(user, full)
+        synced_at = int(now() * 1000)
+        log.debug("Syncing the audits of user %d (%s).", user, params)
+        new = self.store(
+            user, conn.audits(user=user, **params), params, synced_at,
+        )
+        return new, self.count(user)
+    
+    async def sync_async(self, conn: AsyncConnection, user: int) -> int:
+        """Fetch the new audits of a user; returns how many are new."""
+        params = self.missing(user)
+        synced_at = int(now() * 1000)
+        return self.store(
+            user, await conn.audits(user=user, **params), params, synced_at,
+        )
+    
+    def covers(self, user: int, to_date: Optional[date]) -> bool:
+        """Whether everything until to_date has already been synced."""
+        synced_at = self.synced_at(user)
+        if synced_at is None or to_date is None:
+            return False
+        return to_date + OVERLAP < _local_date(synced_at)
+    
+    def count(self, user: int) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM audits WHERE user = ?", (user,),
+        ).fetchone()[0]
+    
+    def audits(
+        self, user: int, from_date: Optional[date] = None,
+        to_date: Optional[date] = None,
+    ) -> AuditInfo:
+        """Get the mirrored audits of a user (newest first, like the server).
+
+        Both dates are inclusive."""
+        query = (
+            "SELECT id, created_at, difference, drink, utc_offset FROM audits"
+            " WHERE user = ?"
+        )
+        params = [user]
+        if from_date:
+            query += " AND created_at >= ?"
+            params.append(_midnight(from_date))
+        if to_date:
+            query += " AND created_at < ?"
+            params.append(_midnight(to_date + timedelta(days=1)))
+        query += " ORDER BY created_at DESC, id DESC"
+        columns = AuditColumns()
+        ids = columns.ids.append
+        created_at = columns.created_at.append
+        offsets = columns.offsets.append
+        differences = columns.differences.append
+        drinks = columns.drinks.append
+        for row in self._db.execute(query, params):
+            ids(row[0])
+            created_at(row[1])
+            offsets(row[4] if row[4] is not None else ZULU)
+            differences(row[2])
+            drinks(row[3] if row[3] is not None else NO_DRINK)
+        return AuditInfo(
+            columns.total() / 100, columns.payments_total() / 100,
+            columns.deposits_total() / 100, columns=columns,
+        )
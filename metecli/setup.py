@@ -2,7 +2,7 @@ from urllib.parse import urlparse
 from typing import Tuple
 from .connection.connection import Connection
 from .config import Config
-from .utils import yn
+from .utils import yn, connect
 from . import account
 
 import argparse
@@ -25,8 +25,8 @@ def get_url() -> Tuple[Connection]:
             if yn("The URL you entered doesn't use HTTPS. Do you want to try again?"):
                 continue
             log.warn("Using HTTP. The connection won't be secure.")
-        conn = Connection.new(None, base_url=given)
-        if not conn.try_connect():
+        conn = Connection.probe(given)
+        if not conn:
             print("Couldn't connect to the server. Please try again.")
             continue
         return conn
@@ -36,16 +36,38 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser = global_subparsers.add_parser(
         "setup", help="setup the connection and select an account",
     )
-    parser.set_defaults(func=do)
+    parser.add_argument(
+        "--reprobe", action="store_true",
+        help="only check whether the server supports a newer API version",
+    )
+    parser.set_defaults(func=do, interactive=True)
+
+
+def reprobe(config: Config) -> None:
+    # forget about the last probe, connecting will then probe again
+    config["connection"]["upgrade_probe"]["last_probed"] = None
+    conn = connect(config)
+    config["connection"]["capabilities"] = conn.probe_capabilities()
+    config.save()
+    log.info(
+        "URL '%s' (API version %s) configured.",
+        conn.base_url(), conn.api_version(),
+    )
 
 
 def do(args: argparse.Namespace, config: Config) -> None:
+    if args.reprobe:
+        reprobe(config)
+        return
     log.info("Starting setup.")
     conn = get_url()
     base_url = conn.base_url()
     config["connection"]["base_url"] = base_url
     api_version = conn.api_version()
     config["connection"]["api_version"] = api_version
+    config["connection"]["upgrade_probe"]["last_probed"] = None
+    config["connection"]["upgrade_probe"]["succeeded"] = None
+    config["connection"]["capabilities"] = conn.probe_capabilities()
     config.save()
     log.info("URL '%s' (API version %s) configured.", base_url, api_version)
     if yn("Do want to setup an account now?"):
@@ -0,0 +1,118 @@
+from .config import Config
+from . import utils
+
+from threading import Event, Thread
+from typing import List, Optional
+
+import argparse
+import shlex
+
+import logging
+log = logging.getLogger(__name__)
+
+# commands that can't be run inside the shell
+# (the kiosk reads stdin in its own thread and would fight the prompt for it)
+NOT_IN_SHELL = ("shell", "daemon", "kiosk")
+
+
+def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
+    parser = global_subparsers.add_parser(
+        "shell", help="run several commands without reconnecting",
+    )
+    parser.add_argument(
+        "--refresh", type=float, default=30, metavar="SECONDS",
+        help="how often to refresh users and drinks in the background",
+    )
+    parser.set_defaults(func=do, interactive=True)
+
+
+def do(args: argparse.Namespace, config: Config) -> None:
+    Shell(args, config).loop()
+
+
+class Shell():
+    def __init__(self, args: argparse.Namespace, config: Config) -> None:
+        self._args = args
+        self._conf = config
+        from .cmdline import build_parser
+        self._parser = build_parser()
+        # the global options given when starting the shell still apply
+        self._parser.set_defaults(
+            log_level=args.log_level, config_path=args.config_path,
+            config_name=args.config_name, no_cache=args.no_cache,
+        )
+        self._stop = Event()
+        self._refresher = Thread(target=self._refresh, daemon=True)
+    
+    def loop(self) -> None:
+        try:
+            # for history and line editing (if available)
+            import readline  # noqa: F401
+        except ImportError:
+            pass
+        print("Enter a command (e.g. 'account show'), 'help' or 'exit'.")
+        self._refresher.start()
+        try:
+            while True:
+                try:
+                    line = input("mete> ")
+                except KeyboardInterrupt:
+                    print()
+                    continue
+                except EOFError:
+                    print()
+                    break
+                if line.strip() in ("exit", "quit"):
+                    break
+                self.run_line(line)
+        finally:
+            self._stop.set()
+    
+    def _refresh(self) -> None:
+        while not self._stop.wait(self._args.refresh):
+            log.debug("Refreshing users and drinks.")
+            utils.refresh_responses()
+    
+    def _parse(self, argv: List[str]) -> Optional[argparse.Namespace]:
+        if argv[0] == "help":
+            argv = ["--help"]
+        if argv[0] in NOT_IN_SHELL:
+            print("'{}' can't be run inside the shell.".format(argv[0]))
+            return None
+        try:
+            args = self._parser.parse_args(argv)
+        except SystemExit:
+            # --help or invalid arguments
+            return None
+        if (
+            args.config_path != self._args.config_path
+            or args.config_name != self._args.config_name
+        ):
+            print("The config can't be changed inside the shell.")
+            return None
+        return args
+    
+    def run_line(self, line: str) -> None:
+        try:
+            argv = shlex.split(line)
+        except ValueError as exc:
+            print("Invalid input: {}".format(exc))
+            return
+        if not argv:
+            return
+        args = self._parse(argv)
+        if not args:
+            return
+        from .cmdline import run
+        try:
+            run(args, self._conf)
+        except SystemExit:
+            pass
+        except KeyboardInterrupt:
+            print()
+        except Exception as exc:
+            log.error("%s", exc)
+            log.debug("Details:", exc_info=True)
+        finally:
+            # users and drinks are kept (and refreshed in the background)
+            utils.forget_responses(keep_collections=True)
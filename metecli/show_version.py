@@ -1,5 +1,6 @@
 from . import _version
-from .config import Config
+
+from typing import Optional
 
 import argparse
 import sys
@@ -11,10 +12,11 @@ def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
     parser = global_subparsers.add_parser(
         "version", help="display the version of metecli",
     )
-    parser.set_defaults(func=do)
+    # (loading the config would take longer than the command itself)
+    parser.set_defaults(func=do, needs_config=False)
 
 
-def do(args: argparse.Namespace, config: Config) -> None:
+def do(args: argparse.Namespace, config: Optional['Config']) -> None:
     print("This is metecli v{} running on Python {}.".format(
         _version, "".join(sys.version.splitlines()),
     ))
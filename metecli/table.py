@@ -0,0 +1,207 @@
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, TextIO
+
+import os
+import shlex
+import subprocess
+import sys
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_PAGER = "less -FRX"
+
+
+def format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        formatted = "{:f}".format(value).rstrip("0").rstrip(".")
+        return formatted if formatted != "-0" else "0"
+    return str(value)
+
+
+def align_decimal(value: str, decimals: int) -> str:
+    """Pad a number so that its decimal point is at the same position."""
+    if not decimals or not value:
+        return value
+    if "." in value:
+        return value + " " * (decimals - (len(value) - value.index(".") - 1))
+    return value + " " * (decimals + 1)
+
+
+def decimals(value: Any) -> int:
+    """How many digits after the decimal point a number has."""
+    formatted = format_value(value)
+    if "." not in formatted:
+        return 0
+    return len(formatted) - formatted.index(".") - 1
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StreamingTable():
+    """Writes a table row by row instead of collecting all rows first.
+
+    The column widths are either given or measured on the first rows;
+    values that are longer than that still get printed (unaligned).
+    Which columns are numeric (and thus right-aligned) can be given, too."""
+    def __init__(
+        self, headers: Sequence[str] = tuple(), table_format: str = "grid",
+        sample_rows: int = 100, widths: Optional[Sequence[int]] = None,
+        numeric: Optional[Sequence[bool]] = None,
+    ) -> None:
+        self._headers = [str(header) for header in headers]
+        if table_format in ("grid", "fancy_grid"):
+            self._format = "grid"
+        elif table_format in ("simple", "plain", "pipe", "github"):
+            self._format = table_format
+        else:
+            log.debug(
+                "Table format '%s' can't be streamed, using 'simple'.",
+                table_format,
+            )
+            self._format = "simple"
+        self._sample_rows = sample_rows
+        self._widths = list(widths) if widths else None
+        self._given_numeric = list(numeric) if numeric else None
+    
+    def write(self, rows: Iterable[Sequence[Any]], out: TextIO) -> None:
+        rows = iter(rows)
+        sample = list(islice(rows, self._sample_rows))
+        if not sample and not self._headers:
+            return
+        columns = max(
+            [len(self._headers)] + [len(row) for row in sample]
+        )
+        self._columns = columns
+        self._numeric = numeric = self._given_numeric or [
+            all(
+                is_number(row[i]) for row in sample
+                if i < len(row) and row[i] is not None
+            ) and any(i < len(row) and row[i] is not None for row in sample)
+            for i in range(columns)
+        ]
+        # numbers are aligned at the decimal point (like tabulate does)
+        self._decimals = [
+            max([
+                decimals(row[i]) for row in sample
+                if i < len(row) and is_number(row[i])
+            ] + [0]) if numeric[i] else 0
+            for i in range(columns)
+        ]
+        widths = self._widths
+        if not widths:
+            widths = [
+                max(
+                    # (like tabulate, there's some room around the headers)
+                    [len(self._headers[i]) + 2 if i < len(self._headers) else 0]
+                    + [
+                        len(self._format_cell(row, i)) for row in sample
+                        if i < len(row)
+                    ]
+                )
+                for i in range(columns)
+            ]
+        self._column_widths = widths
+        for line in self._start():
+            out.write(line + "\n")
+        first = True
+        for row in sample:
+            self._write_row(row, first, out)
+            first = False
+        for row in rows:
+            self._write_row(row, first, out)
+            first = False
+        for line in self._end():
+            out.write(line + "\n")
+    
+    def _format_cell(self, values: Sequence[Any], i: int) -> str:
+        if i >= len(values):
+            return ""
+        return align_decimal(format_value(values[i]), self._decimals[i])
+    
+    def _cells(self, values: Sequence[Any], header: bool = False) -> List[str]:
+        cells = list()
+        for i in range(self._columns):
+            if header:
+                value = values[i] if i < len(values) else ""
+            else:
+                value = self._format_cell(values, i)
+            if self._numeric[i]:
+                cells.append(value.rjust(self._column_widths[i]))
+            else:
+                cells.append(value.ljust(self._column_widths[i]))
+        return cells
+    
+    def _line(self, cells: List[str]) -> str:
+        if self._format in ("grid", "pipe", "github"):
+            return "| " + " | ".join(cells) + " |"
+        return "  ".join(cells).rstrip()
+    
+    def _rule(self, char: str) -> str:
+        if self._format == "grid":
+            return "+" + "+".join(
+                char * (width + 2) for width in self._column_widths
+            ) + "+"
+        elif self._format == "pipe":
+            return "|" + "|".join(
+                "-" * (width + 1) + ":" if numeric else ":" + "-" * (width + 1)
+                for width, numeric in zip(self._column_widths, self._numeric)
+            ) + "|"
+        elif self._format == "github":
+            return "|" + "|".join(
+                "-" * (width + 2) for width in self._column_widths
+            ) + "|"
+        return "  ".join("-" * width for width in self._column_widths)
+    
+    def _start(self) -> Iterator[str]:
+        if self._format == "grid":
+            yield self._rule("-")
+        if self._headers:
+            yield self._line(self._cells(self._headers, header=True))
+            if self._format == "grid":
+                yield self._rule("=")
+            elif self._format != "plain":
+                yield self._rule("-")
+    
+    def _write_row(self, row: Sequence[Any], first: bool, out: TextIO) -> None:
+        if self._format == "grid" and not first:
+            out.write(self._rule("-") + "\n")
+        out.write(self._line(self._cells(row)) + "\n")
+    
+    def _end(self) -> Iterator[str]:
+        if self._format == "grid":
+            yield self._rule("-")
+
+
+@contextmanager
+def pager(command: Optional[str] = None) -> Iterator[TextIO]:
+    """Write to a pager if stdout is a terminal (or else to stdout)."""
+    if not sys.stdout.isatty():
+        yield sys.stdout
+        return
+    command = command or os.environ.get("PAGER") or DEFAULT_PAGER
+    try:
+        process = subprocess.Popen(
+            shlex.split(command), stdin=subprocess.PIPE,
+            universal_newlines=True,
+        )
+    except OSError as exc:
+        log.debug("Couldn't start the pager '%s': %s", command, exc)
+        yield sys.stdout
+        return
+    try:
+        yield process.stdin
+    except BrokenPipeError:
+        # the pager has been closed
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
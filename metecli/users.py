@@ -0,0 +1,38 @@
+from .utils import true_false_to_yes_no, print_table, connect
+from .config import Config
+from .connection.models import User
+from . import export
+
+import argparse
+import logging
+log = logging.getLogger(__name__)
+
+
+def setup_cmdline(global_subparsers: argparse._SubParsersAction) -> None:
+    parser = global_subparsers.add_parser("users", help="show all users")
+    subparsers = parser.add_subparsers(help="action")
+    parser_list = subparsers.add_parser("list", help="lists all users")
+    export.add_arguments(parser_list)
+    parser_list.set_defaults(func=list_users)
+    parser.set_defaults(func=list_users)
+
+
+def list_users(args: argparse.Namespace, config: Config) -> None:
+    conn = connect(config)
+    users = sorted(conn.users(), key=lambda user: user.id)
+    table = [(
+        user.id,
+        user.name,
+        user.email,
+        user.balance,
+        true_false_to_yes_no(user.active),
+    ) for user in users]
+    headers = ("ID", "name", "email", "balance", "active?")
+    if export.is_export(args):
+        export.export(
+            config, args.format, args.output, users, User.__slots__,
+            table, headers,
+        )
+        return
+    print("All users:")
+    print_table(config, table, headers=headers)
@@ -1,16 +1,13 @@
 # from .config import Config (moved to bottom)
 from .connection.models import Audit, Barcode, Drink, User
+from .connection.cache import ResponseCache
 from .connection.connection import Connection
 from .connection.config import Config as ConnectionConfig
+from .index import EntityIndex
 
+# tabulate and interrogatio are only imported when they're needed,
+# because they're slow to import.
 from functools import partial
-from interrogatio import interrogatio
-from interrogatio.core.exceptions import ValidationError
-from interrogatio.validators import (
-    EmailValidator, IntegerValidator, NumberValidator, RequiredValidator,
-)
-from interrogatio.validators.base import Validator
-from tabulate import tabulate
 from typing import (
     Any, Tuple, Dict, List, Iterable, NamedTuple, Optional, Type, TypeVar, Union
 )
@@ -23,34 +20,78 @@ Thing = TypeVar("Thing", Audit, Barcode, Drink, User)
 EMail = type("EMail", (object,), {})
 
 
+# open connections, so that they can be reused
+_connections: Dict[Tuple[Any, ...], Tuple['Config', Connection]] = dict()
+
+
 def connect(config: 'Config') -> Connection:
+    key = (
+        id(config), config["connection"]["base_url"],
+        config["connection"]["api_version"], config.use_cache,
+    )
+    if key in _connections:
+        return _connections[key][1]
     connection_config = ConnectionConfig(config["connection"], config.save)
-    return Connection.new(connection_config)
+    cache = None
+    if config.use_cache and config["cache"]["enabled"]:
+        cache = ResponseCache(config.cache_path(), config["cache"]["max_age"])
+    conn = Connection.new(connection_config, cache=cache)
+    # keep a reference to the config, so that its id doesn't get reused
+    _connections[key] = (config, conn)
+    return conn
+
+
+def forget_responses(keep_collections: bool = False) -> None:
+    """Forget the responses of the last command on all open connections."""
+    for _, conn in _connections.values():
+        conn.forget(keep_collections)
+
+
+def refresh_responses() -> None:
+    """Fetch the collections on all open connections again."""
+    for _, conn in list(_connections.values()):
+        conn.refresh()
 
 
 def print_table(
     config: 'Config', data: Iterable[Tuple[Any, ...]],
     headers: Tuple[str, ...] = tuple(),
 ) -> None:
+    display = config["display"]
+    if display["stream_tables"] == "always" or (
+        display["stream_tables"] == "auto"
+        and not isinstance(data, (list, tuple))
+    ):
+        # (probably) lots of rows: print them as they come
+        from .table import StreamingTable, pager
+        from sys import stdout
+        table = StreamingTable(
+            headers, display["table_format"], display["sample_rows"],
+        )
+        if display["pager"]:
+            command = display["pager"] if isinstance(display["pager"], str) else None
+            with pager(command) as out:
+                table.write(data, out)
+        else:
+            table.write(data, stdout)
+        return
+    from tabulate import tabulate
     print(tabulate(
         data,
         headers=headers,
-        tablefmt=config["display"]["table_format"],
+        tablefmt=display["table_format"],
     ))
 
 
-def fuzzy_search(things: List[Thing], search_for: str) -> Optional[Thing]:
+def fuzzy_search(things: EntityIndex[Thing], search_for: str) -> Optional[Thing]:
     possible_things = list()
     selected_thing = None
     if search_for.isdecimal():
-        selected_thing = find_by_id(things, int(search_for))
+        selected_thing = things.find_by_id(int(search_for))
     else:
-        for thing in things:
-            if search_for == thing.name:
-                selected_thing = thing
-                break
-            elif search_for.casefold() in thing.name.casefold():
-                possible_things.append(thing)
+        selected_thing = things.find_by_name(search_for)
+        if not selected_thing:
+            possible_things = things.search(search_for)
     if not selected_thing and len(possible_things) == 1:
         log.info(
             "No exact match, but %s is the only possibility.",
@@ -72,20 +113,22 @@ def fuzzy_search(things: List[Thing], search_for: str) -> Optional[Thing]:
         return None
 
 
-def find_by_id(things: List[Thing], id: Union[int, str]) -> Optional[Thing]:
-    log.debug("Searching for %s in %s...", id, things)
-    for thing in things:
-        if thing.id == id:
-            log.debug("Found %s.", thing)
-            return thing
-    log.debug("No match.")
-    return None
+def find_by_id(things: EntityIndex[Thing], id: Union[int, str]) -> Optional[Thing]:
+    # (logging all things would be expensive)
+    log.debug("Searching for %s in %d things...", id, len(things))
+    found = things.find_by_id(id)
+    if found:
+        log.debug("Found %s.", found)
+    else:
+        log.debug("No match.")
+    return found
 
 
 def test_terminal_utf8() -> None:
     """Produces a warning if the system isn't correctly configured to output UTF-8."""
     from sys import stdout
-    if stdout.encoding.upper() != "UTF-8":
+    # (captured output doesn't have an encoding)
+    if stdout.encoding and stdout.encoding.upper() != "UTF-8":
         log.warn("Your system doesn't seem support UTF-8. Please consider fixing this.")
 
 
@@ -109,15 +152,21 @@ def yn(prompt: str) -> bool:
         print("Please enter 'yes' or 'no'.")
 
 
-class BooleanValidator(Validator):
-    def __init__(self):
-        super(BooleanValidator, self).__init__(
-            message="this field does not match yes or no"
-        )
+def boolean_validator() -> 'Validator':
+    from interrogatio.core.exceptions import ValidationError
+    from interrogatio.validators.base import Validator
     
-    def validate(self, value, context=None):
-        if yes_no_to_true_false(value) is None:
-            raise ValidationError(self.message)
+    class BooleanValidator(Validator):
+        def __init__(self):
+            super(BooleanValidator, self).__init__(
+                message="this field does not match yes or no"
+            )
+        
+        def validate(self, value, context=None):
+            if yes_no_to_true_false(value) is None:
+                raise ValidationError(self.message)
+    
+    return BooleanValidator()
 
 
 class Question(NamedTuple):
@@ -128,6 +177,10 @@ class Question(NamedTuple):
     required: bool = False
 
     def to_interrogatio(self, data: Thing) -> Dict[str, Any]:
+        from interrogatio.validators import (
+            EmailValidator, IntegerValidator, NumberValidator,
+            RequiredValidator,
+        )
         d = {
             "name": self.attribute,
             "message": self.message,
@@ -148,7 +201,7 @@ class Question(NamedTuple):
             d["default"] = str(old_value)
         elif self.type == bool:
             d["default"] = true_false_to_yes_no(old_value)
-            d["validators"].append(BooleanValidator())
+            d["validators"].append(boolean_validator())
         elif self.type == EMail:
             d["default"] = old_value
             d["validators"].append(EmailValidator())
@@ -162,6 +215,7 @@ class Question(NamedTuple):
 
 
 def show_edit(thing: Thing, questions: List[Question]) -> None:
+    from interrogatio import interrogatio
     interrogatio_questions = [q.to_interrogatio(thing) for q in questions]
     interrogatio_answers = interrogatio(interrogatio_questions)
     for key, value in interrogatio_answers.items():